@@ -0,0 +1,264 @@
+"""Acquisition loop and the dedicated acquisition process.
+
+``acquisition_loop`` is the IRQ-driven FIFO drain used both in-process (a
+daemon thread next to Flask) and inside ``AcquisitionProcess``. The latter
+owns ``ADXL355`` and ``GPIOInterrupt`` in a separate process, so the SPI
+drain never competes for the GIL with JSON serialization or file writing.
+Samples are written into a ``RingBuffer`` living in shared memory, which
+the web process maps read-only; configuration calls go over a pipe.
+"""
+import atexit
+import functools
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import metrics
+from profiler import PROFILER
+from ring_buffer import RingBuffer
+
+IRQ_TIMEOUTS = metrics.REGISTRY.counter(
+    "adxl355_irq_timeouts_total", "Waits for the FIFO interrupt that timed out")
+DRAIN_LATENCY = metrics.REGISTRY.histogram(
+    "adxl355_irq_to_drain_seconds", "From the watermark edge to the end of the FIFO drain")
+DRAIN_SAMPLES = metrics.REGISTRY.histogram(
+    "adxl355_samples_per_drain", "Samples read per FIFO drain", buckets=(1, 4, 8, 16, 24, 32))
+DRAINS = metrics.REGISTRY.counter("adxl355_drains_total", "FIFO drains triggered by an interrupt")
+SAMPLES = metrics.REGISTRY.counter("adxl355_samples_total", "Samples read from the FIFO")
+FOLLOW_ERRORS = metrics.REGISTRY.counter(
+    "adxl355_follow_errors_total", "Exceptions raised while dispatching batches followed from the ring")
+
+# Comandos del canal de control que no son del sensor sino del proceso
+WORKER_COMMANDS = {
+    "metrics_snapshot": metrics.REGISTRY.snapshot,
+    "profiler_start": PROFILER.start,
+    "profiler_stop": PROFILER.stop,
+    "profiler_status": PROFILER.status,
+    "profiler_folded": PROFILER.folded,
+    "profiler_top": PROFILER.top,
+}
+
+
+def create_sensor(settings, buffer=None):
+    """Builds the sensor and its interrupt line from the app settings.
+
+    Args:
+        settings (dict): ``range``, ``odr``, ``fifo_samples``,
+            ``interrupt_map``, ``pin``, ``fifo_adaptativo`` (adaptive FIFO
+            watermark), ``simulacion`` (use the simulated SPI/GPIO
+            backend instead of the hardware) and the calibration:
+            ``offsets``, ``matriz_calibracion`` and ``promedio_muestras``.
+        buffer (RingBuffer): History buffer for the sensor (optional).
+
+    Returns:
+        tuple: (ADXL355, interrupt line)
+    """
+    from adxl355 import ADXL355
+
+    if settings.get('simulacion'):
+        from simulation import FakeGPIOInterrupt, FakeSpiDev
+
+        spi = FakeSpiDev(speed=settings.get('simulacion_velocidad', 1.0))
+        sensor = ADXL355(measure_range=settings['range'], buffer=buffer, spi=spi)
+        irq = FakeGPIOInterrupt(spi, pin=settings['pin'])
+    else:
+        from interrupt import GPIOInterrupt
+
+        sensor = ADXL355(measure_range=settings['range'], buffer=buffer)
+        irq = GPIOInterrupt(pin=settings['pin'])
+    sensor.set_odr(settings['odr'])
+    sensor.set_fifo_samples(settings['fifo_samples'])
+    sensor.set_interrupt_map(settings['interrupt_map'])
+    if settings.get('fifo_adaptativo'):
+        sensor.set_adaptive_watermark(True)
+    sensor.set_calibration(settings.get('offsets'), settings.get('matriz_calibracion'),
+                           settings.get('promedio_muestras', 1))
+    return sensor, irq
+
+
+def acquisition_loop(sensor, irq, on_batch=None, stop=None, timeout=1.0):
+    """Waits for FIFO interrupts and drains the sensor until ``stop`` is set.
+
+    Args:
+        sensor (ADXL355): Sensor to drain.
+        irq (GPIOInterrupt): Interrupt line of the FIFO watermark.
+        on_batch (callable): Called with every batch read.
+        stop (threading.Event): Ends the loop when set.
+        timeout (float): Seconds to wait for an edge before checking
+            ``stop`` and draining the FIFO anyway.
+    """
+    while stop is None or not stop.is_set():
+        # El timeout evita que se bloquee indefinidamente si algo va mal
+        events = irq.wait_event(timeout=timeout)
+        if events:
+            event_ns = events[-1].timestamp_ns
+            batches = sensor.drain_fifo(event_ns=event_ns)
+            # timestamp_ns de gpiod es CLOCK_MONOTONIC, igual que time.monotonic_ns
+            DRAIN_LATENCY.observe((time.monotonic_ns() - event_ns) / 1e9)
+            DRAINS.inc()
+        else:
+            # Sin flanco: si la FIFO quedó sobre la marca de agua la línea no
+            # vuelve a subir, así que se vacía igual para destrabarla
+            IRQ_TIMEOUTS.inc()
+            batches = sensor.drain_fifo()
+        for batch in batches:
+            DRAIN_SAMPLES.observe(len(batch["timestamp"]))
+            SAMPLES.inc(len(batch["timestamp"]))
+            if on_batch is not None:
+                on_batch(batch)
+
+
+def follow_buffer(buffer, on_batch, new_data=None, stop=None, poll=0.05, on_clear=None):
+    """Turns samples appended to ``buffer`` by another process into batches.
+
+    Args:
+        buffer (RingBuffer): Ring to follow (usually attached read-only).
+        on_batch (callable): Called with each batch (``timestamp``, ``xyz``,
+            ``raw`` and ``temp`` arrays, copied out of the ring).
+        new_data (threading.Event | multiprocessing.Event): Set by the
+            writer after each batch (``ADXL355.new_data``).
+        stop (threading.Event): Ends the loop when set.
+        poll (float): Maximum wait between checks, in seconds.
+        on_clear (callable): Called when the writer clears the ring, before
+            the batches that follow, so consumers can drop what they kept.
+    """
+    seq = buffer.total
+    clears = buffer.clears
+    while stop is None or not stop.is_set():
+        if new_data is not None:
+            if new_data.wait(poll):
+                new_data.clear()
+        else:
+            time.sleep(poll)
+        try:
+            if buffer.clears != clears:
+                clears = buffer.clears
+                if on_clear is not None:
+                    on_clear()
+            total = buffer.total
+            if total <= seq:
+                continue
+            data = buffer.read_range(max(seq, buffer.first), total)
+            seq = total
+            if len(data["timestamp"]):
+                on_batch({
+                    "timestamp": data["timestamp"],
+                    "xyz": np.column_stack((data["x"], data["y"], data["z"])),
+                    "raw": data["raw"],
+                    "temp": data["temp"],
+                })
+        except Exception as e:
+            # El hilo sigue: si termina, nadie más reparte los datos
+            FOLLOW_ERRORS.inc()
+            print(f"Error al repartir lotes del buffer: {type(e).__name__}: {e}")
+
+
+def _worker_main(settings, shm, capacity, conn, new_data):
+    """Entry point of the acquisition process."""
+    metrics.REGISTRY.reset()  # Lo heredado del proceso web ya se cuenta allá
+    ring = RingBuffer(capacity, shm.buf)
+    try:
+        sensor, irq = create_sensor(settings, ring)
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+        return
+    sensor.new_data = new_data
+    conn.send(("ok", None))
+
+    stop = threading.Event()
+    threading.Thread(target=acquisition_loop, args=(sensor, irq, None, stop), daemon=True).start()
+
+    # Canal de control: (nombre, args, kwargs) -> llamada o atributo del sensor
+    while True:
+        try:
+            name, args, kwargs = conn.recv()
+        except (EOFError, OSError):
+            break
+        try:
+            if name in WORKER_COMMANDS:
+                result = WORKER_COMMANDS[name](*args, **kwargs)
+            else:
+                attr = getattr(sensor, name)
+                result = attr(*args, **kwargs) if callable(attr) else attr
+            conn.send(("ok", result))
+        except Exception as e:
+            conn.send(("error", e))
+    stop.set()
+
+
+class AcquisitionProcess:
+    """
+    Proxy to an ``ADXL355`` running in a dedicated acquisition process.
+
+    ``buffer`` is the shared history mapped read-only. Any other sensor
+    method or attribute (``set_odr``, ``get_interrupt_map``,
+    ``measure_range``...) is forwarded over the control channel and
+    evaluated in the acquisition process, as are the ``WORKER_COMMANDS``
+    (``metrics_snapshot``, ``profiler_start``...).
+    """
+
+    def __init__(self, settings, capacity):
+        self.capacity = int(capacity)
+        self._shm = shared_memory.SharedMemory(create=True, size=RingBuffer.nbytes(self.capacity))
+        RingBuffer(self.capacity, self._shm.buf)  # Inicializa la cabecera
+        self.buffer = RingBuffer(self.capacity, self._shm.buf, readonly=True)
+        self.buffer_lock = metrics.instrument_buffer_lock(self.buffer)
+        self.new_data = multiprocessing.Event()
+        self._conn, child_conn = multiprocessing.Pipe()
+        self._conn_lock = threading.Lock()
+
+        # fork: el hijo hereda el segmento ya mapeado, sin volver a registrarlo
+        ctx = multiprocessing.get_context("fork")
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(settings, self._shm, self.capacity, child_conn, self.new_data),
+            name="adxl355-acquisition",
+            daemon=True,
+        )
+        self.process.start()
+        atexit.register(self.close)
+
+        status, detail = self._conn.recv()
+        if status != "ok":
+            self.close()
+            raise RuntimeError(f"Acquisition process failed to start: {detail}")
+
+    def call(self, name, *args, **kwargs):
+        """Calls a sensor method (or reads an attribute) in the acquisition process."""
+        with self._conn_lock:
+            self._conn.send((name, args, kwargs))
+            status, result = self._conn.recv()
+        if status != "ok":
+            raise result
+        return result
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return functools.partial(self.call, name)
+
+    @property
+    def measure_range(self):
+        return self.call("measure_range")
+
+    def follow(self, on_batch, stop=None, on_clear=None):
+        """Dispatches new samples to ``on_batch`` (blocking; run it in a thread)."""
+        follow_buffer(self.buffer, on_batch, self.new_data, stop, on_clear=on_clear)
+
+    def close(self):
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(1.0)
+        if self._shm is not None:
+            # Las vistas de numpy tienen que soltarse antes de cerrar el segmento
+            self.buffer = None
+            self.buffer_lock = None
+            try:
+                self._shm.close()
+            except BufferError:
+                pass
+            self._shm.unlink()
+            self._shm = None
@@ -7,10 +7,20 @@ accelerometer chip for Raspberry Pi boards
    https://wiki.analog.com/resources/eval/user-guides/eval-adicup360/hardware/adxl355
 
 """
-import spidev
-from collections import deque
+try:
+    import spidev
+except ImportError:  # Permite importar el módulo fuera de la Raspberry (benchmarks)
+    spidev = None
+
 import time
-import threading
+
+import numpy as np
+
+import metrics
+from calibration import CalibrationStage
+from ring_buffer import RingBuffer
+from timestamps import TimestampEngine, odr_from_filter
+from watermark import FIFO_MAX_ENTRIES, AdaptiveWatermark
 
 # ADXL345 constants
 
@@ -34,12 +44,15 @@ RANGE = 0x2C
 POWER_CTL = 0x2D
 FILTER = 0x28 # New constant for Filter register
 DEVID_AD = 0x00 # New constant for Device ID register
+STATUS = 0x04
 TEMP02 = 0x06
 TEMP01 = 0x07
 FIFO_DATA = 0x11
 FIFO_SAMPLES = 0x29
 FIFO_ENTRIES = 0x05
 INTERRUPT_MAP = 0x2A
+# Ráfaga STATUS..ZDATA1 (auto-incremento) que desemboca en FIFO_DATA
+BURST_HEADER = FIFO_DATA - STATUS
 
 # Data Range
 RANGE_2G = 0x01
@@ -54,12 +67,103 @@ MEASURE_MODE = 0x04 # Enable accelerometer and temperature
 #CONFIG INTERRUPTIONS
 INT_MODE = 0x02 # FIFO_FULL enable on INT1 pin
 FIFO_SAMPLES_VALUE = 32
+# STATUS bits
+STATUS_FIFO_FULL = 0x02
+STATUS_FIFO_OVR = 0x04
+# Marcadores en el byte menos significativo de cada entrada de FIFO_DATA
+FIFO_X_MARKER = 0x01
+FIFO_EMPTY_MARKER = 0x02
+# Muestras leídas de más en cada ráfaga por si llegan durante la transferencia
+BURST_MARGIN_SAMPLES = 2
 
 # ==== Configuración ====
 HISTORICO_SEGUNDOS = 60 * 2
 FRECUENCIA_MAX_HZ = 4000
 MAX_MUESTRAS = HISTORICO_SEGUNDOS * FRECUENCIA_MAX_HZ  # 1 minuto a 4 kHz
 
+# LSB/g para cada rango (20 bits)
+SCALE_FACTORS = {2: 256000, 4: 128000, 8: 64000}
+
+FIFO_OVERRUNS = metrics.REGISTRY.counter(
+    "adxl355_fifo_overruns_total", "Drains that found FIFO_OVR set (samples were lost)")
+FIFO_FULL_DRAINS = metrics.REGISTRY.counter(
+    "adxl355_fifo_full_drains_total", "Drains that found all 96 FIFO entries in use")
+FIFO_WATERMARK = metrics.REGISTRY.gauge(
+    "adxl355_fifo_watermark_entries", "Current FIFO_SAMPLES watermark, in FIFO entries")
+EXTRA_DRAINS = metrics.REGISTRY.counter(
+    "adxl355_fifo_extra_drains_total", "FIFO reads repeated without a new interrupt")
+
+
+def decode_fifo(fifo_data, scale_factor=None, offsets=None):
+    """Decodes a FIFO_DATA burst into an (N, 3) array in one vectorized pass.
+
+    Each sample is 9 bytes (X, Y, Z, 3 bytes each, left justified 20-bit
+    two's complement). Trailing bytes of an incomplete sample are ignored.
+
+    Args:
+        fifo_data (bytes | list): Raw bytes as returned by ``spi_read``.
+        scale_factor (float): LSB/g. If None, raw counts are returned.
+        offsets (sequence): Optional (x, y, z) offsets in g, subtracted
+            after scaling. Ignored when ``scale_factor`` is None.
+
+    Returns:
+        numpy.ndarray: (N, 3) int32 raw counts, or float32 values in g.
+    """
+    if not isinstance(fifo_data, (bytes, bytearray, memoryview)):
+        fifo_data = bytes(fifo_data)  # Más rápido que np.asarray sobre una lista
+    data = np.frombuffer(fifo_data, dtype=np.uint8)
+    n = data.size // 9
+    b = data[:n * 9].reshape(n, 3, 3).astype(np.int32)
+    raw = (b[..., 0] << 12) | (b[..., 1] << 4) | (b[..., 2] >> 4)
+    raw = (raw ^ (1 << 19)) - (1 << 19)  # Extensión de signo de 20 bits
+    if scale_factor is None:
+        return raw
+    accel_g = raw.astype(np.float32)
+    accel_g *= np.float32(1.0 / scale_factor)
+    if offsets is not None:
+        accel_g -= np.asarray(offsets, dtype=np.float32)
+    return accel_g
+
+def fifo_complete_samples(fifo_data):
+    """Keeps the complete x/y/z samples of a FIFO_DATA read, using the entry markers.
+
+    Reading past the end of the FIFO returns entries flagged as empty, and
+    after an overflow the first entry may not be an X axis. Only runs of
+    X, Y, Z entries with the X marker on the first and no empty flag are
+    kept, so a burst longer than the FIFO contents is safe.
+
+    Args:
+        fifo_data (bytes | list): Raw FIFO_DATA bytes (3 per entry).
+
+    Returns:
+        numpy.ndarray: uint8 array with the bytes of the complete samples,
+        ready for ``decode_fifo``.
+    """
+    if not isinstance(fifo_data, (bytes, bytearray, memoryview)):
+        fifo_data = bytes(fifo_data)
+    data = np.frombuffer(fifo_data, dtype=np.uint8)
+    entries = data[:data.size // 3 * 3].reshape(-1, 3)
+    flags = entries[:, 2]
+    full = (flags & FIFO_EMPTY_MARKER) == 0
+    is_x = ((flags & FIFO_X_MARKER) != 0) & full
+    n = len(entries) // 3
+    if n and is_x[:3 * n:3].all() and full[:3 * n].all() and not is_x[1:3 * n:3].any() and not is_x[2:3 * n:3].any():
+        return data[:9 * n]  # Caso normal: alineado y sin entradas vacías
+    starts = np.flatnonzero(is_x[:max(len(entries) - 2, 0)])
+    ok = full[starts + 1] & full[starts + 2] & ~is_x[starts + 1] & ~is_x[starts + 2]
+    starts = starts[ok]
+    return entries[starts[:, None] + np.arange(3)].reshape(-1)
+
+
+def temperature_from_raw(temp_raw):
+    """Converts the 12-bit TEMP2/TEMP1 value to degrees Celsius."""
+    # if temp_raw & (1 << 11):
+    #     temp_raw -= (1 << 12)  # sign extend, no aplica aquí
+    offset = 1885
+    slope = 9.05
+    return 25 - (temp_raw - offset) / slope
+
+
 class ADXL355:
     """
     Class to interact with ADXL355 device
@@ -69,29 +173,67 @@ class ADXL355:
     """
     measure_range=-1
 
-    def __init__(self, measure_range=RANGE_2G):
-        # SPI init
-        self.spi = spidev.SpiDev()
+    def __init__(self, measure_range=RANGE_2G, buffer=None, spi=None):
+        # SPI init (spi permite inyectar otro backend, p.ej. simulation.FakeSpiDev)
+        self.spi = spi if spi is not None else spidev.SpiDev()
         self.spi.open(SPI_BUS, SPI_DEVICE)
         self.spi.max_speed_hz = SPI_MAX_CLOCK_HZ
         self.spi.mode = SPI_MODE
+        self._tx_buffers = {}  # Listas de transmisión reutilizadas, por (registro, largo)
 
         # Check device ID
         device_id = self.read_data(DEVID_AD)
         if device_id != 0xAD: # AD = 173 en decimal
             raise RuntimeError(f"ADXL355 sensor not found or not responding. Expected DEVID_AD 0xAD, got 0x{device_id:02X}")
 
+        # Tiempos por muestra a partir del ODR y las interrupciones
+        self.timestamps = TimestampEngine(odr_from_filter(0x00))
+        self.fifo_samples = FIFO_SAMPLES_VALUE
+
         # Device init
         self.set_measure_range(measure_range)
         self.set_odr(0x00) # Set ODR to 4000 Hz
         self.set_fifo_samples(FIFO_SAMPLES_VALUE)
-        self.set_interrupt()
+        self.set_interrupt_map(INT_MODE)
         self.enable_measure_mode()
         self.get_measure_range()
 
-        # Deque para histórico
-        self.buffer = deque(maxlen=MAX_MUESTRAS)
-        self.buffer_lock = threading.Lock()
+        # Buffer circular columnar para histórico (puede venir en memoria compartida)
+        self.buffer = buffer if buffer is not None else RingBuffer(MAX_MUESTRAS)
+        self.buffer_lock = metrics.instrument_buffer_lock(self.buffer)
+        self.fifo_overruns = 0
+        self.watermark_control = None  # AdaptiveWatermark si la marca de agua es adaptativa
+        self.last_drain = None
+        self.burst_samples = None  # Muestras a pedir en la próxima ráfaga (según la última lectura)
+        self.new_data = None  # Event opcional, se activa con cada lote agregado
+        self.replay = None
+        self.calibration = CalibrationStage()  # Offsets, matriz y promedio, antes del buffer
+
+    def clear_buffer(self):
+        """Discards the buffered history (e.g. after a configuration change)."""
+        self.buffer.clear()
+        self.calibration.reset()
+
+    def set_calibration(self, offsets=None, matrix=None, average=1):
+        """Sets the calibration applied to every batch before it is buffered.
+
+        Samples already in the history keep the calibration they had.
+
+        Args:
+            offsets (dict): Offsets per axis in g.
+            matrix: 3x3 calibration matrix (None for identity).
+            average (int): Moving-average length; the history keeps one
+                sample per group (1 disables it).
+
+        Returns:
+            dict: The calibration in use.
+        """
+        self.calibration.configure(offsets, matrix, average)
+        return self.calibration.status()
+
+    def calibration_status(self):
+        """Returns the calibration applied before buffering (see ``set_calibration``)."""
+        return self.calibration.status()
 
     def set_odr(self, odr_value):
         """Sets the Output Data Rate (ODR) on ADXL355 device.
@@ -103,6 +245,7 @@ class ADXL355:
             None
         """
         self.write_data(FILTER, odr_value)
+        self.timestamps.set_odr(odr_from_filter(odr_value))
 
     def write_data(self, address, value):
         """Writes data on ADXL355 device address.
@@ -117,9 +260,15 @@ class ADXL355:
         device_address = address << 1 | WRITE_BIT
         self.spi.xfer2([device_address, value])
 
+    def _tx_buffer(self, reg, length):
+        """Preallocated read command for ``reg`` followed by ``length`` dummy bytes."""
+        tx = self._tx_buffers.get((reg, length))
+        if tx is None:
+            tx = self._tx_buffers[(reg, length)] = [reg << 1 | READ_BIT] + [0x00] * length # MSB=1 para lectura
+        return tx
+
     def spi_read(self, reg, length=1):
-        reg_addr = reg << 1 | READ_BIT # MSB=1 para lectura
-        resp = self.spi.xfer2([reg_addr] + [0x00] * length)
+        resp = self.spi.xfer2(self._tx_buffer(reg, length))
         return resp[1:]
     
     def read_data(self, address):
@@ -164,13 +313,43 @@ class ADXL355:
     def set_fifo_samples(self, num_samples):
         """Sets the number of samples for the FIFO buffer.
         The FIFO_FULL interrupt will be triggered when this number of samples is reached.
+        The register counts FIFO entries, one per axis (3 per x/y/z sample).
 
         Args:
-            num_samples (int): Number of samples (1 to 32).
+            num_samples (int): Number of samples (1 to 96).
         """
-        if not 1 <= num_samples <= 32:
-            raise ValueError("Number of FIFO samples must be between 1 and 32.")
+        if not 1 <= num_samples <= FIFO_MAX_ENTRIES:
+            raise ValueError(f"Number of FIFO samples must be between 1 and {FIFO_MAX_ENTRIES}.")
         self.write_data(FIFO_SAMPLES, num_samples)
+        self.fifo_samples = num_samples
+        FIFO_WATERMARK.set(num_samples)
+
+    def set_adaptive_watermark(self, enabled, **options):
+        """Turns the adaptive FIFO watermark on or off.
+
+        While enabled, ``drain_fifo`` retunes ``FIFO_SAMPLES`` from the
+        measured interrupt latency (see ``watermark.AdaptiveWatermark``).
+
+        Args:
+            enabled (bool): Adaptive mode on/off. When turned off the last
+                watermark chosen stays until ``set_fifo_samples`` is called.
+            **options: Passed to ``AdaptiveWatermark`` (``max_delay``...).
+
+        Returns:
+            dict | None: Controller status, None when disabled.
+        """
+        if enabled:
+            self.watermark_control = AdaptiveWatermark(self.fifo_samples, **options)
+            return self.watermark_control.status()
+        self.watermark_control = None
+        return None
+
+    def watermark_status(self):
+        """Current watermark and, in adaptive mode, the controller state."""
+        status = {"fifo_samples": self.fifo_samples, "adaptive": self.watermark_control is not None}
+        if self.watermark_control is not None:
+            status.update(self.watermark_control.status())
+        return status
 
     def set_interrupt_map(self, value):
         """Sets interrupt on ADXL355 device.
@@ -241,17 +420,17 @@ class ADXL355:
         # Return values
         return {'x': x_data, 'y': y_data, 'z': z_data}
     
+    def get_scale_factor(self):
+        """Returns the LSB/g scale factor for the current measure range."""
+        try:
+            return SCALE_FACTORS[self.measure_range]
+        except KeyError:
+            raise ValueError("Invalid measure range value")
+
     def get_axes_norm(self, axes):
         
         # raw=self.get_axes()
-        if self.measure_range == 2:
-            scale_factor = 256000  # LSB/g for ±2g range (2^19 for 20-bit)
-        elif self.measure_range == 4:
-            scale_factor = 128000   # LSB/g for ±4g range (2^18 for 20-bit)
-        elif self.measure_range == 8:
-            scale_factor = 64000  # LSB/g for ±8g range (2^17 for 20-bit)
-        else:
-            raise ValueError("Invalid measure range value")
+        scale_factor = self.get_scale_factor()
         accel_g = {axis: value / scale_factor for axis, value in axes.items()}
         return accel_g
 
@@ -259,12 +438,7 @@ class ADXL355:
         temp2=self.read_data(TEMP02)
         temp1=self.read_data(TEMP01)
         temp_raw = (temp2 << 8) | temp1
-        # if temp_raw & (1 << 11):
-        #     temp_raw -= (1 << 12)  # sign extend, no aplica aquí
-        offset = 1885
-        slope = 9.05
-        temp_c = 25 - (temp_raw - offset) / slope
-        return temp_c
+        return temperature_from_raw(temp_raw)
     
     def fifo_entries(self):
         return self.spi_read(FIFO_ENTRIES)[0] & 0x7F # Bits 0 to 6
@@ -291,25 +465,191 @@ class ADXL355:
             readings.append({"x": x, "y": y, "z": z})
         return readings
 
-    def read_fifo_with_meta(self):
-        """Lee FIFO, agrega timestamp y temperatura, guarda en buffer"""
-        readings = self.read_fifo()
-        if readings is None:
-            return []
+    def read_fifo_array(self, scaled=True, offsets=None):
+        """Reads all complete samples in the FIFO as a single array.
 
-        temp = self.get_temperature()
-        timestamp = time.time()  # unix epoch (segundos flotante)
+        Batch counterpart of ``read_fifo``: the whole SPI response is decoded
+        with ``decode_fifo`` instead of one dict per sample.
 
-        for r in readings:
-            r["temp"] = temp
-            r["timestamp"] = timestamp
-            norm_xyz=self.get_axes_norm(r)
-            r["x"] = norm_xyz["x"]
-            r["y"] = norm_xyz["y"]
-            r["z"] = norm_xyz["z"]
-            self.buffer.append(r)
+        Args:
+            scaled (bool): Return values in g instead of raw counts.
+            offsets (sequence): Optional (x, y, z) offsets in g.
 
-        return self.buffer
+        Returns:
+            numpy.ndarray: (N, 3) array, empty if the FIFO has no samples.
+        """
+        fifo_entry = self.fifo_entries()//3
+        if fifo_entry == 0:
+            return np.empty((0, 3), dtype=np.float32 if scaled else np.int32)
+
+        fifo_data = self.spi_read(FIFO_DATA, fifo_entry * 9)
+        scale_factor = self.get_scale_factor() if scaled else None
+        return decode_fifo(fifo_data, scale_factor, offsets)
+
+    def read_fifo_with_meta(self, event_ns=None, continuation=False):
+        """Lee FIFO, agrega timestamp y temperatura, guarda en buffer
+
+        Args:
+            event_ns (int): Timestamp (CLOCK_MONOTONIC, ns) of the FIFO
+                watermark edge, as reported by gpiod. Without it the drain
+                time is used as reference for the newest sample.
+            continuation (bool): The samples directly follow the previous
+                read (no interrupt in between); timestamps just continue.
+
+        Returns:
+            dict: The batch appended (``timestamp``, ``xyz`` in g, ``raw``
+            counts and ``temp``), or None if the FIFO was empty.
+        """
+        status, entries, temp, fifo_data = self.read_burst()
+        self.last_drain = {"time": time.monotonic(), "entries": entries, "overrun": bool(status & STATUS_FIFO_OVR)}
+        if status & STATUS_FIFO_OVR:
+            # Se perdieron muestras: la FIFO se llenó antes de vaciarla
+            self.fifo_overruns += 1
+            FIFO_OVERRUNS.inc()
+        if entries >= FIFO_MAX_ENTRIES:
+            # Sin margen: la próxima muestra ya no entra y se pierde
+            FIFO_FULL_DRAINS.inc()
+        # La próxima ráfaga se dimensiona con lo que había en esta
+        self.burst_samples = min(max(-(-self.fifo_samples // 3), entries // 3) + BURST_MARGIN_SAMPLES,
+                                 FIFO_MAX_ENTRIES // 3)
+        missing = entries // 3 - len(fifo_data) // 9
+        if missing > 0:
+            # Había más de lo previsto para la ráfaga: se lee el resto aparte
+            fifo_data = np.concatenate((fifo_data, fifo_complete_samples(self.spi_read(FIFO_DATA, missing * 9))))
+        raw = decode_fifo(fifo_data)
+        if len(raw) == 0:
+            return None
+        if self.replay is not None and self.replay.running:
+            # Se vacía la FIFO para que sigan las interrupciones, pero manda la reproducción
+            return None
+        accel_g = raw.astype(np.float32)
+        accel_g *= np.float32(1.0 / self.get_scale_factor())
+
+        if continuation:
+            timestamp = self.timestamps.extend(len(accel_g))
+        elif event_ns is not None:
+            # El flanco llega cuando la FIFO alcanza la marca de agua, que
+            # FIFO_SAMPLES cuenta en entradas (3 por muestra)
+            timestamp = self.timestamps.stamp(len(accel_g), event_ns / 1e9, -(-self.fifo_samples // 3) - 1)
+        else:
+            timestamp = self.timestamps.stamp(len(accel_g))  # unix epoch (segundos flotante)
+
+        return self.ingest({"timestamp": timestamp, "xyz": accel_g, "raw": raw, "temp": temp})
+
+    def read_burst(self, samples=None):
+        """Reads STATUS, FIFO_ENTRIES, temperature and FIFO data in one SPI transfer.
+
+        The read starts at STATUS and auto-increments through TEMP and the
+        XYZ data registers into FIFO_DATA, which does not auto-increment,
+        so the rest of the transfer drains the FIFO. ``samples`` is a guess;
+        entries past the end of the FIFO come back flagged as empty and are
+        dropped by ``fifo_complete_samples``.
+
+        Args:
+            samples (int): FIFO samples to read. Defaults to what the
+                previous drain found (at least the watermark) plus
+                ``BURST_MARGIN_SAMPLES``.
+
+        Returns:
+            tuple: (STATUS, FIFO_ENTRIES, temperature in °C, uint8 array
+            with the complete samples read).
+        """
+        if samples is None:
+            samples = self.burst_samples or min(-(-self.fifo_samples // 3) + BURST_MARGIN_SAMPLES, FIFO_MAX_ENTRIES // 3)
+        resp = self.spi.xfer2(self._tx_buffer(STATUS, BURST_HEADER + 9 * samples))
+        status = resp[1]
+        entries = resp[2] & 0x7F # Bits 0 to 6
+        temp = temperature_from_raw((resp[3] << 8) | resp[4])
+        return status, entries, temp, fifo_complete_samples(resp[1 + BURST_HEADER:])
+
+    def drain_fifo(self, event_ns=None, max_rounds=1000):
+        """Drains the FIFO after an interrupt, repeating while it may still be over the watermark.
+
+        The interrupt is edge triggered: if enough samples arrive during the
+        read to reach the watermark again, the line never goes low and no
+        new edge would come. In that case the FIFO is read again right away.
+        In adaptive mode the watermark is retuned after the first read.
+
+        Args:
+            event_ns (int): Monotonic timestamp (ns) of the interrupt edge.
+            max_rounds (int): Safety cap on reads per interrupt. Leaving
+                while the FIFO may be over the watermark stalls the
+                interrupt, so it is only a guard against a runaway loop.
+
+        Returns:
+            list: Batches read (see ``read_fifo_with_meta``), possibly empty.
+        """
+        batches = []
+        batch = self.read_fifo_with_meta(event_ns)
+        odr_hz = 1.0 / self.timestamps.nominal_period
+        if self.watermark_control is not None and event_ns is not None and self.last_drain is not None:
+            latency = self.last_drain["time"] - event_ns / 1e9
+            new_watermark = self.watermark_control.update(latency, odr_hz, self.last_drain["overrun"])
+            if new_watermark is not None:
+                self.set_fifo_samples(new_watermark)
+        while batch is not None:
+            batches.append(batch)
+            # Entradas que pudieron llegar desde que se leyó FIFO_ENTRIES
+            arrived = 3 * (time.monotonic() - self.last_drain["time"]) * odr_hz
+            if len(batches) >= max_rounds or arrived < self.fifo_samples:
+                break
+            EXTRA_DRAINS.inc()
+            batch = self.read_fifo_with_meta(continuation=True)
+        return batches
+
+    def ingest(self, batch):
+        """Appends a batch to the history and notifies ``new_data``.
+
+        Entry point shared by the FIFO drain and ``replay.ReplayEngine``.
+        The batch goes through the calibration stage first, unless it is
+        flagged ``calibrated`` (replayed values that already had it).
+
+        Args:
+            batch (dict): ``timestamp``, ``xyz`` (g), ``raw`` and ``temp``.
+
+        Returns:
+            dict: The calibrated batch (empty if averaging held it back).
+        """
+        if not batch.get("calibrated"):
+            batch = self.calibration.process(batch)
+        if len(batch["timestamp"]):
+            self.buffer.append_batch(batch["timestamp"], batch["xyz"], batch["temp"], batch.get("raw"))
+            if self.new_data is not None:
+                self.new_data.set()
+        return batch
+
+    def start_replay(self, path, speed=1.0):
+        """Replaces live data with a recording replayed through ``ingest``.
+
+        Args:
+            path (str): CSV or binary recording.
+            speed (float): Playback speed factor, 0 for as fast as possible.
+
+        Returns:
+            dict: Replay status.
+        """
+        from replay import ReplayEngine
+
+        self.stop_replay()
+        self.replay = ReplayEngine(path, self.ingest, speed, scale_factor=self.get_scale_factor(),
+                                   uncalibrate=self.calibration.uncalibrate, on_finish=self._replay_finished)
+        self.replay.start()
+        return self.replay.status()
+
+    def stop_replay(self):
+        """Stops a running replay; live data resumes on a cleared history."""
+        if self.replay is not None:
+            self.replay.stop(timeout=1.0)
+
+    def _replay_finished(self):
+        # Los tiempos de la reproducción pueden ir por delante del reloj: se
+        # descartan para que los datos en vivo no queden fijados a ellos
+        self.clear_buffer()
+        self.timestamps.reset()
+
+    def replay_status(self):
+        """Returns the status of the last replay, or None."""
+        return self.replay.status() if self.replay is not None else None
 
     def read_fifo_full(self):
         
@@ -1,14 +1,30 @@
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, Response, jsonify, render_template, request, send_file
 import threading
 import time
 import json
 from datetime import datetime
 import os
-import bisect
-from collections import deque
+import atexit
 
-from adxl355 import ADXL355
-from interrupt import GPIOInterrupt
+import numpy as np
+
+from acquisition import AcquisitionProcess, acquisition_loop, create_sensor, follow_buffer
+from adxl355 import FRECUENCIA_MAX_HZ, HISTORICO_SEGUNDOS, MAX_MUESTRAS
+from catalog import FileIndexer, RecordingCatalog
+from calibration import IDENTITY, offsets_for_reference, parse_matrix
+from decimation import minmax_envelope
+from disk_ring import DiskHistory
+from export import ExportQueue
+import metrics
+from profiler import PROFILER
+from pyramid import SummaryPyramid
+from recorder import CsvWriter, StreamRecorder
+from segment_logger import SegmentLogger
+from spectrogram import AXES as EJES_ESPECTROGRAMA, SpectrogramRing
+from spectrum import SpectrumAnalyzer
+from stream import LiveStream
+from trigger import TriggerEngine
+from timestamps import odr_from_filter
 
 app = Flask(__name__)
 
@@ -19,12 +35,45 @@ config = {
     "range": 1,
     "odr": 0,
     "fifo_samples": 32,
+    "fifo_adaptativo": False, # Marca de agua de la FIFO ajustada según la latencia medida
     "interrupt_map": 2, # Default: FIFO_FULL on INT1 (0b00000010)
     "offsets": {'x': 0.0, 'y': 0.0, 'z': 0.0},
+    # Calibración aplicada al adquirir (ver calibration.py): offsets, luego la matriz, luego el promedio
+    "matriz_calibracion": [list(fila) for fila in IDENTITY],
+    "promedio_habilitado": False,
+    "promedio_muestras": 1,
     "filename": "datos_acelerometro",
-    "stabilization": 0.0
+    "stabilization": 0.0,
+    "formato_grabacion": "csv", # "csv" o "bin" (ver binary_format.py)
+    "proceso_adquisicion": True, # Adquisición en un proceso aparte (memoria compartida)
+    "simulacion": False, # SPI/GPIO simulados (ver simulation.py), para correr sin hardware
+    # Grabación automática por umbral (ver trigger.py); umbrales en min_*/max_* o center_*/delta_*
+    "auto_record": False,
+    "umbral_mode": "Absoluto", # "Absoluto" o "Relativo"
+    "auto_center": False,
+    "pre_record_time": 2.0,
+    "time_window": 10.0,
+    "cooldown": 1.0,
+    # Espectro (Welch) continuo, ver spectrum.py
+    "espectro_nperseg": 4096,
+    "espectro_solapamiento": 0.5,
+    "espectro_promedios": 8,
+    "espectrograma_segundos": 600, # Espectrograma de los últimos 10 min, ver spectrogram.py
+    # Histórico persistente en disco (ver disk_ring.py); 0 horas = deshabilitado
+    "historico_disco_horas": 0,
+    "historico_disco_ruta": "data/historico.ring",
+    # Registro continuo en segmentos rotados, comprimidos y depurados (ver segment_logger.py)
+    "registro_continuo": False,
+    "registro_formato": "bin",
+    "registro_segmento_s": 600,
+    "registro_segmento_mb": 100,
+    "registro_comprimir": True,
+    "registro_retencion_gb": 5.0,
+    "registro_retencion_dias": 7.0
 }
 
+PIN_INTERRUPCION = 22
+
 def save_config():
     """Guarda la configuración actual en el archivo JSON."""
     with open(CONFIG_FILE, 'w') as f:
@@ -48,30 +97,142 @@ def load_config():
 
 load_config()
 
+def promedio_config():
+    """Muestras por grupo del promedio móvil (1 si está deshabilitado)."""
+    return int(config['promedio_muestras']) if config['promedio_habilitado'] else 1
+
 sensor = None
 irq = None
 sensor_available = False
 recording = False
 recording_start_time = 0.0
+# Índice de las grabaciones (rango de tiempo, ajustes y estadísticas de cada archivo)
+catalogo = RecordingCatalog(os.path.join("data", "catalogo.sqlite"))
+DIRECTORIOS_CATALOGO = ["data", os.path.join("data", "continuo")]
+recorder = StreamRecorder(directory="data", catalog=catalogo)
+# Exportaciones de intervalos en hilos aparte (ver export.py)
+exportaciones = ExportQueue(directory=os.path.join("data", "exportaciones"))
+atexit.register(exportaciones.close)
+live_stream = LiveStream()
+resumenes = SummaryPyramid()  # Resúmenes 1 ms / 10 ms / 100 ms / 1 s, más allá del histórico crudo
+espectrograma = SpectrogramRing(seconds=config['espectrograma_segundos'])
+espectro = SpectrumAnalyzer(config['espectro_nperseg'], config['espectro_solapamiento'], config['espectro_promedios'],
+                            spectrogram=espectrograma)
+
+BUFFER_MUESTRAS = metrics.REGISTRY.gauge("adxl355_buffer_samples", "Samples held in the history buffer")
+BUFFER_OCUPACION = metrics.REGISTRY.gauge("adxl355_buffer_fill_ratio", "History buffer fill level (0-1)")
+ERRORES_CONSUMIDOR = metrics.REGISTRY.counter(
+    "adxl355_consumer_errors_total", "Exceptions raised by batch consumers (the batch is skipped for that consumer)")
+
+# Consumidores de cada lote leído de la FIFO (se llaman desde el hilo de adquisición)
+consumidores_lote = [recorder.feed, live_stream.publish, resumenes.ingest, espectro.ingest]
+
+# Histórico en disco, dimensionado en horas a la frecuencia máxima
+historico_disco = None
+if float(config['historico_disco_horas']) > 0:
+    try:
+        historico_disco = DiskHistory(config['historico_disco_ruta'],
+                                      int(float(config['historico_disco_horas']) * 3600 * FRECUENCIA_MAX_HZ))
+        consumidores_lote.append(historico_disco.ingest)
+        atexit.register(historico_disco.close)
+        print(f"Histórico en disco: {historico_disco.status()}")
+    except (OSError, ValueError) as e:
+        print(f"No se pudo abrir el histórico en disco: {e}")
 
 try:
-    sensor = ADXL355(measure_range=config['range'])
-    sensor.set_odr(config['odr'])
-    sensor.set_fifo_samples(config['fifo_samples'])
-    sensor.set_interrupt_map(config['interrupt_map'])
-    irq = GPIOInterrupt(pin=22)
+    ajustes_sensor = {
+        'range': config['range'],
+        'odr': config['odr'],
+        'fifo_samples': config['fifo_samples'],
+        'fifo_adaptativo': config['fifo_adaptativo'],
+        'interrupt_map': config['interrupt_map'],
+        'pin': PIN_INTERRUPCION,
+        'simulacion': config['simulacion'],
+        'offsets': config['offsets'],
+        'matriz_calibracion': config['matriz_calibracion'],
+        'promedio_muestras': promedio_config(),
+    }
+    if config['proceso_adquisicion']:
+        # El proceso de adquisición es dueño del SPI y del GPIO; acá sólo se lee la memoria compartida
+        sensor = AcquisitionProcess(ajustes_sensor, MAX_MUESTRAS)
+    else:
+        sensor, irq = create_sensor(ajustes_sensor)
+        sensor.new_data = threading.Event()
     sensor_available = True
-    print("Sensor ADXL355 detectado. Usando interrupciones GPIO y configuración cargada.")
+    if config['simulacion']:
+        print("Modo simulación: SPI y GPIO simulados.")
+    else:
+        print("Sensor ADXL355 detectado. Usando interrupciones GPIO y configuración cargada.")
 except Exception as e:
     print(f"No se pudo inicializar el sensor o GPIO: {e}. La aplicación se ejecutará sin datos reales.")
 
+def meta_grabacion(t_inicio):
+    """Campos de cabecera de una grabación binaria (ver binary_format.py)."""
+    return {
+        'range': sensor.measure_range if sensor_available else None,
+        'scale_factor': sensor.get_scale_factor() if sensor_available else None,
+        'odr': config['odr'],
+        'odr_hz': odr_from_filter(config['odr']),
+        'matriz_calibracion': config['matriz_calibracion'],
+        'promedio_muestras': promedio_config(),
+        't_start': t_inicio,
+    }
+
+def ajustes_registro(ajustes):
+    """Parámetros de SegmentLogger.configure a partir de las claves registro_* de config."""
+    return {
+        'file_format': ajustes['registro_formato'],
+        'segment_seconds': float(ajustes['registro_segmento_s']),
+        'segment_bytes': int(float(ajustes['registro_segmento_mb']) * 2**20),
+        'compress': bool(ajustes['registro_comprimir']),
+        'max_bytes': int(float(ajustes['registro_retencion_gb']) * 2**30),
+        'max_age': float(ajustes['registro_retencion_dias']) * 86400,
+    }
+
+# Registro continuo: siempre activo si se habilita, independiente de /record
+registro = SegmentLogger(directory=os.path.join("data", "continuo"),
+                         meta=lambda t_inicio: dict(meta_grabacion(t_inicio), offsets=config['offsets']),
+                         catalog=catalogo, **ajustes_registro(config))
+consumidores_lote.append(registro.feed)
+if config['registro_continuo'] and sensor_available:
+    registro.start()
+
+# Grabación automática por umbral, con su propio grabador para no interferir con la manual
+disparador = None
+if sensor_available:
+    disparador = TriggerEngine(sensor.buffer, StreamRecorder(directory="data", catalog=catalogo), config,
+                               offsets=lambda: config['offsets'], meta=meta_grabacion)
+    consumidores_lote.append(disparador.ingest)
+
+# Archivos que todavía no están en el catálogo (de antes, o copiados a mano): se leen una vez
+threading.Thread(target=catalogo.scan, args=(DIRECTORIOS_CATALOGO,), name="catalogo", daemon=True).start()
+
+def buffer_para(t_inicio):
+    """Buffer que conviene consultar desde t_inicio: el de RAM si lo cubre, si no el de disco."""
+    if historico_disco is None or not len(historico_disco.ring):
+        return sensor.buffer
+    mas_viejo = sensor.buffer.oldest_timestamp()
+    if mas_viejo is not None and mas_viejo <= t_inicio:
+        return sensor.buffer
+    return historico_disco.ring
+
 def datos_entre_tiempos(buffer, t_inicio, t_fin):
-    """Devuelve una lista con los datos del deque entre dos timestamps."""
-    data_list = list(buffer)
-    timestamps = [item["timestamp"] for item in data_list]
-    idx_inicio = bisect.bisect_left(timestamps, t_inicio)
-    idx_fin = bisect.bisect_right(timestamps, t_fin)
-    return deque(data_list[idx_inicio:idx_fin])
+    """Devuelve un iterador por bloques sobre los datos del buffer entre dos timestamps."""
+    seq_inicio, seq_fin = buffer.index_between(t_inicio, t_fin)
+    if seq_inicio == seq_fin:
+        return None
+    return buffer.iter_range(seq_inicio, seq_fin)
+
+def bloques_exportacion(t_inicio, t_fin):
+    """Datos de [t_inicio, t_fin] por bloques: lo que ya no está en los buffers sale de los archivos grabados."""
+    buffer = buffer_para(t_inicio) if sensor_available else None
+    mas_viejo = buffer.oldest_timestamp() if buffer is not None else None
+    if mas_viejo is None or t_inicio < mas_viejo:
+        fin_archivos = t_fin if mas_viejo is None else min(t_fin, np.nextafter(mas_viejo, -np.inf))
+        yield from catalogo.read(t_inicio, fin_archivos)
+    if mas_viejo is not None and t_fin >= mas_viejo:
+        seq_inicio, seq_fin = buffer.index_between(max(t_inicio, mas_viejo), t_fin)
+        yield from buffer.iter_range(seq_inicio, seq_fin, chunk_size=65536)
 
 def grabar_archivo(t_inicio, t_fin, base_name="datos_acelerometro"):
     if not os.path.exists("data"):
@@ -83,39 +244,66 @@ def grabar_archivo(t_inicio, t_fin, base_name="datos_acelerometro"):
     )
     timestamp_str = datetime.now().strftime("%y%m%d-%H%M%S")
     
-    if not sensor_available or not sensor.buffer:
+    if not sensor_available or not len(sensor.buffer):
         print("No hay datos en el buffer para grabar.")
         return
 
-    with sensor.buffer_lock:
-        datos = datos_entre_tiempos(sensor.buffer, t_inicio, t_fin)
+    bloques = datos_entre_tiempos(buffer_para(t_inicio), t_inicio, t_fin)
     
-    if not datos:
+    if bloques is None:
         print("No hay datos para grabar en el intervalo de tiempo seleccionado.")
         return
 
-    # Aplicar offsets a los datos guardados
+    # Los datos del buffer ya están calibrados
     file_path = os.path.join("data", f"{base_name}_{timestamp_str}.csv")
-    with open(file_path, "w", newline='') as f:
-        f.write("timestamp,x,y,z,temp\n") # Header
-        for d in datos:
-            ts_str = datetime.fromtimestamp(d["timestamp"]).isoformat()
-            x_cal = d['x'] - config['offsets']['x']
-            y_cal = d['y'] - config['offsets']['y']
-            # Para Z, el offset lo acerca a 1.0g, no a 0.
-            z_cal = d['z'] - config['offsets']['z']
-            f.write(f"{ts_str},{x_cal:.6f},{y_cal:.6f},{z_cal:.6f},{d['temp']:.2f}\n")
+    salida = CsvWriter(file_path)
+    indice = FileIndexer(file_path, "csv", dict(meta_grabacion(t_inicio), offsets=config['offsets']))
+    try:
+        for datos in bloques:
+            xyz = np.column_stack((datos["x"], datos["y"], datos["z"]))
+            indice.update(salida.position, datos["timestamp"], xyz)
+            salida.write(datos["timestamp"], xyz, datos["temp"])
+    finally:
+        salida.close()
+    catalogo.add(indice)
     print(f"Archivo guardado en {file_path}")
 
+errores_consumidor = {}  # Excepciones por consumidor, para no repetir el mensaje en cada lote
+
+def despachar_lote(lote):
+    """Entrega un lote de muestras a todos los consumidores registrados.
+
+    Se llama desde el hilo que sigue al buffer, tanto para datos en vivo como
+    para reproducciones (ver replay.py).
+    """
+    for consumidor in consumidores_lote:
+        try:
+            consumidor(lote)
+        except Exception as e:
+            # Un consumidor con problemas no debe dejar sin datos a los demás
+            ERRORES_CONSUMIDOR.inc()
+            nombre = getattr(consumidor, '__qualname__', repr(consumidor))
+            errores = errores_consumidor[nombre] = errores_consumidor.get(nombre, 0) + 1
+            if errores == 1 or errores % 1000 == 0:  # Sin inundar el registro si falla en cada lote
+                print(f"Error en el consumidor {nombre} ({errores} en total): {type(e).__name__}: {e}")
+
+def reiniciar_consumidores():
+    """Descarta lo acumulado por los consumidores cuando se vacía el buffer.
+
+    Al terminar una reproducción sus tiempos pueden ir por delante del reloj
+    (speed > 1 o 0); sin esto los datos en vivo quedarían detrás de ellos.
+    """
+    resumenes.clear()
+    espectro.clear()
+    espectrograma.clear()
+    if historico_disco is not None:
+        historico_disco.clear()
+
 def irq_handler():
     """
     Hilo que espera interrupciones del sensor y lee los datos del FIFO.
     """
-    while True:
-        # El timeout evita que se bloquee indefinidamente si algo va mal
-        events = irq.wait_event(timeout=1.0) # Timeout en segundos
-        if events:
-            sensor.read_fifo_with_meta()
+    acquisition_loop(sensor, irq)
 
 @app.route("/")
 def index():
@@ -123,12 +311,8 @@ def index():
 
 @app.route("/data", methods=["GET"])
 def get_data():
-    if sensor_available and sensor.buffer:
-        with sensor.buffer_lock:
-            latest_data = sensor.buffer[-1].copy()
-        latest_data['x'] -= config['offsets']['x']
-        latest_data['y'] -= config['offsets']['y']
-        latest_data['z'] -= config['offsets']['z']
+    latest_data = sensor.buffer.latest() if sensor_available else None
+    if latest_data is not None:
         return jsonify(latest_data)
     else:
         # Devuelve datos de ejemplo si el sensor no está disponible
@@ -137,6 +321,97 @@ def get_data():
             'timestamp': time.time(), 'error': 'Sensor no disponible'
         })
 
+@app.route("/stream", methods=["GET"])
+def stream_data():
+    """Stream SSE de bloques de muestras decimados (reemplaza el polling de /data)."""
+    try:
+        hz = min(max(float(request.args.get('hz', 10)), 0.5), 50.0)
+        puntos = min(max(int(request.args.get('puntos', 100)), 1), 2000)
+    except ValueError:
+        return jsonify({'error': 'Parámetros inválidos'}), 400
+
+    return Response(
+        live_stream.events(hz, puntos),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@app.route("/history", methods=["GET"])
+def get_history():
+    """Últimos N segundos del buffer reducidos a envolventes min/max por bucket."""
+    if not sensor_available:
+        return jsonify({'error': 'Sensor no disponible'}), 503
+    try:
+        # Con histórico en disco se puede mirar más atrás que los 2 min de RAM
+        limite = HISTORICO_SEGUNDOS
+        mas_viejo = historico_disco.ring.oldest_timestamp() if historico_disco is not None else None
+        if mas_viejo is not None:
+            limite = max(limite, time.time() - mas_viejo)
+        segundos = min(max(float(request.args.get('seconds', 60)), 0.01), limite)
+        puntos = min(max(int(request.args.get('points', 500)), 1), 5000)
+    except ValueError:
+        return jsonify({'error': 'Parámetros inválidos'}), 400
+
+    ultimo = sensor.buffer.latest()
+    if ultimo is None:
+        return jsonify({'timestamp': [], 'count': []})
+    t_fin = ultimo['timestamp']
+    t_inicio = t_fin - segundos
+    buffer = buffer_para(t_inicio)
+    seq_inicio, seq_fin = buffer.index_between(t_inicio, t_fin)
+    envolvente = minmax_envelope(
+        buffer.iter_range(seq_inicio, seq_fin, chunk_size=65536), t_inicio, t_fin, puntos
+    )
+
+    respuesta = {'timestamp': envolvente['timestamp'].tolist(), 'count': envolvente['count'].tolist()}
+    for eje in ('x', 'y', 'z'):
+        respuesta[f'{eje}_min'] = np.round(envolvente[f'{eje}_min'], 6).tolist()
+        respuesta[f'{eje}_max'] = np.round(envolvente[f'{eje}_max'], 6).tolist()
+    return jsonify(respuesta)
+
+@app.route("/summary", methods=["GET"])
+def get_summary():
+    """Min/max/media/RMS por eje de los últimos N segundos, desde los resúmenes precalculados."""
+    try:
+        segundos = max(float(request.args.get('seconds', 600)), 0.001)
+        puntos = min(max(int(request.args.get('points', 500)), 1), 5000)
+        ancho = request.args.get('width', type=float)
+        # Anclado a lo último recibido, como /history: una reproducción rápida va por delante del reloj
+        t_fin = resumenes.last_timestamp if resumenes.last_timestamp is not None else time.time()
+        resumen = resumenes.query(t_fin - segundos, t_fin, puntos, width=ancho)
+    except ValueError as e:
+        return jsonify({'error': f'Parámetros inválidos: {e}'}), 400
+
+    respuesta = {'width': resumen.pop('width')}
+    respuesta.update({clave: np.round(valores, 6).tolist() for clave, valores in resumen.items()})
+    return jsonify(respuesta)
+
+@app.route('/replay', methods=['GET', 'POST'])
+def replay_control():
+    """Reproduce una grabación de data/ por el mismo camino que los datos en vivo.
+
+    POST {"file": "datos_....bin", "speed": 1.0} inicia (speed 0 = lo más rápido
+    posible), POST {"stop": true} detiene, GET devuelve el estado.
+    """
+    if not sensor_available:
+        return jsonify({'error': 'Sensor no disponible'}), 503
+    if request.method == 'GET':
+        return jsonify({'replay': sensor.replay_status()})
+
+    data = request.get_json() or {}
+    if data.get('stop'):
+        sensor.stop_replay()
+        return jsonify({'replay': sensor.replay_status()})
+    try:
+        # Sólo archivos dentro de data/
+        path = os.path.join("data", os.path.basename(str(data['file'])))
+        speed = max(float(data.get('speed', 1.0)), 0.0)
+        return jsonify({'replay': sensor.start_replay(path, speed)})
+    except FileNotFoundError:
+        return jsonify({'error': 'Archivo no encontrado'}), 404
+    except (KeyError, ValueError, TypeError) as e:
+        return jsonify({'error': f'Datos inválidos: {e}'}), 400
+
 @app.route('/record', methods=['POST'])
 def record_toggle():
     global recording, recording_start_time, config
@@ -155,24 +430,285 @@ def record_toggle():
         except (ValueError, TypeError):
             config['stabilization'] = 0.0
         
+        formato = data.get('format', config['formato_grabacion'])
+        if formato in ('csv', 'bin'):
+            config['formato_grabacion'] = formato
+
         save_config()
+        if disparador is not None:
+            disparador.configure(config)  # Los eventos usan el mismo nombre y formato
+        # Los datos se escriben a disco mientras se graba, desde un hilo aparte
+        recorder.start(config['filename'], recording_start_time + config['stabilization'],
+                       config['offsets'], config['formato_grabacion'], meta_grabacion(recording_start_time))
         print(f"Iniciando grabación (archivo: {config['filename']}, estabilización: {config['stabilization']}s)...")
 
     elif not action and recording:
         recording = False
-        t_inicio_grabacion = recording_start_time + config['stabilization']
-        t_fin_grabacion = time.time()
-        
-        if t_fin_grabacion > t_inicio_grabacion:
-            grabar_archivo(t_inicio_grabacion, t_fin_grabacion, config['filename'])
-        else:
-            print("Grabación detenida antes de finalizar el tiempo de estabilización. No se guardó archivo.")
+        # Retorna enseguida: el hilo escritor termina de volcar y cierra el archivo
+        recorder.stop()
 
         recording_start_time = 0.0
         print("Grabación detenida.")
 
     return jsonify({'recording': recording, 'config': config})
 
+CLAVES_DISPARO = ('auto_record', 'umbral_mode', 'auto_center', 'pre_record_time', 'time_window', 'cooldown') + tuple(
+    f'{prefijo}_{eje}' for prefijo in ('center', 'delta', 'min', 'max') for eje in ('x', 'y', 'z'))
+
+@app.route('/trigger', methods=['GET', 'POST'])
+def trigger_control():
+    """Grabación automática por umbral (ver trigger.py).
+
+    GET devuelve el estado y los últimos eventos; POST recibe los ajustes con
+    las mismas claves de config.json (auto_record, umbral_mode, min_x...).
+    """
+    if disparador is None:
+        return jsonify({'error': 'Sensor no disponible'}), 503
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        try:
+            nuevos = {}
+            for clave in CLAVES_DISPARO:
+                if clave not in data:
+                    continue
+                if clave in ('auto_record', 'auto_center'):
+                    nuevos[clave] = bool(data[clave])
+                elif clave == 'umbral_mode':
+                    if data[clave] not in ('Absoluto', 'Relativo'):
+                        raise ValueError("umbral_mode debe ser 'Absoluto' o 'Relativo'")
+                    nuevos[clave] = data[clave]
+                else:
+                    nuevos[clave] = float(data[clave])
+        except (ValueError, TypeError) as e:
+            return jsonify({'success': False, 'message': f'Datos inválidos: {e}'}), 400
+        config.update(nuevos)
+        disparador.configure(config)
+        save_config()
+    ajustes = {clave: config[clave] for clave in CLAVES_DISPARO if clave in config}
+    return jsonify({'trigger': disparador.status(), 'config': ajustes})
+
+def aplicar_calibracion():
+    """Pasa offsets, matriz y promedio de config a la etapa de calibración del sensor."""
+    return sensor.set_calibration(config['offsets'], config['matriz_calibracion'], promedio_config())
+
+@app.route('/spectrum', methods=['GET', 'POST'])
+def spectrum_control():
+    """Densidad espectral (Welch) por eje, calculada al adquirir y servida desde caché.
+
+    GET ?points=500&fmax=200&history=60 devuelve frecuencias, PSD en g²/Hz y
+    picos por eje; POST {"nperseg": 4096, "overlap": 0.5, "averages": 8}
+    cambia los parámetros y recalcula desde el histórico.
+    """
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        try:
+            espectro.configure(data.get('nperseg', config['espectro_nperseg']),
+                               data.get('overlap', config['espectro_solapamiento']),
+                               data.get('averages', config['espectro_promedios']))
+        except (ValueError, TypeError) as e:
+            return jsonify({'success': False, 'message': f'Datos inválidos: {e}'}), 400
+        config['espectro_nperseg'] = espectro.nperseg
+        config['espectro_solapamiento'] = espectro.overlap
+        config['espectro_promedios'] = espectro.averages
+        save_config()
+        if sensor_available:
+            espectro.backfill(sensor.buffer)
+        return jsonify({'success': True, 'config': {'nperseg': espectro.nperseg, 'overlap': espectro.overlap,
+                                                    'averages': espectro.averages}})
+
+    try:
+        puntos = request.args.get('points', type=int)
+        if puntos is not None:
+            puntos = min(max(puntos, 2), 65536)
+        fmax = request.args.get('fmax', type=float)
+        historia = min(max(request.args.get('history', 0, type=int), 0), 600)
+    except ValueError:
+        return jsonify({'error': 'Parámetros inválidos'}), 400
+    texto = espectro.json(puntos, fmax, historia)
+    if texto is None:
+        return jsonify({'error': 'Todavía no hay datos suficientes para el espectro'}), 503
+    return Response(texto, mimetype='application/json')
+
+@app.route('/spectrogram', methods=['GET'])
+def spectrogram_index():
+    """Mosaicos disponibles del espectrograma (ver spectrogram.py) y su escala."""
+    return jsonify(espectrograma.index())
+
+@app.route('/spectrogram/<eje>/<int:mosaico>', methods=['GET'])
+def spectrogram_tile(eje, mosaico):
+    """Un mosaico del espectrograma: PNG en escala de grises (por defecto) o bytes crudos.
+
+    Cada píxel es el PSD en dB cuantizado a 0-255 entre db_min y db_max; con
+    ?format=raw se devuelven bins x columnas uint8, frecuencias bajas primero.
+    """
+    formato = request.args.get('format', 'png')
+    if eje not in EJES_ESPECTROGRAMA or formato not in ('png', 'raw'):
+        return jsonify({'error': 'Parámetros inválidos'}), 400
+    generacion = espectrograma.generation
+    encontrado = espectrograma.encoded_tile(eje, mosaico, formato)
+    if encontrado is None:
+        return jsonify({'error': 'Mosaico no disponible'}), 404
+    datos, tiempos = encontrado
+    respuesta = Response(datos, mimetype='image/png' if formato == 'png' else 'application/octet-stream')
+    respuesta.headers['X-Columns'] = str(len(tiempos))
+    respuesta.headers['X-T-Start'] = repr(float(tiempos[0]))
+    respuesta.headers['X-T-End'] = repr(float(tiempos[-1]))
+    # Los mosaicos completos no cambian: el navegador revalida con If-None-Match y recibe 304
+    respuesta.set_etag(f"{generacion}-{eje}-{mosaico}-{len(tiempos)}-{formato}")
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta.make_conditional(request)
+
+CLAVES_REGISTRO = ('registro_continuo', 'registro_formato', 'registro_segmento_s', 'registro_segmento_mb',
+                   'registro_comprimir', 'registro_retencion_gb', 'registro_retencion_dias')
+
+@app.route('/logging', methods=['GET', 'POST'])
+def logging_control():
+    """Registro continuo en segmentos (ver segment_logger.py).
+
+    GET devuelve el estado; POST recibe las mismas claves de config.json
+    (registro_continuo, registro_segmento_s, registro_retencion_gb...).
+    """
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        try:
+            nuevos = {}
+            for clave in CLAVES_REGISTRO:
+                if clave not in data:
+                    continue
+                if clave in ('registro_continuo', 'registro_comprimir'):
+                    nuevos[clave] = bool(data[clave])
+                elif clave == 'registro_formato':
+                    if data[clave] not in ('csv', 'bin'):
+                        raise ValueError("registro_formato debe ser 'csv' o 'bin'")
+                    nuevos[clave] = data[clave]
+                else:
+                    nuevos[clave] = float(data[clave])
+            registro.configure(**ajustes_registro(dict(config, **nuevos)))
+        except (ValueError, TypeError) as e:
+            return jsonify({'success': False, 'message': f'Datos inválidos: {e}'}), 400
+        config.update(nuevos)
+        save_config()
+        if config['registro_continuo'] and sensor_available:
+            registro.start()
+        else:
+            registro.stop()
+    ajustes = {clave: config[clave] for clave in CLAVES_REGISTRO}
+    return jsonify({'logging': registro.status(), 'config': ajustes})
+
+def instante(valor):
+    """Tiempo de un parámetro: segundos unix o fecha ISO local (2024-01-01T14:03:00)."""
+    try:
+        return float(valor)
+    except ValueError:
+        return datetime.fromisoformat(valor).timestamp()
+
+MAX_MUESTRAS_CATALOGO = 200000
+
+@app.route('/catalog', methods=['GET', 'POST'])
+def catalog_list():
+    """Archivos del catálogo que se solapan con [start, end] (ambos opcionales).
+
+    POST vuelve a recorrer data/ y data/continuo para sumar archivos nuevos.
+    """
+    if request.method == 'POST':
+        agregados = catalogo.scan(DIRECTORIOS_CATALOGO)
+        return jsonify({'added': agregados, 'catalog': catalogo.status()})
+    try:
+        t_inicio = instante(request.args['start']) if 'start' in request.args else None
+        t_fin = instante(request.args['end']) if 'end' in request.args else None
+    except ValueError as e:
+        return jsonify({'error': f'Parámetros inválidos: {e}'}), 400
+    return jsonify({'files': catalogo.files(t_inicio, t_fin)})
+
+@app.route('/catalog/data', methods=['GET'])
+def catalog_data():
+    """Muestras de [start, end] leídas de los archivos grabados que se solapan.
+
+    Con points=N devuelve envolventes min/max (como /history); sin points,
+    las muestras tal cual, hasta MAX_MUESTRAS_CATALOGO.
+    """
+    try:
+        t_inicio = instante(request.args['start'])
+        t_fin = instante(request.args['end'])
+        puntos = request.args.get('points', type=int)
+        if t_fin <= t_inicio:
+            raise ValueError("end debe ser posterior a start")
+    except KeyError:
+        return jsonify({'error': 'Faltan start y end'}), 400
+    except ValueError as e:
+        return jsonify({'error': f'Parámetros inválidos: {e}'}), 400
+
+    bloques = catalogo.read(t_inicio, t_fin)
+    if puntos:
+        envolvente = minmax_envelope(bloques, t_inicio, t_fin, min(max(puntos, 1), 5000))
+        respuesta = {'timestamp': envolvente['timestamp'].tolist(), 'count': envolvente['count'].tolist()}
+        for eje in ('x', 'y', 'z'):
+            respuesta[f'{eje}_min'] = np.round(envolvente[f'{eje}_min'], 6).tolist()
+            respuesta[f'{eje}_max'] = np.round(envolvente[f'{eje}_max'], 6).tolist()
+        return jsonify(respuesta)
+
+    partes, total, truncado = [], 0, False
+    for datos in bloques:
+        if total + len(datos['timestamp']) > MAX_MUESTRAS_CATALOGO:
+            datos = {clave: valores[:MAX_MUESTRAS_CATALOGO - total] for clave, valores in datos.items()}
+            truncado = True
+        partes.append(datos)
+        total += len(datos['timestamp'])
+        if truncado:
+            bloques.close()
+            break
+    respuesta = {'truncated': truncado}
+    for clave, decimales in (('timestamp', 6), ('x', 6), ('y', 6), ('z', 6), ('temp', 2)):
+        valores = np.concatenate([datos[clave] for datos in partes]) if partes else np.empty(0)
+        respuesta[clave] = np.round(valores.astype(np.float64), decimales).tolist()
+    return jsonify(respuesta)
+
+@app.route('/export', methods=['GET', 'POST'])
+def export_control():
+    """Exportación de un intervalo en segundo plano.
+
+    POST {"start": ..., "end": ..., "format": "csv"|"bin", "filename": "..."}
+    encola el trabajo y responde enseguida con su id; GET lista los trabajos.
+    """
+    if request.method == 'GET':
+        return jsonify({'jobs': exportaciones.jobs()})
+    data = request.get_json() or {}
+    try:
+        t_inicio = instante(str(data['start']))
+        t_fin = instante(str(data['end']))
+        nombre = os.path.basename(str(data.get('filename', config['filename'])).strip()) or "exportacion"
+        trabajo = exportaciones.submit(bloques_exportacion, t_inicio, t_fin, data.get('format', 'csv'), nombre,
+                                       meta_grabacion(t_inicio))
+    except KeyError:
+        return jsonify({'error': 'Faltan start y end'}), 400
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': f'Datos inválidos: {e}'}), 400
+    respuesta = jsonify({'job': trabajo.status()})
+    respuesta.headers['Location'] = f"/export/{trabajo.id}"
+    return respuesta, 202
+
+@app.route('/export/<id_trabajo>', methods=['GET', 'DELETE'])
+def export_job(id_trabajo):
+    """Estado y progreso de una exportación; DELETE la cancela o borra su archivo."""
+    if request.method == 'DELETE':
+        if not exportaciones.cancel(id_trabajo):
+            return jsonify({'error': 'Exportación no encontrada'}), 404
+        return jsonify({'success': True})
+    trabajo = exportaciones.get(id_trabajo)
+    if trabajo is None:
+        return jsonify({'error': 'Exportación no encontrada'}), 404
+    return jsonify({'job': trabajo.status()})
+
+@app.route('/export/<id_trabajo>/file', methods=['GET'])
+def export_file(id_trabajo):
+    """Descarga el archivo de una exportación terminada."""
+    trabajo = exportaciones.get(id_trabajo)
+    if trabajo is None:
+        return jsonify({'error': 'Exportación no encontrada'}), 404
+    if trabajo.state != 'done':
+        return jsonify({'error': f'La exportación está en estado {trabajo.state}', 'job': trabajo.status()}), 409
+    return send_file(os.path.abspath(trabajo.path), as_attachment=True, download_name=trabajo.filename)
+
 @app.route('/zero', methods=['POST'])
 def zero_sensor():
     global config
@@ -180,18 +716,17 @@ def zero_sensor():
         return jsonify({'error': 'Sensor no disponible'}), 503
 
     SAMPLES_FOR_ZEROING = 100
-    with sensor.buffer_lock:
-        buffer_len = len(sensor.buffer)
-        if buffer_len < SAMPLES_FOR_ZEROING:
-            return jsonify({'success': False, 'message': f'No hay suficientes muestras ({buffer_len}/{SAMPLES_FOR_ZEROING}). Espere un momento.'}), 400
-        samples_to_avg = list(sensor.buffer)[-SAMPLES_FOR_ZEROING:]
-
-    # Calcula el promedio para cada eje
-    config['offsets']['x'] = sum(s['x'] for s in samples_to_avg) / len(samples_to_avg)
-    config['offsets']['y'] = sum(s['y'] for s in samples_to_avg) / len(samples_to_avg)
-    # El offset de Z se calcula para que la lectura en reposo sea 1.0g
-    config['offsets']['z'] = (sum(s['z'] for s in samples_to_avg) / len(samples_to_avg)) - 1.0
-    
+    samples_to_avg = sensor.buffer.tail(SAMPLES_FOR_ZEROING)
+    buffer_len = len(samples_to_avg['timestamp'])
+    if buffer_len < SAMPLES_FOR_ZEROING:
+        return jsonify({'success': False, 'message': f'No hay suficientes muestras ({buffer_len}/{SAMPLES_FOR_ZEROING}). Espere un momento.'}), 400
+
+    # Promedio sin calibrar (columna raw), así no depende de los offsets anteriores
+    promedio = samples_to_avg['raw'].mean(axis=0, dtype=np.float64) / sensor.get_scale_factor()
+    # Los offsets se calculan para que la lectura en reposo sea (0, 0, 1.0g) tras la matriz
+    config['offsets'] = offsets_for_reference(promedio, config['matriz_calibracion'])
+    aplicar_calibracion()
+
     save_config()
     print(f"Nuevos offsets calculados y guardados: {config['offsets']}")
     return jsonify({'success': True, 'message': 'Sensor puesto a cero.', 'offsets': config['offsets']})
@@ -210,6 +745,7 @@ def set_offsets():
             'z': float(data.get('z', config['offsets']['z'])),
         }
         config['offsets'] = new_offsets
+        aplicar_calibracion()
         save_config()
         print(f"Offsets manuales guardados: {config['offsets']}")
         return jsonify({'success': True, 'message': 'Offsets manuales guardados.', 'offsets': config['offsets']})
@@ -232,6 +768,22 @@ def configure_sensor():
         if 'fifo_samples' in new_config:
             config['fifo_samples'] = int(new_config['fifo_samples'])
             sensor.set_fifo_samples(config['fifo_samples'])
+        if 'fifo_adaptativo' in new_config:
+            config['fifo_adaptativo'] = bool(new_config['fifo_adaptativo'])
+            if not config['fifo_adaptativo']:
+                sensor.set_fifo_samples(config['fifo_samples'])
+            sensor.set_adaptive_watermark(config['fifo_adaptativo'])
+        if 'matriz_calibracion' in new_config:
+            config['matriz_calibracion'] = parse_matrix(new_config['matriz_calibracion']).tolist()
+        if 'promedio_habilitado' in new_config:
+            config['promedio_habilitado'] = bool(new_config['promedio_habilitado'])
+        if 'promedio_muestras' in new_config:
+            muestras = int(new_config['promedio_muestras'])
+            if not 1 <= muestras <= 1000:
+                raise ValueError("promedio_muestras debe estar entre 1 y 1000.")
+            config['promedio_muestras'] = muestras
+        if any(clave in new_config for clave in ('matriz_calibracion', 'promedio_habilitado', 'promedio_muestras')):
+            aplicar_calibracion()
         if 'interrupt_map' in new_config:
             # Value comes as a binary string from frontend
             interrupt_val = int(new_config['interrupt_map'], 2)
@@ -240,8 +792,9 @@ def configure_sensor():
             config['interrupt_map'] = interrupt_val
             sensor.set_interrupt_map(config['interrupt_map'])
         
-        with sensor.buffer_lock:
-            sensor.buffer.clear()
+        sensor.clear_buffer()
+        espectro.clear()
+        espectrograma.clear()
         
         save_config()
         return jsonify({'success': True, 'message': 'Configuración aplicada.'})
@@ -256,9 +809,68 @@ def get_status():
     # Also add the current value from the sensor register if available
     if sensor_available:
         status['config']['interrupt_map_current'] = sensor.get_interrupt_map()
+        status['fifo'] = sensor.watermark_status()
+        status['calibracion'] = sensor.calibration_status()
+    if historico_disco is not None:
+        status['historico_disco'] = historico_disco.status()
+    status['catalogo'] = catalogo.status()
     return jsonify(status)
 
-if __name__ == "__main__":
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Métricas en formato de texto de Prometheus (de este proceso y del de adquisición)."""
     if sensor_available:
+        muestras = len(sensor.buffer)
+        BUFFER_MUESTRAS.set(muestras)
+        BUFFER_OCUPACION.set(muestras / sensor.buffer.capacity)
+    instantaneas = []
+    if sensor_available and isinstance(sensor, AcquisitionProcess):
+        instantaneas.append(sensor.metrics_snapshot())
+    # Al final, para que los gauges que este proceso actualiza tengan prioridad
+    instantaneas.append(metrics.REGISTRY.snapshot())
+    return Response(metrics.render(metrics.merge_snapshots(instantaneas)),
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def llamar_perfilador(proceso, metodo, *args):
+    """Ejecuta un método del perfilador en el proceso pedido ('web' o 'adquisicion')."""
+    if proceso == 'adquisicion' and isinstance(sensor, AcquisitionProcess):
+        return sensor.call(f"profiler_{metodo}", *args)
+    # Sin proceso aparte, la adquisición corre en un hilo de este mismo proceso
+    return getattr(PROFILER, metodo)(*args)
+
+@app.route('/profile', methods=['GET', 'POST'])
+def profile_control():
+    """Perfilador por muestreo.
+
+    POST {"enabled": true, "interval": 0.005, "process": "adquisicion"} lo
+    activa o desactiva; GET ?process=...&format=folded devuelve las pilas
+    (formato folded, para flamegraph) o, por defecto, las funciones con más
+    muestras en JSON.
+    """
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        proceso = data.get('process', 'adquisicion')
+        try:
+            if data.get('enabled'):
+                estado = llamar_perfilador(proceso, 'start', data.get('interval'))
+            else:
+                estado = llamar_perfilador(proceso, 'stop')
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': f'Datos inválidos: {e}'}), 400
+        return jsonify({'profile': estado})
+
+    proceso = request.args.get('process', 'adquisicion')
+    if request.args.get('format') == 'folded':
+        return Response(llamar_perfilador(proceso, 'folded'), mimetype='text/plain')
+    limite = request.args.get('limit', 20, type=int)
+    return jsonify({'profile': llamar_perfilador(proceso, 'status'), 'top': llamar_perfilador(proceso, 'top', limite)})
+
+if __name__ == "__main__":
+    if sensor_available and config['proceso_adquisicion']:
+        # Reparte a los consumidores lo que el proceso de adquisición escribe en memoria compartida
+        threading.Thread(target=sensor.follow, args=(despachar_lote, None, reiniciar_consumidores), daemon=True).start()
+    elif sensor_available:
         threading.Thread(target=irq_handler, daemon=True).start()
-    app.run(host="0.0.0.0", port=5000, debug=False)
+        threading.Thread(target=follow_buffer, args=(sensor.buffer, despachar_lote, sensor.new_data),
+                         kwargs={'on_clear': reiniciar_consumidores}, daemon=True).start()
+    app.run(host="0.0.0.0", port=5000, debug=False, threaded=True)
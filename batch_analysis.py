@@ -0,0 +1,309 @@
+"""Offline batch analysis of many recordings with a process pool.
+
+Every file (``.csv``, ``.bin`` and their gzipped segments) is streamed in
+chunks with ``catalog.read_chunks``, so memory stays bounded whatever the
+file size, and files are spread over worker processes. The summary table
+has one row per file with:
+
+- sample count, time span and sample rate;
+- per axis min, max, mean, RMS, AC RMS (mean removed) and peak |g|;
+- the dominant frequencies of a whole-file Welch PSD (``SpectrumAnalyzer``);
+- samples and events (runs of consecutive samples) outside the trigger
+  thresholds of ``config.json``, evaluated by ``TriggerEngine``.
+
+Binary files hold raw counts: by default they are calibrated with the
+offsets and calibration matrix of ``config.json`` through
+``CalibrationStage`` (the acquisition stage), or with their own header
+using ``--calibracion archivo``. CSV files, and binary exports marked
+``calibrated`` in the header, already hold g with the calibration of when
+they were recorded and are analyzed as written.
+
+Usage::
+
+    python batch_analysis.py data/ data/continuo/ [--workers 4] [--output resumen.csv]
+"""
+import argparse
+import concurrent.futures
+import csv
+import json
+import os
+import time
+from datetime import datetime
+from functools import partial
+
+import numpy as np
+
+from calibration import CalibrationStage
+from catalog import EXTENSIONS, file_format, read_chunks, read_meta
+from spectrum import SpectrumAnalyzer
+from trigger import TriggerEngine
+
+AXES = ("x", "y", "z")
+# Con auto_center la línea de base se actualiza cada tantas muestras, como con lotes de la FIFO
+BASELINE_BLOCK = 256
+
+
+def dominant_frequencies(freq, psd, count):
+    """The ``count`` highest local maxima of a PSD (skipping DC), refined with a parabola."""
+    if len(psd) < 3:
+        return []
+    inner = psd[1:-1]
+    peaks = np.flatnonzero((inner > psd[:-2]) & (inner >= psd[2:])) + 1
+    peaks = peaks[np.argsort(psd[peaks])[::-1][:count]]
+    result = []
+    for i in peaks:
+        a, b, c = psd[i - 1], psd[i], psd[i + 1]
+        denom = a - 2 * b + c
+        shift = 0.5 * (a - c) / denom if denom < 0 else 0.0
+        result.append(float(freq[i] + shift * (freq[1] - freq[0])))
+    return result
+
+
+class _WelchAverage:
+    """Receives every single-segment PSD of a ``SpectrumAnalyzer`` (its
+    spectrogram hook) and averages all of them, not just the last few."""
+
+    def __init__(self):
+        self.total = None
+        self.count = 0
+        self.fs_sum = 0.0
+        self.nperseg = None
+
+    def add(self, timestamp, psd, fs, nperseg, hop):
+        if self.total is None or self.total.shape != psd.shape:
+            self.total = np.zeros_like(psd)
+            self.count, self.fs_sum, self.nperseg = 0, 0.0, nperseg
+        self.total += psd
+        self.count += 1
+        self.fs_sum += fs
+
+    def result(self):
+        """Frequencies and mean PSD (g²/Hz, (bins, 3)), or None without segments."""
+        if not self.count:
+            return None
+        return np.fft.rfftfreq(self.nperseg, self.count / self.fs_sum), self.total / self.count
+
+
+class FileAnalysis:
+    """
+    Streaming statistics of one recording.
+
+    Args:
+        settings (dict): ``config.json`` contents (trigger thresholds).
+        nperseg (int): Samples per FFT segment of the PSD.
+        peaks (int): Dominant frequencies reported per axis.
+    """
+
+    def __init__(self, settings, nperseg=4096, peaks=3):
+        self.trigger = TriggerEngine(None, None, settings)
+        self.welch = _WelchAverage()
+        self.spectrum = SpectrumAnalyzer(nperseg, 0.5, 1, history=1, spectrogram=self.welch)
+        self.peaks = peaks
+        self.samples = 0
+        self.t_start = None
+        self.t_end = None
+        self._sum = np.zeros(3)
+        self._sumsq = np.zeros(3)
+        self._min = np.full(3, np.inf)
+        self._max = np.full(3, -np.inf)
+        self.exceeded = np.zeros(3, dtype=np.int64)
+        self.events = 0
+        self.first_event = None
+        self._tripped = False
+
+    def add(self, timestamp, xyz):
+        """Adds a chunk: timestamps and (N, 3) calibrated acceleration in g."""
+        if not len(timestamp):
+            return
+        values = np.asarray(xyz, dtype=np.float64)
+        self._sum += values.sum(axis=0)
+        self._sumsq += np.einsum("ij,ij->j", values, values)
+        np.minimum(self._min, values.min(axis=0), out=self._min)
+        np.maximum(self._max, values.max(axis=0), out=self._max)
+        if self.t_start is None:
+            self.t_start = float(timestamp[0])
+        self.t_end = float(timestamp[-1])
+        self.samples += len(timestamp)
+
+        xyz = np.asarray(xyz, dtype=np.float32)
+        self.spectrum.ingest({"timestamp": timestamp, "xyz": xyz})
+        if self.trigger.auto_center:
+            for start in range(0, len(timestamp), BASELINE_BLOCK):
+                stop = start + BASELINE_BLOCK
+                self._check(timestamp[start:stop], xyz[start:stop])
+                self.trigger.update_baseline(xyz[start:stop], timestamp[start:stop])
+        else:
+            self._check(timestamp, xyz)
+
+    def _check(self, timestamp, xyz):
+        tripped = self.trigger.tripped(xyz)
+        self.exceeded += tripped.sum(axis=0)
+        any_axis = tripped.any(axis=1)
+        # Un evento empieza donde una muestra sale de los umbrales y la anterior no
+        starts = any_axis & ~np.concatenate(([self._tripped], any_axis[:-1]))
+        if starts.any():
+            self.events += int(starts.sum())
+            if self.first_event is None:
+                self.first_event = float(timestamp[int(starts.argmax())])
+        self._tripped = bool(any_axis[-1])
+
+    def summary(self):
+        """Row of the summary table (dict)."""
+        n = max(self.samples, 1)
+        mean = self._sum / n
+        rms = np.sqrt(self._sumsq / n)
+        rms_ac = np.sqrt(np.maximum(self._sumsq / n - mean ** 2, 0.0))
+        span = (self.t_end - self.t_start) if self.samples > 1 else 0.0
+        spectrum = self.welch.result()
+        if spectrum is not None:
+            fs = self.welch.fs_sum / self.welch.count
+        else:
+            fs = (self.samples - 1) / span if span else 0.0
+        row = {
+            "samples": self.samples,
+            "t_start": _local(self.t_start),
+            "t_end": _local(self.t_end),
+            "duration": round(span, 6),
+            "fs": round(fs, 3),
+        }
+        for i, axis in enumerate(AXES):
+            row[f"{axis}_min"] = round(float(self._min[i]), 6)
+            row[f"{axis}_max"] = round(float(self._max[i]), 6)
+            row[f"{axis}_mean"] = round(float(mean[i]), 6)
+            row[f"{axis}_rms"] = round(float(rms[i]), 6)
+            row[f"{axis}_rms_ac"] = round(float(rms_ac[i]), 6)
+            row[f"{axis}_peak"] = round(float(max(abs(self._min[i]), abs(self._max[i]))), 6)
+            found = dominant_frequencies(spectrum[0], spectrum[1][:, i], self.peaks) if spectrum else []
+            for k in range(self.peaks):
+                row[f"{axis}_freq{k + 1}"] = round(found[k], 3) if k < len(found) else ""
+        for i, axis in enumerate(AXES):
+            row[f"{axis}_exceeded"] = int(self.exceeded[i])
+        row["events"] = self.events
+        row["first_event"] = _local(self.first_event)
+        return row
+
+
+def _local(t):
+    return "" if t is None else datetime.fromtimestamp(t).isoformat(timespec="milliseconds")
+
+
+def analyze_file(path, settings, calibration="config", nperseg=4096, peaks=3, chunk_size=65536):
+    """Analyzes one recording. Runs in a worker process.
+
+    Args:
+        path (str): Recording file.
+        settings (dict): ``config.json`` contents.
+        calibration (str): ``config`` (calibrate binary counts with
+            ``settings``, unless the header says they are ``calibrated``)
+            or ``archivo`` (use the file header).
+        nperseg (int): Samples per FFT segment.
+        peaks (int): Dominant frequencies per axis.
+        chunk_size (int): Samples read at a time.
+
+    Returns:
+        dict: Summary row, with ``error`` set if the file could not be read.
+    """
+    began = time.perf_counter()
+    row = {"file": path, "format": file_format(path)}
+    try:
+        analysis = FileAnalysis(settings, nperseg, peaks)
+        stage = None
+        if calibration == "config" and row["format"] == "bin" and not read_meta(path).get("calibrated"):
+            stage = CalibrationStage(settings.get("offsets"), settings.get("matriz_calibracion"))
+        for _, timestamp, xyz, _ in read_chunks(path, chunk_size=chunk_size, calibrated=stage is None):
+            if stage is not None:
+                xyz = stage.process({"xyz": xyz.astype(np.float32)})["xyz"]
+            analysis.add(timestamp, xyz)
+        row.update(analysis.summary())
+        row["error"] = ""
+    except (OSError, ValueError, EOFError) as e:
+        row["error"] = str(e)
+    row["seconds"] = round(time.perf_counter() - began, 3)
+    return row
+
+
+def collect_files(paths, recursive=False):
+    """Recording files given directly or found in the given directories, sorted."""
+    found = []
+    for path in paths:
+        if os.path.isfile(path):
+            found.append(path)
+            continue
+        if recursive:
+            for folder, _, names in os.walk(path):
+                found += [os.path.join(folder, name) for name in names if name.endswith(EXTENSIONS)]
+        elif os.path.isdir(path):
+            found += [os.path.join(path, name) for name in os.listdir(path) if name.endswith(EXTENSIONS)]
+    return sorted(set(found))
+
+
+def analyze(files, settings, workers=None, output=None, progress=print, **options):
+    """Analyzes files in parallel and optionally writes the summary table as CSV.
+
+    Args:
+        files (list): Recording paths.
+        settings (dict): ``config.json`` contents.
+        workers (int): Worker processes (None = one per CPU).
+        output (str): CSV path for the table (None = not written).
+        progress (callable): Called with a line per finished file.
+        **options: Passed to ``analyze_file``.
+
+    Returns:
+        list: Summary rows, in the order of ``files``.
+    """
+    rows = [None] * len(files)
+    task = partial(analyze_file, settings=settings, **options)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(task, path): i for i, path in enumerate(files)}
+        for done, future in enumerate(concurrent.futures.as_completed(pending), 1):
+            row = rows[pending[future]] = future.result()
+            state = f"error: {row['error']}" if row["error"] else f"{row['samples']} muestras"
+            progress(f"[{done}/{len(files)}] {row['file']} ({state}, {row['seconds']:.1f} s)")
+
+    if output:
+        columns = []
+        for row in rows:
+            columns += [key for key in row if key not in columns]
+        with open(output, "w", newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=columns, restval="")
+            writer.writeheader()
+            writer.writerows(rows)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analiza grabaciones en paralelo y escribe una tabla resumen.")
+    parser.add_argument("paths", nargs="+", help="Archivos o directorios (.csv, .bin, .csv.gz, .bin.gz)")
+    parser.add_argument("--recursive", "-r", action="store_true", help="Buscar también en subdirectorios")
+    parser.add_argument("--config", default="config.json", help="config.json con offsets, matriz y umbrales")
+    parser.add_argument("--calibracion", choices=("config", "archivo"), default="config",
+                        help="Calibración de los .bin: la de config.json o la de su cabecera")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos (por defecto, uno por CPU)")
+    parser.add_argument("--output", default="resumen_analisis.csv", help="Tabla resumen (CSV)")
+    parser.add_argument("--nperseg", type=int, default=4096, help="Muestras por segmento del PSD")
+    parser.add_argument("--peaks", type=int, default=3, help="Frecuencias dominantes por eje")
+    parser.add_argument("--chunk", type=int, default=65536, help="Muestras leídas por bloque")
+    args = parser.parse_args()
+
+    settings = {}
+    if os.path.exists(args.config):
+        with open(args.config) as f:
+            settings = json.load(f)
+    else:
+        print(f"No se encontró {args.config}: sin calibración ni umbrales.")
+    files = collect_files(args.paths, args.recursive)
+    if not files:
+        print("No se encontraron grabaciones.")
+        return
+
+    began = time.perf_counter()
+    rows = analyze(files, settings, args.workers, args.output, calibration=args.calibracion,
+                   nperseg=args.nperseg, peaks=args.peaks, chunk_size=args.chunk)
+    samples = sum(row.get("samples", 0) for row in rows)
+    elapsed = time.perf_counter() - began
+    print(f"{len(files)} archivos, {samples} muestras en {elapsed:.1f} s "
+          f"({samples / max(elapsed, 1e-9):.0f} muestras/s). Resumen en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compara el decodificado de la FIFO por bucle con el decodificado vectorizado.
+
+Uso:
+    python benchmarks/bench_decode.py [--samples 32] [--repeat 2000]
+
+Mide el costo por lote de ``ADXL355.read_fifo`` + ``get_axes_norm`` (camino
+actual, una dict por muestra) contra ``decode_fifo`` sobre la misma respuesta
+SPI. No necesita hardware: el SPI se reemplaza por una respuesta fija.
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import numpy as np
+from adxl355 import ADXL355, FIFO_DATA, FIFO_ENTRIES, decode_fifo
+
+
+class CannedSpi:
+    """SPI falso que siempre devuelve la misma ráfaga de FIFO."""
+
+    def __init__(self, samples):
+        self.samples = samples
+        self.payload = [random.randrange(256) for _ in range(samples * 9)]
+
+    def xfer2(self, data):
+        reg = data[0] >> 1
+        if reg == FIFO_ENTRIES:
+            return [0, self.samples * 3]
+        if reg == FIFO_DATA:
+            return [0] + self.payload[:len(data) - 1]
+        return [0] * len(data)
+
+
+def make_sensor(samples):
+    sensor = ADXL355.__new__(ADXL355)
+    sensor.spi = CannedSpi(samples)
+    sensor._tx_buffers = {}
+    sensor.measure_range = 2
+    return sensor
+
+
+def loop_decode(sensor):
+    return [sensor.get_axes_norm(r) for r in sensor.read_fifo()]
+
+
+def vector_decode(sensor):
+    return sensor.read_fifo_array(offsets=(0.0, 0.0, 0.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=32, help="Muestras por lote (1-32)")
+    parser.add_argument("--repeat", type=int, default=2000, help="Lotes por medición")
+    args = parser.parse_args()
+
+    sensor = make_sensor(args.samples)
+
+    # Verifica que ambos caminos decodifiquen lo mismo
+    expected = np.array([[r["x"], r["y"], r["z"]] for r in loop_decode(sensor)])
+    np.testing.assert_allclose(vector_decode(sensor), expected, rtol=1e-6, atol=1e-6)
+
+    payload = sensor.spi.payload
+    results = {
+        "read_fifo + get_axes_norm": timeit.timeit(lambda: loop_decode(sensor), number=args.repeat),
+        "read_fifo_array": timeit.timeit(lambda: vector_decode(sensor), number=args.repeat),
+        "decode_fifo (solo decodificado)": timeit.timeit(
+            lambda: decode_fifo(payload, 256000), number=args.repeat),
+    }
+
+    print(f"{args.samples} muestras/lote, {args.repeat} lotes")
+    baseline = results["read_fifo + get_axes_norm"]
+    for name, total in results.items():
+        per_sample_us = total / (args.repeat * args.samples) * 1e6
+        print(f"  {name:<34} {per_sample_us:8.3f} us/muestra  x{baseline / total:5.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""Benchmarks de los caminos críticos de adquisición, almacenamiento y HTTP.
+
+Corre contra el SPI simulado (simulation.py), así que no necesita hardware y
+los resultados son comparables entre commits. Mide:
+
+- muestras/s de ``read_fifo`` y ``read_fifo_with_meta`` (FIFO siempre llena)
+- latencia y tiempo de lock de ``datos_entre_tiempos`` con el buffer lleno
+- filas/s de ``grabar_archivo`` y del grabador en streaming (CSV y binario)
+- latencia de ``/data`` y ``/status`` con clientes HTTP concurrentes
+- memoria por muestra del buffer (contra el deque de dicts anterior)
+
+Uso:
+    python benchmarks/run.py [--quick] [--output resultados.json] [--compare anterior.json]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+from collections import deque
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+import numpy as np
+
+from adxl355 import ADXL355, MAX_MUESTRAS
+from ring_buffer import RingBuffer
+from simulation import FakeSpiDev
+
+
+class TimedLock:
+    """Envuelve un Lock y registra cuánto se espera y cuánto se retiene."""
+
+    def __init__(self, lock):
+        self.lock = lock
+        self.waits = []
+        self.holds = []
+        self._acquired_at = None
+
+    def acquire(self, *args, **kwargs):
+        start = time.perf_counter()
+        ok = self.lock.acquire(*args, **kwargs)
+        self._acquired_at = time.perf_counter()
+        self.waits.append(self._acquired_at - start)
+        return ok
+
+    def release(self):
+        self.holds.append(time.perf_counter() - self._acquired_at)
+        self.lock.release()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def percentiles(values_s):
+    """Resume una lista de duraciones (s) en microsegundos."""
+    if not values_s:
+        return {}
+    us = np.asarray(values_s) * 1e6
+    return {
+        "count": len(us),
+        "mean_us": float(us.mean()),
+        "p50_us": float(np.percentile(us, 50)),
+        "p95_us": float(np.percentile(us, 95)),
+        "p99_us": float(np.percentile(us, 99)),
+        "max_us": float(us.max()),
+    }
+
+
+def fill_buffer(buffer, samples, odr=4000.0, batch=32):
+    """Llena un buffer con datos sintéticos en lotes como los de la FIFO."""
+    t0 = time.time() - samples / odr
+    rng = np.random.default_rng(0)
+    for start in range(0, samples, 4096):
+        n = min(4096, samples - start)
+        ts = t0 + (start + np.arange(n)) / odr
+        xyz = rng.normal(0, 0.01, (n, 3)).astype(np.float32)
+        raw = np.rint(xyz * 256000).astype(np.int32)
+        buffer.append_batch(ts, xyz, 25.0, raw)
+    return t0
+
+
+def bench_fifo(iterations):
+    # Velocidad enorme: la FIFO está siempre llena y se mide sólo el drenado
+    sensor = ADXL355(spi=FakeSpiDev(speed=1e6), buffer=RingBuffer(MAX_MUESTRAS))
+    results = {}
+    for name, call in (("read_fifo", sensor.read_fifo), ("read_fifo_with_meta", sensor.read_fifo_with_meta)):
+        samples = 0
+        start = time.perf_counter()
+        for _ in range(iterations):
+            result = call()
+            samples += len(result["timestamp"]) if isinstance(result, dict) else len(result)
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            "samples_per_s": samples / elapsed,
+            "us_per_batch": elapsed / iterations * 1e6,
+            "spi_transfers_per_batch": None,
+        }
+        transfers = sensor.spi.transfers
+        call()
+        results[name]["spi_transfers_per_batch"] = sensor.spi.transfers - transfers
+    return results
+
+
+def bench_range_query(app, repeats):
+    buffer = app.sensor.buffer
+    t0 = fill_buffer(buffer, MAX_MUESTRAS)
+    span = MAX_MUESTRAS / 4000.0
+    timed = TimedLock(buffer.lock)
+    buffer.lock = timed
+    latencies = []
+    iterate = []
+    try:
+        for i in range(repeats):
+            # Ventanas de 10 s repartidas por el histórico
+            t_start = t0 + (i % 10) * span / 10
+            start = time.perf_counter()
+            blocks = app.datos_entre_tiempos(buffer, t_start, t_start + 10.0)
+            latencies.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            rows = sum(len(b["timestamp"]) for b in blocks) if blocks is not None else 0
+            iterate.append(time.perf_counter() - start)
+    finally:
+        buffer.lock = timed.lock
+    return {
+        "buffer_samples": len(buffer),
+        "rows_per_query": rows,
+        "query_latency": percentiles(latencies),
+        "iterate_latency": percentiles(iterate),
+        "lock_hold": percentiles(timed.holds),
+        "lock_wait": percentiles(timed.waits),
+    }
+
+
+def bench_recording(app, seconds):
+    from recorder import StreamRecorder
+
+    buffer = app.sensor.buffer
+    latest = buffer.latest()["timestamp"]
+    results = {}
+
+    start = time.perf_counter()
+    app.grabar_archivo(latest - seconds, latest, "bench")
+    elapsed = time.perf_counter() - start
+    results["grabar_archivo"] = {"rows": int(seconds * 4000), "rows_per_s": seconds * 4000 / elapsed}
+
+    for file_format in ("csv", "bin"):
+        recorder = StreamRecorder(directory=app_data_dir(), max_pending=100000)
+        recorder.start("bench", 0.0, file_format=file_format, meta={"scale_factor": 256000})
+        seq0, seq1 = buffer.index_between(latest - seconds, latest)
+        start = time.perf_counter()
+        for chunk in buffer.iter_range(seq0, seq1, chunk_size=32):
+            recorder.feed({
+                "timestamp": chunk["timestamp"],
+                "xyz": np.column_stack((chunk["x"], chunk["y"], chunk["z"])),
+                "raw": chunk["raw"],
+                "temp": chunk["temp"],
+            })
+        recorder.stop()
+        recorder.wait()
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(recorder.file_path)
+        results[f"stream_{file_format}"] = {
+            "rows": seq1 - seq0,
+            "rows_per_s": (seq1 - seq0) / elapsed,
+            "bytes_per_row": size / max(seq1 - seq0, 1),
+        }
+    return results
+
+
+def app_data_dir():
+    return os.path.join(os.getcwd(), "data")
+
+
+def bench_http(app, clients, requests_per_client):
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    results = {}
+    try:
+        for path in ("/data", "/status"):
+            latencies = []
+            lock = threading.Lock()
+
+            def client():
+                local = []
+                for _ in range(requests_per_client):
+                    start = time.perf_counter()
+                    with urllib.request.urlopen(base + path) as response:
+                        response.read()
+                    local.append(time.perf_counter() - start)
+                with lock:
+                    latencies.extend(local)
+
+            threads = [threading.Thread(target=client) for _ in range(clients)]
+            start = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - start
+            results[path] = dict(percentiles(latencies), clients=clients,
+                                 requests_per_s=len(latencies) / elapsed)
+    finally:
+        server.shutdown()
+    return results
+
+
+def bench_memory(samples):
+    ring_bytes = RingBuffer.nbytes(samples)
+
+    # Referencia: el deque de dicts que se usaba antes
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    legacy = deque(maxlen=samples)
+    ts = time.time()
+    for i in range(samples):
+        legacy.append({"x": i * 1e-6, "y": i * 2e-6, "z": 1.0 + i * 1e-7, "temp": 25.0 + i * 1e-9, "timestamp": ts + i})
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    legacy_bytes = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del legacy
+    return {
+        "ring_bytes_per_sample": ring_bytes / samples,
+        "deque_dict_bytes_per_sample": legacy_bytes / samples,
+        "ring_bytes_full_history": RingBuffer.nbytes(MAX_MUESTRAS),
+    }
+
+
+def load_app(workdir):
+    """Importa app.py en modo simulación, en hilo, dentro de un directorio temporal."""
+    with open(os.path.join(workdir, "config.json"), "w") as f:
+        json.dump({"simulacion": True, "proceso_adquisicion": False}, f)
+    os.chdir(workdir)
+    import app
+    return app
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+    }
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    old = flatten(previous["results"])
+    new = flatten(current["results"])
+    print(f"\nComparación con {previous_path} ({previous['meta'].get('commit')}):")
+    for name in sorted(new):
+        if name in old and old[name]:
+            print(f"  {name:<60} {old[name]:>14.2f} -> {new[name]:>14.2f}  ({new[name] / old[name]:6.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks del pipeline del acelerómetro.")
+    parser.add_argument("--quick", action="store_true", help="Menos repeticiones (para probar rápido)")
+    parser.add_argument("--output", help="Archivo JSON de salida (por defecto benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="JSON de una corrida anterior para comparar")
+    args = parser.parse_args()
+
+    scale = 0.1 if args.quick else 1.0
+    output = os.path.abspath(args.output) if args.output else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+
+    report = {"meta": metadata(), "results": {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        app = load_app(workdir)
+        steps = (
+            ("fifo", lambda: bench_fifo(int(2000 * scale))),
+            ("range_query", lambda: bench_range_query(app, int(200 * scale))),
+            ("recording", lambda: bench_recording(app, 30 * scale)),
+            ("http", lambda: bench_http(app, 8, int(100 * scale))),
+            ("memory", lambda: bench_memory(int(100000 * scale))),
+        )
+        for name, step in steps:
+            print(f"- {name}...", flush=True)
+            report["results"][name] = step()
+        os.chdir(ROOT)
+
+    if output is None:
+        os.makedirs(os.path.join(ROOT, "benchmarks", "results"), exist_ok=True)
+        output = os.path.join(ROOT, "benchmarks", "results", f"{report['meta']['commit'] or 'local'}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+    print(f"Resultados guardados en {output}")
+    if compare_path:
+        compare(report, compare_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Compact binary recording format and memory-mapped reader.
+
+Layout::
+
+    magic (8 bytes, b"ADXL355R") | version (uint16) | header length (uint32)
+    | JSON header (UTF-8, padded with spaces to a multiple of 8 bytes)
+    | records
+
+Every record is 24 bytes: timestamp (float64, unix epoch), raw X/Y/Z counts
+(int32, sign-extended 20-bit values straight from the FIFO) and temperature
+(float32, °C). The JSON header carries what is needed to turn counts into g:
+measure range, scale factor, ODR, offsets and the calibration matrix.
+Files written from calibrated values (exports) have ``calibrated: true``
+and no offsets or matrix: their counts only need the scale factor.
+
+Usage as a script exports a recording to CSV::
+
+    python binary_format.py data/datos_240101-120000.bin [salida.csv]
+"""
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+MAGIC = b"ADXL355R"
+VERSION = 1
+_PREAMBLE = struct.Struct("<8sHI")
+RECORD_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("raw", "<i4", (3,)),
+    ("temp", "<f4"),
+])
+
+
+def build_header(meta):
+    """Returns the encoded preamble + JSON header for ``meta``."""
+    body = json.dumps(meta).encode("utf-8")
+    size = _PREAMBLE.size + len(body)
+    body += b" " * (-size % 8)  # Registros alineados a 8 bytes
+    return _PREAMBLE.pack(MAGIC, VERSION, len(body)) + body
+
+
+def read_header(f):
+    """Reads the preamble and JSON header from an open file.
+
+    Returns:
+        tuple: (meta dict, byte offset of the first record).
+    """
+    magic, version, header_len = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+    if magic != MAGIC:
+        raise ValueError(f"{getattr(f, 'name', 'file')} is not an ADXL355 binary recording")
+    if version != VERSION:
+        raise ValueError(f"Unsupported recording version {version}")
+    return json.loads(f.read(header_len).decode("utf-8")), _PREAMBLE.size + header_len
+
+
+def raw_to_g(raw, meta, calibrated=False):
+    """Converts raw counts to g with the scale factor and offsets of ``meta``.
+
+    Args:
+        raw (numpy.ndarray): (N, 3) raw counts.
+        meta (dict): Recording header.
+        calibrated (bool): Also apply the calibration matrix of the header.
+
+    Returns:
+        numpy.ndarray: (N, 3) float64 array with offsets subtracted.
+    """
+    accel = raw / float(meta["scale_factor"])
+    offsets = meta.get("offsets")
+    if offsets:
+        accel -= np.array([offsets["x"], offsets["y"], offsets["z"]])
+    matrix = meta.get("matriz_calibracion")
+    if calibrated and matrix:
+        accel = accel @ np.asarray(matrix, dtype=np.float64).T
+    return accel
+
+
+def pack_records(timestamp, raw, temp):
+    """Packs a batch into a structured array of ``RECORD_DTYPE``."""
+    records = np.empty(len(timestamp), dtype=RECORD_DTYPE)
+    records["timestamp"] = timestamp
+    records["raw"] = raw
+    records["temp"] = temp
+    return records
+
+
+class BinaryWriter:
+    """
+    Appends batches of raw samples to a binary recording.
+    """
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.file = open(path, "wb")
+        header = build_header(meta)
+        self.file.write(header)
+        self.samples = 0
+        self.position = len(header)  # Bytes escritos, sin vaciar el buffer del archivo
+
+    def write(self, timestamp, raw, temp):
+        """Writes a batch: timestamps, (N, 3) raw counts and temperature."""
+        self.file.write(pack_records(timestamp, raw, temp).tobytes())
+        self.samples += len(timestamp)
+        self.position += len(timestamp) * RECORD_DTYPE.itemsize
+
+    def close(self):
+        self.file.close()
+
+
+class BinaryRecording:
+    """
+    Read-only, memory-mapped view of a binary recording.
+
+    Columns are NumPy views over the file, so opening a multi-GB recording is
+    instant and only the pages actually touched are read from disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.meta, self.data_offset = read_header(f)
+        count = (os.path.getsize(path) - self.data_offset) // RECORD_DTYPE.itemsize
+        if count > 0:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode="r",
+                                     offset=self.data_offset, shape=(count,))
+        else:
+            self.records = np.empty(0, dtype=RECORD_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def timestamp(self):
+        return self.records["timestamp"]
+
+    @property
+    def raw(self):
+        return self.records["raw"]
+
+    @property
+    def temp(self):
+        return self.records["temp"]
+
+    def accel_g(self, start=0, stop=None, calibrated=False):
+        """Returns acceleration in g for a range of records.
+
+        Args:
+            start (int): First record.
+            stop (int): Record past the last one (None = end of file).
+            calibrated (bool): Also apply the calibration matrix of the header.
+
+        Returns:
+            numpy.ndarray: (N, 3) float64 array with offsets subtracted.
+        """
+        return raw_to_g(self.raw[start:stop], self.meta, calibrated)
+
+    def index_between(self, t_start, t_end):
+        """Returns the (start, stop) record range with timestamps in [t_start, t_end]."""
+        start = int(np.searchsorted(self.timestamp, t_start, side="left"))
+        stop = int(np.searchsorted(self.timestamp, t_end, side="right"))
+        return start, max(start, stop)
+
+    def export_csv(self, csv_path, chunk_size=65536):
+        """Writes the recording as CSV in the ``grabar_archivo`` layout."""
+        from recorder import CSV_HEADER, format_csv_rows
+
+        with open(csv_path, "w", newline='') as f:
+            f.write(CSV_HEADER)
+            for start in range(0, len(self), chunk_size):
+                stop = min(start + chunk_size, len(self))
+                f.write(format_csv_rows(self.timestamp[start:stop],
+                                        self.accel_g(start, stop, calibrated=True),
+                                        self.temp[start:stop]))
+        return csv_path
+
+    def close(self):
+        """Drops the mapping (it is released once no view references it)."""
+        self.records = np.empty(0, dtype=RECORD_DTYPE)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    recording = BinaryRecording(sys.argv[1])
+    destino = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(sys.argv[1])[0] + ".csv"
+    recording.export_csv(destino)
+    print(f"{len(recording)} muestras exportadas a {destino}")
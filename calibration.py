@@ -0,0 +1,150 @@
+"""Calibration stage applied to every batch before it enters the history.
+
+Offsets, the ``matriz_calibracion`` rotation and the optional moving
+average (``promedio_muestras``) used to be applied sample by sample on
+every read or export. ``CalibrationStage`` applies them once per FIFO block
+instead: the average is a boxcar over groups of N samples (decimating by N,
+with the incomplete group carried to the next block) and offset plus
+matrix collapse into a single affine operation,
+``(xyz - offsets) @ M.T == xyz @ M.T - M @ offsets``.
+
+The ``raw`` column keeps the uncalibrated counts (averaged like the
+values), so binary recordings and ``/zero`` still see what the sensor
+measured.
+"""
+import numpy as np
+
+AXES = ("x", "y", "z")
+IDENTITY = ((1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0))
+
+
+def parse_matrix(matrix):
+    """Validates a calibration matrix (None means identity).
+
+    Returns:
+        numpy.ndarray: (3, 3) float64 matrix.
+    """
+    if matrix is None:
+        return np.array(IDENTITY)
+    matrix = np.asarray(matrix, dtype=np.float64)
+    if matrix.shape != (3, 3) or not np.all(np.isfinite(matrix)):
+        raise ValueError("matriz_calibracion must be a 3x3 matrix of numbers")
+    if abs(np.linalg.det(matrix)) < 1e-9:
+        raise ValueError("matriz_calibracion is singular")
+    return matrix
+
+
+def offsets_for_reference(mean_g, matrix=None, reference=(0.0, 0.0, 1.0)):
+    """Offsets that make the calibrated output read ``reference`` at rest.
+
+    Args:
+        mean_g (sequence): Mean uncalibrated (x, y, z) in g, e.g. from the
+            ``raw`` column divided by the scale factor.
+        matrix: Calibration matrix in use (None means identity).
+        reference (sequence): Expected output at rest, 1 g on Z by default.
+
+    Returns:
+        dict: Offsets per axis.
+    """
+    matrix = parse_matrix(matrix)
+    offsets = np.asarray(mean_g, dtype=np.float64) - np.linalg.solve(matrix, np.asarray(reference, dtype=np.float64))
+    return {axis: float(value) for axis, value in zip(AXES, offsets)}
+
+
+class CalibrationStage:
+    """
+    Offset, calibration matrix and moving average for decoded batches.
+
+    Args:
+        offsets (dict): Offsets per axis, in g (subtracted first).
+        matrix: 3x3 calibration matrix applied after the offsets.
+        average (int): Samples per moving-average group (1 disables it).
+    """
+
+    def __init__(self, offsets=None, matrix=None, average=1):
+        self._carry = None
+        self.configure(offsets, matrix, average)
+
+    def configure(self, offsets=None, matrix=None, average=1):
+        """Replaces the calibration. A pending partial average group is dropped."""
+        offsets = offsets or {}
+        offset_vector = np.array([float(offsets.get(axis, 0.0)) for axis in AXES])
+        matrix = parse_matrix(matrix)
+        average = int(average)
+        if average < 1:
+            raise ValueError("promedio_muestras must be at least 1")
+        self.offsets = {axis: float(value) for axis, value in zip(AXES, offset_vector)}
+        self.matrix = matrix
+        self.average = average
+        # xyz @ M.T - M @ o, en float32 como el buffer
+        self._transform = matrix.T.astype(np.float32)
+        self._bias = (matrix @ offset_vector).astype(np.float32)
+        self._identity = bool(np.array_equal(matrix, IDENTITY))
+        self._carry = None
+
+    def reset(self):
+        """Drops the incomplete average group (e.g. after clearing the history)."""
+        self._carry = None
+
+    def status(self):
+        return {
+            "offsets": self.offsets,
+            "matriz_calibracion": self.matrix.tolist(),
+            "promedio_muestras": self.average,
+        }
+
+    def uncalibrate(self, xyz):
+        """Undoes offsets and matrix: calibrated g back to what the sensor measured.
+
+        Args:
+            xyz (numpy.ndarray): (N, 3) calibrated values in g.
+
+        Returns:
+            numpy.ndarray: (N, 3) float64 uncalibrated values in g.
+        """
+        xyz = np.asarray(xyz, dtype=np.float64)
+        offsets = np.array([self.offsets[axis] for axis in AXES])
+        if self._identity:
+            return xyz + offsets
+        return np.linalg.solve(self.matrix, xyz.T).T + offsets
+
+    def process(self, batch):
+        """Calibrates a batch (``timestamp``, ``xyz``, ``raw``, ``temp``).
+
+        Returns:
+            dict: A new batch; empty when averaging left no complete group yet.
+        """
+        if self.average > 1:
+            batch = self._average(batch)
+        xyz = batch["xyz"]
+        if self._identity:
+            xyz = xyz - self._bias
+        else:
+            xyz = np.asarray(xyz, dtype=np.float32) @ self._transform
+            xyz -= self._bias
+        return dict(batch, xyz=xyz)
+
+    def _average(self, batch):
+        raw = batch.get("raw")
+        if raw is None:
+            raw = np.zeros((len(batch["timestamp"]), 3), dtype=np.int32)
+        # timestamp, x/y/z y raw en una sola matriz (N, 7) para promediar de una vez
+        columns = np.empty((len(raw), 7))
+        columns[:, 0] = batch["timestamp"]
+        columns[:, 1:4] = batch["xyz"]
+        columns[:, 4:] = raw
+        if self._carry is not None:
+            columns = np.concatenate((self._carry, columns))
+        used = len(columns) - len(columns) % self.average
+        self._carry = columns[used:].copy() if used < len(columns) else None
+
+        temp = batch["temp"]
+        means = columns[:used].reshape(-1, self.average, 7).mean(axis=1)
+        if np.ndim(temp):
+            temp = float(np.mean(temp))  # Varía lento: basta un valor por bloque
+        return {
+            "timestamp": means[:, 0],
+            "xyz": means[:, 1:4].astype(np.float32),
+            "raw": np.rint(means[:, 4:]).astype(np.int32),
+            "temp": temp,
+        }
@@ -0,0 +1,383 @@
+"""Catalog of recording files for time-range queries across files.
+
+Every file written by ``StreamRecorder``, ``SegmentLogger`` or
+``grabar_archivo`` is registered in an SQLite database when it is closed:
+exact time span, sample count, acquisition settings (ODR, range, scale
+factor, offsets, calibration matrix) and per-axis min/max/mean/RMS. While
+the file is written, ``FileIndexer`` also keeps sparse seek points (the
+timestamp of a row and its byte offset in the uncompressed file), so
+``RecordingCatalog.read`` only opens the files that overlap the requested
+range and starts reading right before it instead of parsing them from the
+top. Gzipped segments keep their seek points: ``gzip`` seeks in the
+uncompressed stream by decompressing forward, without parsing.
+
+Files written before the catalog existed (or copied in by hand) are indexed
+by ``scan``, which reads each of them once.
+"""
+import gzip
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+import metrics
+from binary_format import RECORD_DTYPE, raw_to_g, read_header
+from recorder import CSV_HEADER, parse_csv_rows
+
+CATALOG_FILES = metrics.REGISTRY.gauge(
+    "adxl355_catalog_files", "Recording files in the catalog")
+CATALOG_READ_SECONDS = metrics.REGISTRY.histogram(
+    "adxl355_catalog_read_seconds", "Time to read one time range from the catalogued files")
+
+SCHEMA_VERSION = 1
+SEEK_INTERVAL = 1.0  # Segundos de datos entre puntos de acceso
+# Los CSV redondean el tiempo al microsegundo: la misma muestra en dos archivos
+# puede diferir en eso (a 4 kHz las muestras distan 250 µs)
+DUPLICATE_TOLERANCE = 1e-5
+EXTENSIONS = (".csv", ".bin", ".csv.gz", ".bin.gz")
+AXES = ("x", "y", "z")
+STATS = ("min", "max", "mean", "rms")
+_STAT_COLUMNS = [f"{axis}_{stat}" for axis in AXES for stat in STATS]
+_COLUMNS = ["path", "format", "t_start", "t_end", "samples", "odr", "odr_hz", "range", "scale_factor",
+            "offsets", "matriz_calibracion", "promedio_muestras", "bytes"] + _STAT_COLUMNS
+
+
+def file_format(path):
+    """``csv`` or ``bin`` from the file name (``.gz`` is ignored)."""
+    name = path[:-3] if path.endswith(".gz") else path
+    return "bin" if name.endswith(".bin") else "csv"
+
+
+def read_meta(path):
+    """Header of a binary recording (optionally gzipped); empty for CSV."""
+    if file_format(path) != "bin":
+        return {}
+    with (gzip.open if path.endswith(".gz") else open)(path, "rb") as f:
+        return read_header(f)[0]
+
+
+def read_chunks(path, offset=None, chunk_size=65536, calibrated=True):
+    """Reads a recording (optionally gzipped) from a byte offset.
+
+    Args:
+        path (str): ``.csv``, ``.bin``, ``.csv.gz`` or ``.bin.gz`` file.
+        offset (int): Byte offset of a record or row in the uncompressed
+            file (a seek point). None starts at the first sample.
+        chunk_size (int): Samples per chunk (approximate for CSV).
+        calibrated (bool): Apply the offsets and calibration matrix of a
+            binary header. False yields plain counts / scale factor, to
+            calibrate them differently. CSV values and binary files with
+            ``calibrated`` in the header are always as written.
+
+    Yields:
+        tuple: (byte offset of the chunk, timestamps, (N, 3) acceleration
+        in g with the calibration of the recording, temperatures).
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        if file_format(path) == "bin":
+            meta, data_offset = read_header(f)
+            if not calibrated:
+                meta = dict(meta, offsets=None)
+            position = max(offset or 0, data_offset)
+            f.seek(position)
+            while True:
+                data = f.read(chunk_size * RECORD_DTYPE.itemsize)
+                n = len(data) // RECORD_DTYPE.itemsize
+                if not n:
+                    return
+                records = np.frombuffer(data, dtype=RECORD_DTYPE, count=n)
+                yield position, records["timestamp"], raw_to_g(records["raw"], meta, calibrated), records["temp"]
+                position += n * RECORD_DTYPE.itemsize
+        else:
+            if not f.readline().startswith(CSV_HEADER[:9].encode()):
+                raise ValueError(f"{path} is not an accelerometer CSV recording")
+            position = max(offset or 0, f.tell())
+            f.seek(position)
+            while True:
+                lines = f.readlines(chunk_size * 48)  # ~48 bytes por fila
+                if not lines:
+                    return
+                size = sum(len(line) for line in lines)
+                # Una última fila cortada (archivo sin cerrar) se descarta
+                rows = [line.decode("ascii") for line in lines if line.endswith(b"\n") and line.strip()]
+                if rows:
+                    timestamp, values = parse_csv_rows(rows)
+                    yield position, timestamp, values[:, :3], values[:, 3]
+                position += size
+
+
+class FileIndexer:
+    """
+    Accumulates the catalog entry of a file while it is written.
+
+    Call ``update`` with every batch right before writing it, passing the
+    byte position of the writer (``CsvWriter.position`` /
+    ``BinaryWriter.position``).
+
+    Args:
+        path (str): File being written.
+        file_format (str): ``csv`` or ``bin``.
+        meta (dict): Acquisition settings (range, odr, scale_factor,
+            offsets, matriz_calibracion...), as in binary headers.
+        seek_interval (float): Seconds of data between seek points.
+    """
+
+    def __init__(self, path, file_format, meta=None, seek_interval=SEEK_INTERVAL):
+        self.path = path
+        self.file_format = file_format
+        self.meta = dict(meta or {})
+        self.seek_interval = seek_interval
+        self.samples = 0
+        self.t_start = None
+        self.t_end = None
+        self.seek_points = []
+        self._next_point = -math.inf
+        self._sum = np.zeros(3)
+        self._sumsq = np.zeros(3)
+        self._min = np.full(3, np.inf)
+        self._max = np.full(3, -np.inf)
+
+    def update(self, offset, timestamp, xyz):
+        """Adds a batch that is about to be written at byte ``offset``."""
+        n = len(timestamp)
+        if not n:
+            return
+        t0 = float(timestamp[0])
+        if t0 >= self._next_point:
+            self.seek_points.append((t0, int(offset)))
+            self._next_point = t0 + self.seek_interval
+        values = np.asarray(xyz, dtype=np.float64)
+        self._sum += values.sum(axis=0)
+        self._sumsq += np.einsum("ij,ij->j", values, values)
+        np.minimum(self._min, values.min(axis=0), out=self._min)
+        np.maximum(self._max, values.max(axis=0), out=self._max)
+        if self.t_start is None:
+            self.t_start = t0
+        self.t_end = float(timestamp[-1])
+        self.samples += n
+
+    def entry(self):
+        """Catalog row of the file as written so far (dict keyed by column)."""
+        meta = self.meta
+        entry = {
+            "path": self.path,
+            "format": self.file_format,
+            "t_start": self.t_start,
+            "t_end": self.t_end,
+            "samples": self.samples,
+            "odr": meta.get("odr"),
+            "odr_hz": meta.get("odr_hz"),
+            "range": meta.get("range"),
+            "scale_factor": meta.get("scale_factor"),
+            "offsets": json.dumps(meta.get("offsets")),
+            "matriz_calibracion": json.dumps(meta.get("matriz_calibracion")),
+            "promedio_muestras": meta.get("promedio_muestras"),
+            "bytes": os.path.getsize(self.path) if os.path.exists(self.path) else None,
+        }
+        count = max(self.samples, 1)
+        mean, rms = self._sum / count, np.sqrt(self._sumsq / count)
+        for i, axis in enumerate(AXES):
+            values = (self._min[i], self._max[i], mean[i], rms[i]) if self.samples else (None,) * 4
+            for stat, value in zip(STATS, values):
+                entry[f"{axis}_{stat}"] = None if value is None else float(value)
+        return entry
+
+
+class RecordingCatalog:
+    """
+    SQLite index of recording files, safe to use from several threads.
+
+    Args:
+        path (str): Database file. It only holds derived data: an
+            incompatible one is rebuilt empty (``scan`` fills it again).
+    """
+
+    def __init__(self, path="data/catalogo.sqlite"):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            if self._db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                self._db.execute("DROP TABLE IF EXISTS recordings")
+                self._db.execute("DROP TABLE IF EXISTS seek_points")
+            stats = ", ".join(f"{column} REAL" for column in _STAT_COLUMNS)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS recordings (path TEXT PRIMARY KEY, format TEXT, t_start REAL,"
+                " t_end REAL, samples INTEGER, odr INTEGER, odr_hz REAL, range INTEGER, scale_factor REAL,"
+                f" offsets TEXT, matriz_calibracion TEXT, promedio_muestras INTEGER, bytes INTEGER, {stats})")
+            self._db.execute("CREATE INDEX IF NOT EXISTS recordings_time ON recordings (t_start, t_end)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS seek_points (path TEXT, timestamp REAL, offset INTEGER,"
+                " PRIMARY KEY (path, timestamp)) WITHOUT ROWID")
+            self._db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        self._update_gauge()
+
+    def add(self, indexer):
+        """Registers (or replaces) the file described by a ``FileIndexer``."""
+        if not indexer.samples:
+            return
+        entry = indexer.entry()
+        placeholders = ", ".join("?" for _ in _COLUMNS)
+        with self._lock, self._db:
+            self._db.execute(f"INSERT OR REPLACE INTO recordings ({', '.join(_COLUMNS)}) VALUES ({placeholders})",
+                             [entry[column] for column in _COLUMNS])
+            self._db.execute("DELETE FROM seek_points WHERE path = ?", (indexer.path,))
+            self._db.executemany("INSERT OR REPLACE INTO seek_points VALUES (?, ?, ?)",
+                                 [(indexer.path, t, offset) for t, offset in indexer.seek_points])
+        self._update_gauge()
+
+    def rename(self, old_path, new_path):
+        """Follows a file that was renamed (e.g. gzipped); seek points stay valid."""
+        size = os.path.getsize(new_path) if os.path.exists(new_path) else None
+        with self._lock, self._db:
+            self._db.execute("UPDATE recordings SET path = ?, bytes = ? WHERE path = ?", (new_path, size, old_path))
+            self._db.execute("UPDATE seek_points SET path = ? WHERE path = ?", (new_path, old_path))
+
+    def remove(self, path):
+        """Drops a file from the catalog (the file itself is not touched)."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM recordings WHERE path = ?", (path,))
+            self._db.execute("DELETE FROM seek_points WHERE path = ?", (path,))
+        self._update_gauge()
+
+    def files(self, t_start=None, t_end=None):
+        """Catalogued files overlapping [t_start, t_end], oldest first.
+
+        Returns:
+            list: Dicts with the file columns; ``offsets`` and
+            ``matriz_calibracion`` decoded and the statistics grouped as
+            ``stats[axis][min|max|mean|rms]``.
+        """
+        t_start = -math.inf if t_start is None else t_start
+        t_end = math.inf if t_end is None else t_end
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM recordings WHERE t_end >= ? AND t_start <= ? ORDER BY t_start, path",
+                (t_start, t_end)).fetchall()
+        result = []
+        for row in rows:
+            entry = {column: row[column] for column in _COLUMNS if column not in _STAT_COLUMNS}
+            entry["offsets"] = json.loads(entry["offsets"] or "null")
+            entry["matriz_calibracion"] = json.loads(entry["matriz_calibracion"] or "null")
+            entry["stats"] = {axis: {stat: row[f"{axis}_{stat}"] for stat in STATS} for axis in AXES}
+            result.append(entry)
+        return result
+
+    def seek_offset(self, path, t):
+        """Byte offset of the last seek point at or before ``t`` (None = start of file)."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT offset FROM seek_points WHERE path = ? AND timestamp <= ? ORDER BY timestamp DESC LIMIT 1",
+                (path, t)).fetchone()
+        return None if row is None else row[0]
+
+    def read(self, t_start, t_end, chunk_size=65536):
+        """Yields the samples in [t_start, t_end] of every overlapping file, in time order.
+
+        Only the files whose span overlaps the range are opened, and each
+        one is entered at its last seek point before the range. Files that
+        overlap in time (a manual recording during continuous logging) are
+        not repeated: samples not newer than the last one yielded are
+        skipped (within ``DUPLICATE_TOLERANCE``). Files that no longer exist are dropped from the catalog.
+
+        Yields:
+            dict: ``timestamp``, ``x``, ``y``, ``z`` and ``temp`` arrays,
+            like ``RingBuffer.iter_range``.
+        """
+        began = time.perf_counter()
+        last = -math.inf
+        for entry in self.files(t_start, t_end):
+            path = entry["path"]
+            if entry["t_end"] <= last + DUPLICATE_TOLERANCE:
+                continue
+            try:
+                for _, timestamp, xyz, temp in read_chunks(path, self.seek_offset(path, max(t_start, last)),
+                                                           chunk_size):
+                    if timestamp[0] > t_end:
+                        break
+                    keep = (timestamp >= t_start) & (timestamp <= t_end) & (timestamp > last + DUPLICATE_TOLERANCE)
+                    if keep.any():
+                        yield {
+                            "timestamp": timestamp[keep],
+                            "x": xyz[keep, 0],
+                            "y": xyz[keep, 1],
+                            "z": xyz[keep, 2],
+                            "temp": temp[keep],
+                        }
+                        last = float(timestamp[keep][-1])
+                    if timestamp[-1] > t_end:
+                        break
+            except FileNotFoundError:
+                self.remove(path)
+        CATALOG_READ_SECONDS.observe(time.perf_counter() - began)
+
+    def index_file(self, path):
+        """Reads a whole file once and registers it.
+
+        Raises:
+            ValueError: If the file is not a recording.
+        """
+        indexer = FileIndexer(path, file_format(path), read_meta(path))
+        for offset, timestamp, xyz, _ in read_chunks(path, chunk_size=4096):
+            indexer.update(offset, timestamp, xyz)
+        self.add(indexer)
+        return indexer.samples
+
+    def scan(self, directories):
+        """Indexes files not yet in the catalog and forgets files that are gone.
+
+        Args:
+            directories (list): Directories to look in (not recursive).
+
+        Returns:
+            int: Number of files added.
+        """
+        with self._lock:
+            known = {row[0] for row in self._db.execute("SELECT path FROM recordings")}
+        found = set()
+        added = 0
+        for directory in directories:
+            try:
+                names = sorted(os.listdir(directory))
+            except FileNotFoundError:
+                continue
+            for name in names:
+                path = os.path.join(directory, name)
+                if not name.endswith(EXTENSIONS) or not os.path.isfile(path):
+                    continue
+                found.add(path)
+                if path in known:
+                    continue
+                try:
+                    if self.index_file(path):
+                        added += 1
+                except (OSError, ValueError, EOFError) as e:
+                    print(f"No se pudo catalogar {path}: {e}")
+        for path in known - found:
+            if not os.path.exists(path):
+                self.remove(path)
+        return added
+
+    def status(self):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*), SUM(samples), SUM(bytes), MIN(t_start), MAX(t_end) FROM recordings").fetchone()
+        return {"path": self.path, "files": row[0], "samples": row[1] or 0, "bytes": row[2] or 0,
+                "span": None if row[3] is None else [row[3], row[4]]}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _update_gauge(self):
+        with self._lock:
+            CATALOG_FILES.set(self._db.execute("SELECT COUNT(*) FROM recordings").fetchone()[0])
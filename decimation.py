@@ -0,0 +1,60 @@
+"""Min/max envelope decimation of the history buffer for chart rendering.
+
+Buckets are fixed time intervals, so the envelope can be accumulated chunk by
+chunk over ``RingBuffer.iter_range`` views: the history is never copied and
+``buffer_lock`` is only taken to snapshot indexes.
+"""
+import numpy as np
+
+
+def minmax_envelope(chunks, t_start, t_end, n_buckets, columns=("x", "y", "z")):
+    """Reduces samples in [t_start, t_end] to per-bucket min/max envelopes.
+
+    Args:
+        chunks (iterable): Dicts of column arrays (``timestamp`` plus
+            ``columns``) in time order, e.g. from ``RingBuffer.iter_range``.
+        t_start (float): Start of the first bucket.
+        t_end (float): End of the last bucket (samples at ``t_end`` are
+            included).
+        n_buckets (int): Number of buckets (the pixel budget).
+        columns (tuple): Columns to reduce.
+
+    Returns:
+        dict: ``timestamp`` (bucket centers), ``count`` and ``<col>_min`` /
+        ``<col>_max`` arrays, with empty buckets removed.
+    """
+    edges = np.linspace(t_start, t_end, n_buckets + 1)
+    count = np.zeros(n_buckets, dtype=np.int64)
+    lows = {col: np.full(n_buckets, np.inf) for col in columns}
+    highs = {col: np.full(n_buckets, -np.inf) for col in columns}
+
+    for chunk in chunks:
+        ts = chunk["timestamp"]
+        if not len(ts):
+            continue
+        # Límites de cada bucket dentro del bloque; el último incluye t_end
+        bounds = np.searchsorted(ts, edges)
+        bounds[-1] = np.searchsorted(ts, t_end, side="right")
+        first = max(int(np.searchsorted(bounds, 0, side="right")) - 1, 0)
+        last = min(int(np.searchsorted(bounds, len(ts), side="left")), n_buckets)
+        starts = bounds[first:last]
+        sizes = np.diff(bounds[first:last + 1])
+        nonempty = sizes > 0
+        if not nonempty.any():
+            continue
+        idx = np.arange(first, last)[nonempty]
+        starts = starts[nonempty]
+        count[idx] += sizes[nonempty]
+        for col in columns:
+            values = chunk[col]
+            # idx no se repite dentro de un bloque: alcanza con indexado simple
+            lows[col][idx] = np.minimum(lows[col][idx], np.minimum.reduceat(values, starts))
+            highs[col][idx] = np.maximum(highs[col][idx], np.maximum.reduceat(values, starts))
+
+    keep = count > 0
+    centers = (edges[:-1] + edges[1:]) / 2
+    result = {"timestamp": centers[keep], "count": count[keep]}
+    for col in columns:
+        result[f"{col}_min"] = lows[col][keep]
+        result[f"{col}_max"] = highs[col][keep]
+    return result
@@ -0,0 +1,209 @@
+"""Persistent history: a ``RingBuffer`` stored in a memory-mapped file.
+
+``RingBuffer`` already keeps its state (oldest and next sequence numbers)
+in the same buffer as the columns, so mapping a preallocated file instead
+of RAM is enough for the history to survive restarts: on startup the
+header is read back and writing resumes where it stopped. The file is
+sized for hours of samples and the page cache decides what stays in RAM,
+so the history is not limited by memory.
+
+``DiskHistory`` is the batch consumer that fills it. Batches are queued
+and appended by a background thread in bulk (one ``append_batch`` per
+``flush_interval``), so page faults and writeback on a slow SD card never
+stall the acquisition dispatch.
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+import metrics
+from ring_buffer import COLUMNS, RingBuffer
+
+DISK_SAMPLES = metrics.REGISTRY.counter(
+    "adxl355_disk_history_samples_total", "Samples appended to the disk history")
+DISK_WRITE_SECONDS = metrics.REGISTRY.histogram(
+    "adxl355_disk_history_write_seconds", "Time per bulk append to the disk history")
+DISK_PENDING = metrics.REGISTRY.gauge(
+    "adxl355_disk_history_pending_samples", "Samples waiting to be appended to the disk history")
+
+# Preámbulo: identificador, versión, capacidad y huella de las columnas
+MAGIC = b"ADXLRING"
+VERSION = 1
+_PREAMBLE = struct.Struct("<8sIIq32s")
+PREAMBLE_BYTES = 64
+
+
+def _layout_signature():
+    return repr(COLUMNS).encode()[:32].ljust(32, b"\0")
+
+
+class DiskRingBuffer(RingBuffer):
+    """
+    ``RingBuffer`` backed by a preallocated, memory-mapped file.
+
+    An existing file with the same capacity and column layout is attached
+    (head and tail are recovered from its header). A file that does not
+    match is renamed to ``<path>.old`` and a new one is created.
+
+    Args:
+        path (str): File holding the ring.
+        capacity (int): Number of samples kept.
+    """
+
+    def __init__(self, path, capacity):
+        capacity = int(capacity)
+        size = PREAMBLE_BYTES + self.nbytes(capacity)
+        expected = _PREAMBLE.pack(MAGIC, VERSION, 0, capacity, _layout_signature())
+        if os.path.exists(path) and not self._matches(path, size, expected):
+            print(f"El histórico en disco {path} no coincide con la configuración; se renombra a {path}.old")
+            os.replace(path, path + ".old")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < size:
+                # Reserva real de bloques: escribir en un mmap de un archivo
+                # disperso con el disco lleno termina en SIGBUS
+                if hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(fd, 0, size)
+                else:
+                    os.ftruncate(fd, size)
+            self._mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.path = path
+        self._mmap[:_PREAMBLE.size] = expected
+        super().__init__(capacity, memoryview(self._mmap)[PREAMBLE_BYTES:])
+
+    @staticmethod
+    def _matches(path, size, expected):
+        with open(path, "rb") as f:
+            head = f.read(_PREAMBLE.size)
+        return os.path.getsize(path) == size and head == expected
+
+    def flush(self):
+        """Writes dirty pages to disk (``msync``)."""
+        self._mmap.flush()
+
+    def close(self):
+        """Flushes and unmaps the file. The ring can no longer be used."""
+        if self._mmap is None:
+            return
+        self.flush()
+        # Las vistas de numpy tienen que soltarse antes de cerrar el mapeo
+        self.columns = {}
+        self._state = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+        self._mmap = None
+
+
+class DiskHistory:
+    """
+    Batch consumer that appends acquisition batches to a ``DiskRingBuffer``.
+
+    Args:
+        path (str): Ring file.
+        capacity (int): Samples kept in the file.
+        flush_interval (float): Seconds between bulk appends.
+        sync_interval (float): Seconds between ``msync`` calls (the kernel
+            also writes dirty pages back on its own).
+        max_pending (int): Samples queued before new batches are dropped
+            (the disk fell behind).
+    """
+
+    def __init__(self, path, capacity, flush_interval=0.5, sync_interval=60.0, max_pending=4_000_000):
+        self.ring = DiskRingBuffer(path, capacity)
+        self.flush_interval = flush_interval
+        self.sync_interval = sync_interval
+        self.max_pending = max_pending
+        self.pending = []
+        self.pending_samples = 0
+        self.dropped_samples = 0
+        self._cleared = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._writer, name="disk-history", daemon=True)
+        self._thread.start()
+
+    def ingest(self, batch):
+        """Consumer for acquisition batches. Never blocks on disk."""
+        n = len(batch["timestamp"])
+        if not n:
+            return
+        with self._lock:
+            if self.pending_samples + n > self.max_pending:
+                self.dropped_samples += n
+                return
+            self.pending.append((batch["timestamp"], batch["xyz"], batch["temp"], batch.get("raw")))
+            self.pending_samples += n
+
+    def clear(self):
+        """Discards the history on disk and what is pending (applied by the writer thread)."""
+        with self._lock:
+            self.pending = []
+            self.pending_samples = 0
+            self._cleared = True
+
+    def status(self):
+        ring = self.ring
+        oldest = ring.oldest_timestamp()
+        return {
+            "path": ring.path,
+            "capacity": ring.capacity,
+            "samples": len(ring),
+            "span": None if oldest is None else [oldest, float(ring.last_timestamp)],
+            "pending": self.pending_samples,
+            "dropped": self.dropped_samples,
+        }
+
+    def close(self):
+        """Writes what is pending, syncs and closes the file."""
+        self._stop.set()
+        self._thread.join()
+        self.ring.close()
+
+    def _take(self):
+        with self._lock:
+            pending, self.pending = self.pending, []
+            self.pending_samples = 0
+            cleared, self._cleared = self._cleared, False
+        if cleared:
+            # Sólo en este hilo, así no se cruza con un append en curso
+            self.ring.clear()
+        return pending
+
+    def _append(self, pending):
+        if not pending:
+            return
+        began = time.perf_counter()
+        n = [len(ts) for ts, _, _, _ in pending]
+        timestamp = np.concatenate([ts for ts, _, _, _ in pending])
+        xyz = np.concatenate([values for _, values, _, _ in pending])
+        temp = np.concatenate([np.broadcast_to(t, (k,)) for (_, _, t, _), k in zip(pending, n)])
+        raw = np.concatenate([
+            r if r is not None else np.zeros((k, 3), dtype=np.int32)
+            for (_, _, _, r), k in zip(pending, n)
+        ])
+        self.ring.append_batch(timestamp, xyz, temp, raw)
+        DISK_SAMPLES.inc(len(timestamp))
+        DISK_WRITE_SECONDS.observe(time.perf_counter() - began)
+
+    def _writer(self):
+        last_sync = time.monotonic()
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self._append(self._take())
+                DISK_PENDING.set(self.pending_samples)
+                if time.monotonic() - last_sync >= self.sync_interval:
+                    self.ring.flush()
+                    last_sync = time.monotonic()
+            except Exception as e:
+                print(f"Error al escribir el histórico en disco: {e}")
+        self._append(self._take())
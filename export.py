@@ -0,0 +1,270 @@
+"""Background export of time ranges to downloadable files.
+
+``ExportQueue`` runs export jobs on a small pool of worker threads, so a
+request only enqueues a job and returns its id; progress and the finished
+file are then polled with the id. Each job pulls its data from a source
+callable, normally the history buffers (``RingBuffer.iter_range`` only
+takes the lock to snapshot indexes) followed by the recorded files of the
+catalog, so formatting a long export never holds ``buffer_lock`` and
+several exports can run at once without touching each other or the
+acquisition thread.
+"""
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+import metrics
+from binary_format import BinaryWriter
+from recorder import CsvWriter
+
+EXPORT_JOBS = metrics.REGISTRY.counter(
+    "adxl355_export_jobs_total", "Export jobs finished (any outcome)")
+EXPORT_SAMPLES = metrics.REGISTRY.counter(
+    "adxl355_export_samples_total", "Samples written by export jobs")
+EXPORT_SECONDS = metrics.REGISTRY.histogram(
+    "adxl355_export_job_seconds", "Time to run one export job")
+
+FORMATS = ("csv", "bin")
+DEFAULT_SCALE_FACTOR = 256000
+COLUMNS = ("timestamp", "x", "y", "z", "temp")
+
+
+def export_range(chunks, path, file_format, t_start, t_end, meta=None, progress=None, cancelled=None):
+    """Writes chunks of samples to a file.
+
+    Binary exports hold the values as they were exported (already
+    calibrated), stored as counts of ``meta['scale_factor']``; the header
+    says ``calibrated: true`` and has no offsets or calibration matrix, so
+    readers do not apply a calibration twice.
+
+    Args:
+        chunks (iterable): Dicts with ``timestamp``, ``x``, ``y``, ``z`` and
+            ``temp`` arrays in time order (``RingBuffer.iter_range`` or
+            ``RecordingCatalog.read``).
+        path (str): Output file.
+        file_format (str): ``csv`` or ``bin``.
+        t_start (float): Start of the range (for progress).
+        t_end (float): End of the range (for progress).
+        meta (dict): Header fields of binary files (range, odr...).
+        progress (callable): Called with the fraction of the range written.
+        cancelled (callable): Returns True to stop early.
+
+    Returns:
+        int: Samples written.
+    """
+    meta = dict(meta or {}, offsets=None, matriz_calibracion=None, calibrated=True)
+    scale_factor = float(meta.get("scale_factor") or DEFAULT_SCALE_FACTOR)
+    meta["scale_factor"] = scale_factor
+    output = BinaryWriter(path, meta) if file_format == "bin" else CsvWriter(path)
+    written = 0
+    try:
+        for chunk in chunks:
+            if cancelled is not None and cancelled():
+                break
+            # Copia inmediata: las vistas del buffer se pueden pisar mientras se formatea
+            timestamp, x, y, z, temp = (np.array(chunk[name]) for name in COLUMNS)
+            if not len(timestamp):
+                continue
+            xyz = np.column_stack((x, y, z))
+            if file_format == "bin":
+                output.write(timestamp, np.rint(xyz * scale_factor).astype(np.int32), temp)
+            else:
+                output.write(timestamp, xyz, temp)
+            written += len(timestamp)
+            if progress is not None and t_end > t_start:
+                progress(min(max((float(timestamp[-1]) - t_start) / (t_end - t_start), 0.0), 1.0))
+    finally:
+        output.close()
+    return written
+
+
+class ExportJob:
+    """
+    One export: a time range, a format and the state of its file.
+
+    States: ``queued``, ``running``, ``done``, ``error`` and ``cancelled``.
+    """
+
+    def __init__(self, job_id, path, file_format, t_start, t_end):
+        self.id = job_id
+        self.path = path
+        self.file_format = file_format
+        self.t_start = t_start
+        self.t_end = t_end
+        self.state = "queued"
+        self.progress = 0.0
+        self.samples = 0
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+        self._cancel = threading.Event()
+
+    @property
+    def filename(self):
+        return os.path.basename(self.path)
+
+    def status(self):
+        return {
+            "id": self.id,
+            "state": self.state,
+            "progress": round(self.progress, 4),
+            "samples": self.samples,
+            "format": self.file_format,
+            "start": self.t_start,
+            "end": self.t_end,
+            "file": self.filename,
+            "bytes": os.path.getsize(self.path) if self.state == "done" and os.path.exists(self.path) else None,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class ExportQueue:
+    """
+    Pool of worker threads that run export jobs.
+
+    Args:
+        directory (str): Where export files are written.
+        workers (int): Jobs run at the same time.
+        keep (int): Finished jobs remembered; the files of older ones are
+            deleted.
+    """
+
+    def __init__(self, directory="data/exportaciones", workers=2, keep=20):
+        self.directory = directory
+        self.keep = keep
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+
+    def submit(self, source, t_start, t_end, file_format="csv", base_name="exportacion", meta=None):
+        """Enqueues an export of [t_start, t_end].
+
+        Args:
+            source (callable): Called in the worker with (t_start, t_end);
+                returns the chunks to write (see ``export_range``).
+            t_start (float): Start of the range (unix time).
+            t_end (float): End of the range.
+            file_format (str): ``csv`` or ``bin``.
+            base_name (str): File name prefix.
+            meta (dict): Header fields of binary files.
+
+        Returns:
+            ExportJob: The queued job.
+
+        Raises:
+            ValueError: If the format or the range is not valid.
+        """
+        if file_format not in FORMATS:
+            raise ValueError(f"Unknown export format: {file_format}")
+        if not t_end > t_start:
+            raise ValueError("end must be after start")
+        os.makedirs(self.directory, exist_ok=True)
+        job_id = secrets.token_hex(6)
+        name = datetime.fromtimestamp(t_start).strftime("%y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"{base_name}_{name}_{job_id}.{file_format}")
+        job = ExportJob(job_id, path, file_format, float(t_start), float(t_end))
+        with self._lock:
+            self._jobs[job_id] = job
+            self._prune()
+            job.future = self._pool.submit(self._run, job, source, dict(meta or {}))
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        """Status of the known jobs, newest first."""
+        with self._lock:
+            jobs = sorted(self._jobs.values(), key=lambda job: job.created, reverse=True)
+        return [job.status() for job in jobs]
+
+    def cancel(self, job_id):
+        """Cancels a queued or running job, or deletes a finished one and its file.
+
+        Returns:
+            bool: False if the job is unknown.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            if job.state in ("queued", "running"):
+                job._cancel.set()
+                if job.future.cancel():  # Todavía no había empezado
+                    self._finish(job, "cancelled")
+                return True
+            del self._jobs[job_id]
+        self._remove_file(job.path)
+        return True
+
+    def close(self):
+        """Cancels pending jobs and stops the workers after the running ones notice."""
+        with self._lock:
+            for job in self._jobs.values():
+                job._cancel.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job, source, meta):
+        with self._lock:
+            if job._cancel.is_set():
+                self._finish(job, "cancelled")
+                return
+            job.state = "running"
+            job.started = time.time()
+
+        def progress(fraction):
+            job.progress = fraction
+
+        try:
+            job.samples = export_range(source(job.t_start, job.t_end), job.path, job.file_format,
+                                       job.t_start, job.t_end, meta, progress, job._cancel.is_set)
+        except Exception as e:
+            job.error = str(e)
+            print(f"Error en la exportación {job.id}: {e}")
+        with self._lock:
+            if job._cancel.is_set():
+                self._finish(job, "cancelled")
+            elif job.error is not None:
+                self._finish(job, "error")
+            elif job.samples == 0:
+                job.error = "No hay datos en el intervalo"
+                self._finish(job, "error")
+            else:
+                job.progress = 1.0
+                self._finish(job, "done")
+        EXPORT_SAMPLES.inc(job.samples)
+        EXPORT_SECONDS.observe(job.finished - job.started)
+
+    def _finish(self, job, state):
+        job.state = state
+        job.finished = time.time()
+        if job.started is None:
+            job.started = job.finished
+        if state != "done":
+            self._remove_file(job.path)
+        EXPORT_JOBS.inc()
+
+    def _prune(self):
+        finished = sorted((job for job in self._jobs.values() if job.finished is not None),
+                          key=lambda job: job.finished)
+        for job in finished[:max(len(finished) - self.keep, 0)]:
+            del self._jobs[job.id]
+            self._remove_file(job.path)
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
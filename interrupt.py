@@ -1,8 +1,13 @@
-import gpiod
-from gpiod.line import Direction, Edge, Bias
+try:
+    import gpiod
+    from gpiod.line import Direction, Edge, Bias
+except ImportError:  # Sin libgpiod (p.ej. en modo simulación, ver simulation.py)
+    gpiod = None
 
 class GPIOInterrupt:
     def __init__(self, chip="/dev/gpiochip0", pin=25):
+        if gpiod is None:
+            raise RuntimeError("gpiod no está instalado")
         self.chip = chip
         self.pin = pin
         self.gpio = gpiod.request_lines(
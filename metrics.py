@@ -0,0 +1,243 @@
+"""Lightweight counters, gauges and histograms exposed in Prometheus format.
+
+The acquisition hot path only does a few float additions per batch, so the
+instruments can stay enabled in production. Each process has its own
+``REGISTRY``; the acquisition process sends ``snapshot()`` over its control
+channel and the web process renders both with ``render``.
+"""
+import bisect
+import threading
+import time
+
+# Buckets por defecto (segundos): de 10 µs a 1 s
+LATENCY_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 1.0)
+
+
+class Counter:
+    """Monotonically increasing value."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return {"value": self.value}
+
+
+class Gauge:
+    """Value that can go up and down (last value wins)."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0.0
+        self.updated = False
+
+    def set(self, value):
+        self.value = float(value)
+        self.updated = True
+
+    def snapshot(self):
+        return {"value": self.value, "updated": self.updated}
+
+
+class Histogram:
+    """Cumulative histogram with fixed upper bounds, as Prometheus expects."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # El último es +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            return {"buckets": self.buckets, "counts": list(self.counts), "sum": self.sum}
+
+
+class MetricsRegistry:
+    """Named set of instruments. Asking twice for a name returns the same one."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, *args):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name, help_text=""):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text=""):
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name, help_text="", buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets)
+
+    def reset(self):
+        """Zeroes every instrument (e.g. in a freshly forked process)."""
+        with self._lock:
+            for metric in self._metrics.values():
+                if isinstance(metric, Histogram):
+                    metric.counts = [0] * len(metric.counts)
+                    metric.sum = 0.0
+                else:
+                    metric.value = 0.0
+                    metric.updated = False
+
+    def snapshot(self):
+        """Returns a picklable copy of every instrument.
+
+        Returns:
+            dict: name -> {"kind", "help", plus the instrument values}.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: dict(m.snapshot(), kind=m.kind, help=m.help) for m in metrics}
+
+
+REGISTRY = MetricsRegistry()
+
+
+def merge_snapshots(snapshots):
+    """Combines snapshots of several processes.
+
+    Counters and histograms add up; gauges keep the value of the last
+    snapshot where they were set.
+
+    Args:
+        snapshots (iterable): Results of ``MetricsRegistry.snapshot``.
+
+    Returns:
+        dict: A single snapshot.
+    """
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            current = merged.get(name)
+            if current is None:
+                merged[name] = dict(metric, counts=list(metric["counts"])) if "counts" in metric else dict(metric)
+            elif metric["kind"] == "counter":
+                current["value"] += metric["value"]
+            elif metric["kind"] == "histogram" and current["buckets"] == metric["buckets"]:
+                current["counts"] = [a + b for a, b in zip(current["counts"], metric["counts"])]
+                current["sum"] += metric["sum"]
+            elif metric.get("updated", True):
+                current.update(metric)
+    return merged
+
+
+def _format_value(value):
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def render(snapshot):
+    """Formats a snapshot in the Prometheus text exposition format (0.0.4).
+
+    Args:
+        snapshot (dict): Result of ``MetricsRegistry.snapshot`` or
+            ``merge_snapshots``.
+
+    Returns:
+        str: Text for a ``/metrics`` response.
+    """
+    lines = []
+    for name in sorted(snapshot):
+        metric = snapshot[name]
+        if metric["help"]:
+            lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        if metric["kind"] == "histogram":
+            cumulative = 0
+            for bound, count in zip(metric["buckets"], metric["counts"]):
+                cumulative += count
+                lines.append(f'{name}_bucket{{le="{bound:g}"}} {cumulative}')
+            cumulative += metric["counts"][-1]
+            lines.append(f'{name}_bucket{{le="+Inf"}} {cumulative}')
+            lines.append(f"{name}_sum {_format_value(metric['sum'])}")
+            lines.append(f"{name}_count {cumulative}")
+        else:
+            lines.append(f"{name} {_format_value(metric['value'])}")
+    return "\n".join(lines) + "\n"
+
+
+class InstrumentedLock:
+    """Lock wrapper that records wait and hold times in two histograms.
+
+    Drop-in replacement for ``threading.Lock`` in ``with`` statements, e.g.
+    ``RingBuffer.lock``.
+    """
+
+    def __init__(self, lock, wait, hold):
+        self.lock = lock
+        self.wait = wait
+        self.hold = hold
+        self._acquired_at = 0.0
+
+    def acquire(self, blocking=True, timeout=-1):
+        start = time.perf_counter()
+        acquired = self.lock.acquire(blocking, timeout)
+        if acquired:
+            self._acquired_at = time.perf_counter()
+            self.wait.observe(self._acquired_at - start)
+        return acquired
+
+    def release(self):
+        self.hold.observe(time.perf_counter() - self._acquired_at)
+        self.lock.release()
+
+    def locked(self):
+        return self.lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def instrument_buffer_lock(buffer, registry=REGISTRY):
+    """Wraps ``buffer.lock`` so its wait/hold times show up in ``registry``.
+
+    Args:
+        buffer (RingBuffer): Buffer whose lock is replaced (once).
+
+    Returns:
+        InstrumentedLock: The new lock.
+    """
+    if not isinstance(buffer.lock, InstrumentedLock):
+        buffer.lock = InstrumentedLock(
+            buffer.lock,
+            registry.histogram("adxl355_buffer_lock_wait_seconds", "Time waiting to acquire buffer_lock"),
+            registry.histogram("adxl355_buffer_lock_hold_seconds", "Time buffer_lock is held"),
+        )
+    return buffer.lock
@@ -0,0 +1,111 @@
+"""Sampling profiler that can be switched on in a running process.
+
+A daemon thread periodically grabs the stack of every other thread with
+``sys._current_frames`` and counts them. Nothing is traced between samples,
+so the overhead stays low enough to use it on the Raspberry while
+acquiring. The report is in "folded stacks" format (one line per stack,
+frames separated by ``;``), ready for flamegraph.pl or speedscope.
+"""
+import collections
+import os
+import sys
+import threading
+import time
+
+
+class SamplingProfiler:
+    """
+    Periodic stack sampler for all threads of the current process.
+
+    Args:
+        interval (float): Seconds between samples.
+        max_depth (int): Frames kept per stack (innermost ones).
+    """
+
+    def __init__(self, interval=0.005, max_depth=40):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self.started_at = None
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None):
+        """Starts sampling (clears previous results). Returns ``status()``."""
+        if interval is not None:
+            self.interval = max(float(interval), 0.0005)
+        if not self.running:
+            with self._lock:
+                self.stacks.clear()
+                self.samples = 0
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        return self.status()
+
+    def stop(self):
+        """Stops sampling and keeps the results. Returns ``status()``."""
+        if self.running:
+            self._stop.set()
+            self._thread.join()
+        return self.status()
+
+    def status(self):
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "samples": self.samples,
+            "started_at": self.started_at,
+            "pid": os.getpid(),
+        }
+
+    def folded(self):
+        """Returns the collected stacks as folded text (``a;b;c count``)."""
+        with self._lock:
+            items = self.stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+    def top(self, limit=20):
+        """Functions where most samples were taken (innermost frame).
+
+        Returns:
+            list: [{"function", "samples", "fraction"}] sorted by samples;
+            ``fraction`` is relative to all thread stacks sampled.
+        """
+        leaves = collections.Counter()
+        with self._lock:
+            for stack, count in self.stacks.items():
+                leaves[stack.rsplit(";", 1)[-1]] += count
+        total = max(sum(leaves.values()), 1)
+        return [
+            {"function": name, "samples": count, "fraction": count / total}
+            for name, count in leaves.most_common(limit)
+        ]
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, frame in frames.items():
+                    if ident == own:
+                        continue
+                    stack = []
+                    while frame is not None and len(stack) < self.max_depth:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                        frame = frame.f_back
+                    stack.append(names.get(ident, str(ident)))
+                    self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+
+PROFILER = SamplingProfiler()
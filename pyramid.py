@@ -0,0 +1,210 @@
+"""Multi-resolution summaries of the acceleration, maintained on ingest.
+
+Each level splits time into fixed buckets (1 ms, 10 ms, 100 ms, 1 s by
+default) and keeps, per axis, min, max, sum and sum of squares, so mean and
+RMS can be derived for any offset. Levels are rings of buckets sized for a
+retention much longer than the raw history. FIFO batches are accumulated
+and folded into every level with a handful of vectorized reductions once
+enough samples are pending (or when a query needs them), so the per-batch
+cost on the acquisition path is just a list append.
+"""
+import threading
+
+import numpy as np
+
+# (ancho del bucket en segundos, retención en segundos)
+DEFAULT_LEVELS = (
+    (0.001, 60),
+    (0.01, 10 * 60),
+    (0.1, 60 * 60),
+    (1.0, 24 * 60 * 60),
+)
+
+
+class SummaryLevel:
+    """
+    Ring of fixed-width time buckets with per-axis aggregates.
+    """
+
+    def __init__(self, width, retention):
+        self.width = width
+        self.capacity = int(round(retention / width))
+        self.ids = np.full(self.capacity, -1, dtype=np.int64)  # Bucket guardado en cada posición
+        self.count = np.zeros(self.capacity, dtype=np.int64)
+        self.min = np.zeros((self.capacity, 3), dtype=np.float32)
+        self.max = np.zeros((self.capacity, 3), dtype=np.float32)
+        self.sum = np.zeros((self.capacity, 3), dtype=np.float64)
+        self.sumsq = np.zeros((self.capacity, 3), dtype=np.float64)
+
+    def ingest(self, timestamp, xyz):
+        """Adds a batch of samples (timestamps must be non-decreasing)."""
+        ids = np.floor(timestamp / self.width).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        uid = ids[starts]
+        count = np.diff(np.r_[starts, len(ids)])
+        values = xyz.astype(np.float64)
+        mins = np.minimum.reduceat(xyz, starts, axis=0)
+        maxs = np.maximum.reduceat(xyz, starts, axis=0)
+        sums = np.add.reduceat(values, starts, axis=0)
+        sumsq = np.add.reduceat(values * values, starts, axis=0)
+        if len(uid) > self.capacity:
+            keep = slice(-self.capacity, None)
+            uid, count, mins, maxs, sums, sumsq = (a[keep] for a in (uid, count, mins, maxs, sums, sumsq))
+
+        pos = uid % self.capacity
+        same = self.ids[pos] == uid
+        # Buckets abiertos: se combinan con lo acumulado
+        p = pos[same]
+        self.count[p] += count[same]
+        self.min[p] = np.minimum(self.min[p], mins[same])
+        self.max[p] = np.maximum(self.max[p], maxs[same])
+        self.sum[p] += sums[same]
+        self.sumsq[p] += sumsq[same]
+        # Buckets nuevos: pisan lo que hubiera en esa posición del anillo
+        new = ~same
+        p = pos[new]
+        self.ids[p] = uid[new]
+        self.count[p] = count[new]
+        self.min[p] = mins[new]
+        self.max[p] = maxs[new]
+        self.sum[p] = sums[new]
+        self.sumsq[p] = sumsq[new]
+
+    def query(self, t_start, t_end):
+        """Returns the stored buckets overlapping [t_start, t_end], in time order.
+
+        Returns:
+            dict: ``ids``, ``count``, ``min``, ``max``, ``sum`` and ``sumsq``
+            arrays (copies).
+        """
+        first = int(np.floor(t_start / self.width))
+        last = int(np.floor(t_end / self.width))
+        first = max(first, last - self.capacity + 1)
+        wanted = np.arange(first, last + 1, dtype=np.int64)
+        pos = wanted % self.capacity
+        valid = self.ids[pos] == wanted
+        pos = pos[valid]
+        return {
+            "ids": wanted[valid],
+            "count": self.count[pos],
+            "min": self.min[pos],
+            "max": self.max[pos],
+            "sum": self.sum[pos],
+            "sumsq": self.sumsq[pos],
+        }
+
+
+def merge_buckets(buckets, factor):
+    """Merges the buckets of a query result into buckets ``factor`` times wider.
+
+    Groups are aligned to absolute time (bucket id // factor), like the
+    levels themselves, so missing buckets do not shift the ones after them.
+    """
+    if factor <= 1 or not len(buckets["ids"]):
+        return buckets
+    groups = buckets["ids"] // factor
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    return {
+        "ids": groups[starts] * factor,
+        "count": np.add.reduceat(buckets["count"], starts),
+        "min": np.minimum.reduceat(buckets["min"], starts, axis=0),
+        "max": np.maximum.reduceat(buckets["max"], starts, axis=0),
+        "sum": np.add.reduceat(buckets["sum"], starts, axis=0),
+        "sumsq": np.add.reduceat(buckets["sumsq"], starts, axis=0),
+    }
+
+
+class SummaryPyramid:
+    """
+    Set of summary levels updated together from every FIFO batch.
+    """
+
+    def __init__(self, levels=DEFAULT_LEVELS, flush_samples=1024):
+        self.levels = [SummaryLevel(width, retention) for width, retention in levels]
+        self.flush_samples = flush_samples
+        self.pending = []
+        self.pending_samples = 0
+        self.last_timestamp = None  # Muestra más nueva recibida (None si no hay)
+        self.lock = threading.Lock()
+
+    def ingest(self, batch):
+        """Consumer for acquisition batches (dict with ``timestamp`` and ``xyz``)."""
+        n = len(batch["timestamp"])
+        if not n:
+            return
+        with self.lock:
+            self.pending.append((batch["timestamp"], batch["xyz"]))
+            self.pending_samples += n
+            self.last_timestamp = float(batch["timestamp"][-1])
+            if self.pending_samples >= self.flush_samples:
+                self._flush()
+
+    def clear(self):
+        with self.lock:
+            self.pending = []
+            self.pending_samples = 0
+            self.last_timestamp = None
+            for level in self.levels:
+                level.ids[:] = -1
+
+    def _flush(self):
+        if not self.pending:
+            return
+        timestamp = np.concatenate([ts for ts, _ in self.pending])
+        xyz = np.concatenate([values for _, values in self.pending])
+        self.pending = []
+        self.pending_samples = 0
+        for level in self.levels:
+            level.ingest(timestamp, xyz)
+
+    def query(self, t_start, t_end, max_points=500, width=None, offsets=(0.0, 0.0, 0.0)):
+        """Summarizes [t_start, t_end] in at most ``max_points`` buckets.
+
+        The finest level that fits in ``max_points`` is used (or the level
+        with the given ``width``); if even the coarsest one has too many
+        buckets, they are merged into wider ones aligned to absolute time.
+
+        Returns:
+            dict: ``width`` of the returned buckets, ``timestamp`` (bucket
+            start) and ``count``, plus ``<axis>_min``, ``_max``, ``_mean``
+            and ``_rms`` per axis, with ``offsets`` subtracted.
+        """
+        span = max(t_end - t_start, 0.0)
+        if width is not None:
+            candidates = [lvl for lvl in self.levels if lvl.width == width]
+            if not candidates:
+                raise ValueError(f"No summary level with width {width}")
+            level = candidates[0]
+        else:
+            fitting = [lvl for lvl in self.levels if span / lvl.width <= max_points]
+            level = fitting[0] if fitting else self.levels[-1]
+
+        with self.lock:
+            self._flush()
+            buckets = level.query(t_start, t_end)
+        factor = 1
+        if max_points:
+            # Por el intervalo pedido, no por los buckets guardados: los huecos no cambian el ancho
+            first = int(np.floor(t_start / level.width))
+            last = int(np.floor(t_end / level.width))
+            factor = max(int(np.ceil((last - first + 1) / max_points)), 1)
+            while last // factor - first // factor + 1 > max_points:
+                factor += 1
+        buckets = merge_buckets(buckets, factor)
+
+        offsets = np.asarray(offsets, dtype=np.float64)
+        count = buckets["count"][:, None].astype(np.float64)
+        mean = buckets["sum"] / count
+        # RMS de (v - offset) a partir de las sumas: E[v²] - 2·o·E[v] + o²
+        meansq = buckets["sumsq"] / count - 2 * offsets * mean + offsets ** 2
+        result = {
+            "width": level.width * max(factor, 1),
+            "timestamp": buckets["ids"] * level.width,
+            "count": buckets["count"],
+        }
+        for i, axis in enumerate("xyz"):
+            result[f"{axis}_min"] = buckets["min"][:, i] - offsets[i]
+            result[f"{axis}_max"] = buckets["max"][:, i] - offsets[i]
+            result[f"{axis}_mean"] = mean[:, i] - offsets[i]
+            result[f"{axis}_rms"] = np.sqrt(np.maximum(meansq[:, i], 0.0))
+        return result
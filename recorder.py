@@ -0,0 +1,245 @@
+"""Streaming recorder: writes samples to disk while a recording is active.
+
+The acquisition thread only hands batches over with ``feed`` (a non-blocking
+queue put); formatting and file I/O happen in a background writer thread, so
+stopping a recording returns immediately and recording length is bounded by
+disk space instead of the in-memory history.
+"""
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+import metrics
+from binary_format import BinaryWriter
+
+RECORDED_SAMPLES = metrics.REGISTRY.counter(
+    "adxl355_recorder_samples_total", "Samples written to recording files")
+RECORDER_WRITE_SECONDS = metrics.REGISTRY.counter(
+    "adxl355_recorder_write_seconds_total", "Time spent formatting and writing recordings")
+RECORDER_DROPPED = metrics.REGISTRY.counter(
+    "adxl355_recorder_dropped_batches_total", "Batches dropped because the writer fell behind")
+RECORDER_QUEUE = metrics.REGISTRY.gauge(
+    "adxl355_recorder_queue_batches", "Batches waiting for the recording writer")
+
+CSV_HEADER = "timestamp,x,y,z,temp\n"
+
+
+def format_csv_rows(timestamp, xyz, temp, offsets=(0.0, 0.0, 0.0)):
+    """Formats a batch as CSV rows in the ``grabar_archivo`` layout.
+
+    Args:
+        timestamp (numpy.ndarray): Unix timestamps, one per sample.
+        xyz (numpy.ndarray): (N, 3) acceleration in g.
+        temp (float | numpy.ndarray): Temperature, scalar or per sample.
+        offsets (sequence): (x, y, z) offsets subtracted before writing.
+
+    Returns:
+        str: The rows, newline terminated, ready for a single ``write``.
+    """
+    n = len(timestamp)
+    if n == 0:
+        return ""
+    # ISO local con microsegundos, sin un datetime por muestra
+    utc_offset = datetime.fromtimestamp(float(timestamp[0])).astimezone().utcoffset().total_seconds()
+    local_us = np.round((np.asarray(timestamp) + utc_offset) * 1e6).astype("datetime64[us]")
+    iso = np.datetime_as_string(local_us, unit="us").tolist()
+    cal = (np.asarray(xyz, dtype=np.float64) - np.asarray(offsets, dtype=np.float64)).tolist()
+    temps = np.broadcast_to(temp, (n,)).tolist()
+    return "".join(
+        f"{ts},{x:.6f},{y:.6f},{z:.6f},{t:.2f}\n"
+        for ts, (x, y, z), t in zip(iso, cal, temps)
+    )
+
+
+def parse_csv_rows(lines):
+    """Parses rows written by ``format_csv_rows`` back into arrays.
+
+    Args:
+        lines (list): Non-empty row strings (newline optional).
+
+    Returns:
+        tuple: (unix timestamps, (N, 4) float64 array of x, y, z and temp).
+    """
+    fields = [line.rstrip("\r\n").split(",") for line in lines]
+    # ISO local -> epoch, vectorizado con datetime64
+    local = np.array([row[0] for row in fields], dtype="datetime64[us]")
+    utc_offset = datetime.fromisoformat(fields[0][0]).astimezone().utcoffset().total_seconds()
+    timestamp = local.astype(np.int64) / 1e6 - utc_offset
+    return timestamp, np.array([row[1:5] for row in fields], dtype=np.float64)
+
+
+class CsvWriter:
+    """
+    Appends batches to a CSV file, applying offsets on the way.
+    """
+
+    def __init__(self, path, offsets=(0.0, 0.0, 0.0)):
+        self.path = path
+        self.offsets = offsets
+        self.file = open(path, "w", newline='')
+        self.file.write(CSV_HEADER)
+        self.position = len(CSV_HEADER)  # Bytes escritos (las filas son ASCII)
+
+    def write(self, timestamp, xyz, temp):
+        rows = format_csv_rows(timestamp, xyz, temp, self.offsets)
+        self.file.write(rows)
+        self.position += len(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class StreamRecorder:
+    """
+    Records FIFO batches to a file from a background writer thread.
+
+    Two formats are supported: ``csv`` (same layout as ``grabar_archivo``)
+    and ``bin`` (raw counts, see ``binary_format``).
+
+    ``start`` opens a new session, ``feed`` enqueues batches from the
+    acquisition path and ``stop`` only signals the writer, which flushes what
+    is pending and closes the file on its own.
+
+    Args:
+        directory (str): Where recordings are written.
+        max_pending (int): Batches queued before new ones are dropped.
+        catalog (RecordingCatalog): Optional catalog that registers each
+            file when it is closed (see ``catalog.py``).
+    """
+
+    def __init__(self, directory="data", max_pending=2000, catalog=None):
+        self.directory = directory
+        self.max_pending = max_pending
+        self.catalog = catalog
+        self.active = False
+        self.file_path = None
+        self.samples_written = 0
+        self.dropped_batches = 0
+        self._queue = None
+        self._stopped = None
+        self._thread = None
+
+    def start(self, base_name, t_start=None, offsets=None, file_format="csv", meta=None):
+        """Starts recording to ``{directory}/{base_name}_{yymmdd-HHMMSS}.{csv|bin}``.
+
+        Args:
+            base_name (str): Base file name.
+            t_start (float): Samples older than this timestamp are skipped
+                (used for the stabilization time). Defaults to now.
+            offsets (dict): Offsets per axis, stored in the header of binary
+                files (batches arrive calibrated, see ``calibration.py``).
+            file_format (str): ``csv`` or ``bin``.
+            meta (dict): Extra header fields for binary files (range,
+                scale_factor, odr, calibration matrix...).
+
+        Returns:
+            str: Path of the file being written.
+        """
+        if file_format not in ("csv", "bin"):
+            raise ValueError(f"Unknown recording format: {file_format}")
+        if self.active:
+            self.stop()
+        os.makedirs(self.directory, exist_ok=True)
+        timestamp_str = datetime.now().strftime("%y%m%d-%H%M%S")
+        self.file_path = os.path.join(self.directory, f"{base_name}_{timestamp_str}.{file_format}")
+        self.samples_written = 0
+        self.dropped_batches = 0
+        offsets = dict(offsets or {'x': 0.0, 'y': 0.0, 'z': 0.0})
+
+        if file_format == "bin":
+            output = BinaryWriter(self.file_path, dict(meta or {}, offsets=offsets))
+        else:
+            output = CsvWriter(self.file_path)
+
+        # Entrada del catálogo, armada mientras se escribe
+        from catalog import FileIndexer
+        indexer = FileIndexer(self.file_path, file_format, dict(meta or {}, offsets=offsets))
+
+        self._queue = queue.Queue(maxsize=self.max_pending)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._writer,
+            args=(self._queue, self._stopped, output, file_format,
+                  time.time() if t_start is None else t_start, indexer),
+            daemon=True,
+        )
+        self._thread.start()
+        self.active = True
+        return self.file_path
+
+    def feed(self, batch):
+        """Enqueues a batch (dict with timestamp, xyz and temp). Never blocks."""
+        pending = self._queue
+        if not self.active or pending is None:
+            return
+        try:
+            pending.put_nowait(batch)
+        except queue.Full:
+            self.dropped_batches += 1
+            RECORDER_DROPPED.inc()
+            if self.dropped_batches == 1:
+                print("Atención: la escritura no da abasto, se descartan lotes de la grabación.")
+
+    def stop(self):
+        """Stops recording without waiting. The writer finishes the file in the background."""
+        pending = self._queue
+        if not self.active or pending is None:
+            return
+        self.active = False
+        self._queue = None
+        self._stopped.set()
+        try:
+            pending.put_nowait(None)  # Despierta al escritor; si la cola está llena lo ve por el evento
+        except queue.Full:
+            pass
+
+    def wait(self, timeout=None):
+        """Waits for the last writer to finish flushing its file."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _writer(self, pending, stopped, output, file_format, t_start, indexer):
+        written = 0
+        try:
+            while True:
+                try:
+                    batch = pending.get(timeout=0.1)
+                except queue.Empty:
+                    if stopped.is_set():
+                        break  # Ya se escribió todo lo encolado antes de detener
+                    continue
+                if batch is None:
+                    break
+                timestamp, xyz, temp = batch["timestamp"], batch["xyz"], batch["temp"]
+                values = batch["raw"] if file_format == "bin" else xyz
+                if timestamp[0] < t_start:
+                    keep = timestamp >= t_start
+                    timestamp, values, xyz = timestamp[keep], values[keep], xyz[keep]
+                    temp = np.broadcast_to(temp, keep.shape)[keep]
+                if len(timestamp):
+                    start = time.perf_counter()
+                    indexer.update(output.position, timestamp, xyz)
+                    output.write(timestamp, values, temp)
+                    RECORDER_WRITE_SECONDS.inc(time.perf_counter() - start)
+                    RECORDED_SAMPLES.inc(len(timestamp))
+                    RECORDER_QUEUE.set(pending.qsize())
+                    written += len(timestamp)
+                    if self.file_path == output.path:
+                        self.samples_written = written
+        finally:
+            output.close()
+
+        if written == 0:
+            os.remove(output.path)
+            print("Grabación detenida antes de finalizar el tiempo de estabilización. No se guardó archivo.")
+        else:
+            print(f"Archivo guardado en {output.path} ({written} muestras)")
+            if self.catalog is not None:
+                try:
+                    self.catalog.add(indexer)
+                except Exception as e:
+                    print(f"No se pudo catalogar {output.path}: {e}")
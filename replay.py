@@ -0,0 +1,210 @@
+"""Replay of recorded files through the acquisition pipeline.
+
+``ReplayEngine`` reads a recording (CSV from ``grabar_archivo`` /
+``StreamRecorder`` or a binary ``.bin`` file) in chunks and hands the samples
+to an ingest function, normally ``ADXL355.ingest``, so they go through the
+same history buffer, offsets, recording and analysis paths as live SPI data.
+Playback runs at real time, N times faster, or as fast as possible
+(``speed=0``), which also measures the maximum sustainable ingest rate.
+
+Usage as a script (throughput of the buffer + summaries path)::
+
+    python replay.py data/datos_240101-120000.bin [--speed 0]
+"""
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+
+from binary_format import BinaryRecording
+from recorder import parse_csv_rows
+
+DEFAULT_SCALE_FACTOR = 256000
+
+
+def _csv_chunks(path, chunk_size, scale_factor, uncalibrate):
+    with open(path, "r") as f:
+        header = f.readline()
+        if not header.startswith("timestamp"):
+            raise ValueError(f"{path} is not an accelerometer CSV recording")
+        while True:
+            lines = [line for _, line in zip(range(chunk_size), f) if line.strip()]
+            if not lines:
+                return
+            timestamp, values = parse_csv_rows(lines)
+            # Los valores ya están calibrados: raw sale de deshacer la calibración
+            uncalibrated = uncalibrate(values[:, :3]) if uncalibrate is not None else values[:, :3]
+            yield {
+                "timestamp": timestamp,
+                "xyz": values[:, :3].astype(np.float32),
+                "raw": np.rint(uncalibrated * scale_factor).astype(np.int32),
+                "temp": values[:, 3].astype(np.float32),
+                "calibrated": True,
+            }
+
+
+def _binary_chunks(path, chunk_size, uncalibrate):
+    recording = BinaryRecording(path)
+    scale_factor = float(recording.meta["scale_factor"])
+    calibrated = bool(recording.meta.get("calibrated"))
+    for start in range(0, len(recording), chunk_size):
+        stop = min(start + chunk_size, len(recording))
+        raw = np.array(recording.raw[start:stop])
+        # Sin offsets: igual que lo que entrega el sensor (o ya calibrado, si es una exportación)
+        xyz = (raw / scale_factor).astype(np.float32)
+        batch = {
+            "timestamp": np.array(recording.timestamp[start:stop]),
+            "xyz": xyz,
+            "raw": raw,
+            "temp": np.array(recording.temp[start:stop]),
+        }
+        if calibrated:
+            if uncalibrate is not None:
+                batch["raw"] = np.rint(uncalibrate(xyz) * scale_factor).astype(np.int32)
+            batch["calibrated"] = True
+        yield batch
+
+
+def read_recording(path, chunk_size=4096, scale_factor=DEFAULT_SCALE_FACTOR, uncalibrate=None):
+    """Yields a recording as batches (``timestamp``, ``xyz``, ``raw``, ``temp``).
+
+    Binary files carry raw counts and their scale factor. CSV files and
+    binary exports (``calibrated`` in the header) hold values with the
+    calibration of the recording already applied; their batches are flagged
+    ``calibrated`` so it is not applied again, and raw counts are rebuilt
+    from ``uncalibrate(xyz)`` (with ``scale_factor`` for CSV).
+
+    Args:
+        path (str): CSV or binary recording.
+        chunk_size (int): Samples per batch.
+        scale_factor (float): LSB/g used to rebuild raw counts from CSV.
+        uncalibrate (callable): Maps calibrated (N, 3) g back to sensor g
+            (``CalibrationStage.uncalibrate``); None keeps the values.
+    """
+    if path.endswith(".bin"):
+        return _binary_chunks(path, chunk_size, uncalibrate)
+    return _csv_chunks(path, chunk_size, scale_factor, uncalibrate)
+
+
+class ReplayEngine:
+    """
+    Feeds a recording to ``ingest`` from a background thread.
+
+    Timestamps are shifted so the first sample is stamped at the start of the
+    replay, keeping the recorded spacing between samples (at ``speed`` > 1
+    they run ahead of the wall clock; the spectral content is unchanged).
+    ``on_finish`` runs when the replay ends or is stopped, so the caller
+    can drop those timestamps before live data resumes.
+
+    Args:
+        path (str): Recording to replay.
+        ingest (callable): Receives each batch dict.
+        speed (float): Playback speed factor; 0 means as fast as possible.
+        chunk_size (int): Samples per batch handed to ``ingest``.
+        scale_factor (float): LSB/g used to rebuild raw counts from CSV.
+        uncalibrate (callable): Undoes the calibration of CSV values to
+            rebuild raw counts (see ``read_recording``).
+        on_finish (callable): Called from the replay thread when it ends.
+    """
+
+    def __init__(self, path, ingest, speed=1.0, chunk_size=256, scale_factor=DEFAULT_SCALE_FACTOR,
+                 uncalibrate=None, on_finish=None):
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        self.path = path
+        self.ingest = ingest
+        self.speed = float(speed)
+        self.chunk_size = chunk_size
+        self.scale_factor = scale_factor
+        self.uncalibrate = uncalibrate
+        self.on_finish = on_finish
+        self.samples = 0
+        self.error = None
+        self.started = None
+        self.finished = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="replay", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def run(self):
+        """Replays the whole file in the calling thread."""
+        self.started = time.monotonic()
+        wall_start = time.time()
+        t_first = None
+        try:
+            for batch in read_recording(self.path, self.chunk_size, self.scale_factor, self.uncalibrate):
+                if self._stop.is_set():
+                    break
+                if t_first is None:
+                    t_first = batch["timestamp"][0]
+                elapsed = batch["timestamp"][-1] - t_first
+                if self.speed > 0:
+                    delay = self.started + elapsed / self.speed - time.monotonic()
+                    if delay > 0 and self._stop.wait(delay):
+                        break
+                batch["timestamp"] = batch["timestamp"] - t_first + wall_start
+                self.ingest(batch)
+                self.samples += len(batch["timestamp"])
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            print(f"Error en la reproducción de {self.path}: {self.error}")
+        if self.on_finish is not None:
+            self.on_finish()
+        self.finished = time.monotonic()
+
+    def status(self):
+        """Returns progress and throughput as a JSON-friendly dict."""
+        end = self.finished if self.finished is not None else time.monotonic()
+        elapsed = end - self.started if self.started is not None else 0.0
+        return {
+            "path": self.path,
+            "speed": self.speed,
+            "running": self.running,
+            "samples": self.samples,
+            "elapsed": elapsed,
+            "samples_per_second": self.samples / elapsed if elapsed > 0 else 0.0,
+            "error": self.error,
+        }
+
+
+def main():
+    from pyramid import SummaryPyramid
+    from ring_buffer import RingBuffer
+    from adxl355 import MAX_MUESTRAS
+
+    parser = argparse.ArgumentParser(description="Reproduce una grabación por el buffer y los resúmenes.")
+    parser.add_argument("path", help="Archivo .csv o .bin")
+    parser.add_argument("--speed", type=float, default=0.0, help="Factor de velocidad (0 = lo más rápido posible)")
+    parser.add_argument("--chunk", type=int, default=32, help="Muestras por lote (32 = una FIFO llena)")
+    args = parser.parse_args()
+
+    buffer = RingBuffer(MAX_MUESTRAS)
+    summaries = SummaryPyramid()
+
+    def ingest(batch):
+        buffer.append_batch(batch["timestamp"], batch["xyz"], batch["temp"], batch["raw"])
+        summaries.ingest(batch)
+
+    engine = ReplayEngine(args.path, ingest, args.speed, args.chunk)
+    engine.run()
+    status = engine.status()
+    print(f"{status['samples']} muestras en {status['elapsed']:.2f} s "
+          f"({status['samples_per_second']:.0f} muestras/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""Columnar ring buffer for the accelerometer history.
+
+Replaces the ``deque`` of per-sample dicts with preallocated NumPy columns
+(timestamp, x, y, z, temp and the raw counts) so a full history window costs
+a fixed, small amount of memory and no per-sample Python objects.
+
+The state (oldest and next sequence numbers) and the columns can live in an
+external buffer such as a ``multiprocessing.shared_memory`` block, so a
+writer in one process and read-only readers in others share the history.
+"""
+import threading
+
+import numpy as np
+
+COLUMNS = (
+    ("timestamp", np.float64, ()),
+    ("x", np.float32, ()),
+    ("y", np.float32, ()),
+    ("z", np.float32, ()),
+    ("temp", np.float32, ()),
+    ("raw", np.int32, (3,)),
+)
+
+# Cabecera: first, total, capacity, vaciados (int64)
+_HEADER_FIELDS = 4
+_HEADER_BYTES = _HEADER_FIELDS * 8
+
+
+def _aligned(nbytes):
+    return (nbytes + 7) & ~7
+
+
+class RingBuffer:
+    """
+    Fixed-capacity ring buffer of samples stored column by column.
+
+    Samples are addressed by logical index, 0 being the oldest sample still
+    in the buffer (negative indexes count from the newest one, as in lists).
+    Views returned by ``view`` and ``iter_range`` share memory with the
+    buffer and are only valid until the writer wraps around and overwrites
+    them.
+
+    The timestamp column is kept non-decreasing (a timestamp older than the
+    newest one is clamped to it), so it doubles as a sorted index for time
+    range queries.
+
+    Args:
+        capacity (int): Number of samples kept.
+        buffer: Optional writable buffer of at least ``nbytes(capacity)``
+            bytes to hold the state and columns. A buffer already holding a
+            ring (non-zero header) is attached instead of reset.
+        readonly (bool): Attach as a reader: columns and state are mapped
+            read-only and the ring must already be initialized.
+    """
+
+    def __init__(self, capacity, buffer=None, readonly=False):
+        self.capacity = int(capacity)
+        if buffer is None:
+            buffer = bytearray(self.nbytes(self.capacity))
+        elif len(buffer) < self.nbytes(self.capacity):
+            raise ValueError("Buffer too small for the requested capacity")
+
+        self._state = np.ndarray((_HEADER_FIELDS,), dtype=np.int64, buffer=buffer)
+        offset = _HEADER_BYTES
+        self.columns = {}
+        for name, dtype, shape in COLUMNS:
+            column = np.ndarray((self.capacity,) + shape, dtype=dtype, buffer=buffer, offset=offset)
+            offset += _aligned(column.nbytes)
+            if readonly:
+                column.flags.writeable = False
+            self.columns[name] = column
+
+        if self._state[2] == 0 and not readonly:
+            self._state[:] = (0, 0, self.capacity, 0)
+        elif self._state[2] != self.capacity:
+            raise ValueError(f"Ring capacity mismatch: expected {self.capacity}, found {self._state[2]}")
+        if readonly:
+            self._state.flags.writeable = False
+
+        total = self.total
+        self.last_timestamp = (
+            self.columns["timestamp"][(total - 1) % self.capacity] if total > self.first else -np.inf
+        )
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def nbytes(capacity):
+        """Returns the bytes needed to hold a ring of ``capacity`` samples."""
+        return _HEADER_BYTES + sum(
+            _aligned(int(capacity) * np.dtype(dtype).itemsize * int(np.prod(shape)))
+            for _, dtype, shape in COLUMNS
+        )
+
+    @property
+    def first(self):
+        """Sequence number of the oldest valid sample."""
+        return int(self._state[0])
+
+    @property
+    def total(self):
+        """Sequence number of the next sample to be written."""
+        return int(self._state[1])
+
+    @property
+    def clears(self):
+        """Number of times ``clear`` was called, so readers can notice it."""
+        return int(self._state[3])
+
+    def __len__(self):
+        return max(self.total - self.first, 0)
+
+    def clear(self):
+        """Discards all samples. Memory is kept for reuse.
+
+        The timestamp floor is reset too, so the next samples may be older
+        than the discarded ones.
+        """
+        with self.lock:
+            self._state[0] = self._state[1]
+            self._state[3] += 1
+            self.last_timestamp = -np.inf
+
+    def append_batch(self, timestamp, xyz, temp, raw=None):
+        """Appends a decoded FIFO batch.
+
+        Args:
+            timestamp (float | numpy.ndarray): Timestamp for every sample,
+                scalar or one per sample.
+            xyz (numpy.ndarray): (N, 3) acceleration values in g.
+            temp (float | numpy.ndarray): Temperature, scalar or per sample.
+            raw (numpy.ndarray): (N, 3) raw counts (zeros if not given).
+
+        Returns:
+            int: Number of samples appended.
+        """
+        n = len(xyz)
+        if n == 0:
+            return 0
+        timestamp = np.broadcast_to(np.asarray(timestamp, dtype=np.float64), (n,))
+        if n > 1 and np.any(timestamp[1:] < timestamp[:-1]):
+            timestamp = np.maximum.accumulate(timestamp)
+        if timestamp[0] < self.last_timestamp:
+            # Un salto hacia atrás del reloj no debe romper el orden del índice
+            timestamp = np.maximum(timestamp, self.last_timestamp)
+        values = {
+            "timestamp": timestamp,
+            "x": xyz[:, 0],
+            "y": xyz[:, 1],
+            "z": xyz[:, 2],
+            "temp": np.broadcast_to(temp, (n,)),
+            "raw": np.zeros((n, 3), dtype=np.int32) if raw is None else raw,
+        }
+        if n > self.capacity:
+            # Sólo entran las últimas `capacity` muestras
+            values = {name: col[-self.capacity:] for name, col in values.items()}
+            skipped = n - self.capacity
+        else:
+            skipped = 0
+        count = n - skipped
+
+        with self.lock:
+            seq = self.total + skipped
+            new_total = self.total + n
+            # Primero se liberan los lugares a pisar, así un lector de otro
+            # proceso nunca toma como válida una muestra a medio escribir
+            self._state[0] = max(self.first, new_total - self.capacity)
+            for start, stop, offset in self._segments(seq, seq + count):
+                for name, col in values.items():
+                    self.columns[name][start:stop] = col[offset:offset + stop - start]
+            self._state[1] = new_total
+            self.last_timestamp = timestamp[-1]
+        return n
+
+    def oldest_timestamp(self):
+        """Returns the timestamp of the oldest sample, or None if the buffer is empty."""
+        with self.lock:
+            if self.total <= self.first:
+                return None
+            return float(self.columns["timestamp"][self.first % self.capacity])
+
+    def latest(self):
+        """Returns the newest sample as a dict, or None if the buffer is empty."""
+        with self.lock:
+            total = self.total
+            if total <= self.first:
+                return None
+            idx = (total - 1) % self.capacity
+            return {
+                name: col[idx].tolist() if col.ndim > 1 else col[idx].item()
+                for name, col in self.columns.items()
+            }
+
+    def view(self, start=0, stop=None):
+        """Returns zero-copy views over a range of logical indexes.
+
+        Args:
+            start (int): First logical index (negative counts from the end).
+            stop (int): Logical index past the last sample (None = newest).
+
+        Returns:
+            list: One dict of column views per contiguous memory segment
+            (two when the range wraps around the end of the storage).
+        """
+        with self.lock:
+            seq0, seq1 = self._seq_range(start, stop)
+            return [
+                {name: col[a:b] for name, col in self.columns.items()}
+                for a, b, _ in self._segments(seq0, seq1)
+            ]
+
+    def read(self, start=0, stop=None):
+        """Returns a copy of a range of logical indexes as contiguous columns."""
+        with self.lock:
+            seq0, seq1 = self._seq_range(start, stop)
+        return self.read_range(seq0, seq1)
+
+    def tail(self, n):
+        """Returns a copy of the newest ``n`` samples (or fewer if not available)."""
+        return self.read(-min(n, len(self)) if n else len(self))
+
+    def index_between(self, t_start, t_end):
+        """Finds the samples with ``t_start <= timestamp <= t_end``.
+
+        The lock is only held to snapshot the valid sequence range; the
+        search itself is a binary search over the timestamp column.
+
+        Returns:
+            tuple: (seq_start, seq_end) sequence numbers, end exclusive, to
+            be passed to ``iter_range`` or ``read_range``.
+        """
+        with self.lock:
+            seq0, seq1 = self.first, self.total
+        start = self._search(seq0, seq1, t_start, "left")
+        end = self._search(seq0, seq1, t_end, "right")
+        with self.lock:
+            # Lo que el escritor haya pisado durante la búsqueda ya no es válido
+            start = max(start, self.first)
+        return start, max(start, end)
+
+    def iter_range(self, seq_start, seq_end, chunk_size=8192):
+        """Iterates over a sequence range as dicts of zero-copy column views.
+
+        Samples overwritten before being reached are skipped, so a slow
+        consumer never blocks the writer.
+
+        Args:
+            seq_start (int): First sequence number (as from ``index_between``).
+            seq_end (int): Sequence number past the last sample.
+            chunk_size (int): Maximum samples per yielded chunk.
+
+        Yields:
+            dict: Column name to NumPy view for each chunk.
+        """
+        seq = seq_start
+        while seq < seq_end:
+            with self.lock:
+                seq = max(seq, self.first)
+                end = min(seq_end, self.total)
+            if seq >= end:
+                return
+            start = seq % self.capacity
+            stop = min(self.capacity, start + end - seq, start + chunk_size)
+            yield {name: col[start:stop] for name, col in self.columns.items()}
+            seq += stop - start
+
+    def read_range(self, seq_start, seq_end):
+        """Returns a contiguous copy of a sequence range."""
+        chunks = list(self.iter_range(seq_start, seq_end, chunk_size=self.capacity))
+        return {
+            name: np.concatenate([chunk[name] for chunk in chunks]) if chunks else col[:0].copy()
+            for name, col in self.columns.items()
+        }
+
+    def _search(self, seq0, seq1, value, side):
+        """Binary search of ``value`` in the timestamps of [seq0, seq1)."""
+        timestamps = self.columns["timestamp"]
+        for start, stop, offset in self._segments(seq0, seq1):
+            segment = timestamps[start:stop]
+            if (value <= segment[-1]) if side == "left" else (value < segment[-1]):
+                return seq0 + offset + int(np.searchsorted(segment, value, side=side))
+        return seq1
+
+    def _seq_range(self, start, stop):
+        first, total = self.first, self.total
+        start, stop, _ = slice(start, stop).indices(max(total - first, 0))
+        stop = max(start, stop)
+        return first + start, first + stop
+
+    def _segments(self, seq0, seq1):
+        """Yields (start, stop, offset) physical slices covering [seq0, seq1)."""
+        offset = 0
+        while seq0 < seq1:
+            start = seq0 % self.capacity
+            stop = min(self.capacity, start + seq1 - seq0)
+            yield start, stop, offset
+            offset += stop - start
+            seq0 += stop - start
@@ -0,0 +1,298 @@
+"""Continuous logging to rotating segment files.
+
+``SegmentLogger`` is a batch consumer for unattended monitoring. Batches go
+through a queue to a writer thread that appends them to the current
+segment file (``csv`` or ``bin``, same writers as ``StreamRecorder``) and
+starts a new one when the segment reaches its duration (aligned to the
+clock, so segments are 00:00-00:10, 00:10-00:20...) or its size limit.
+Closed segments are handed to a second thread that gzips them and then
+applies the retention policy (maximum total size and age), so days of
+logging neither fill the SD card nor touch the web or acquisition threads.
+Closed, compressed and pruned segments are kept up to date in the optional
+``RecordingCatalog``.
+"""
+import gzip
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+import metrics
+from binary_format import BinaryWriter
+from catalog import FileIndexer
+from recorder import CsvWriter
+
+SEGMENT_SAMPLES = metrics.REGISTRY.counter(
+    "adxl355_segment_samples_total", "Samples written to continuous log segments")
+SEGMENT_DROPPED = metrics.REGISTRY.counter(
+    "adxl355_segment_dropped_batches_total", "Batches dropped because the segment writer fell behind")
+SEGMENTS_CLOSED = metrics.REGISTRY.counter(
+    "adxl355_segments_closed_total", "Continuous log segments closed")
+SEGMENTS_PRUNED = metrics.REGISTRY.counter(
+    "adxl355_segments_pruned_total", "Continuous log segments deleted by the retention policy")
+SEGMENT_COMPRESS_SECONDS = metrics.REGISTRY.counter(
+    "adxl355_segment_compress_seconds_total", "Time spent compressing closed segments")
+SEGMENT_DISK_BYTES = metrics.REGISTRY.gauge(
+    "adxl355_segment_disk_bytes", "Bytes used by continuous log segments")
+
+
+class SegmentLogger:
+    """
+    Always-on recorder that rotates, compresses and prunes segment files.
+
+    Args:
+        directory (str): Where segments are written.
+        prefix (str): File name prefix (``{prefix}_{yymmdd-HHMMSS}.{ext}``).
+        file_format (str): ``csv`` or ``bin``.
+        segment_seconds (float): Segment duration.
+        segment_bytes (int): Size that closes a segment early.
+        compress (bool): Gzip closed segments.
+        max_bytes (int): Total size kept (0 = no limit).
+        max_age (float): Seconds a segment is kept (0 = no limit).
+        meta (callable): Called with the segment start time, returns the
+            binary header fields (offsets, scale factor, calibration...).
+        max_pending (int): Batches queued before new ones are dropped.
+        catalog (RecordingCatalog): Optional catalog of the segments.
+    """
+
+    def __init__(self, directory="data/continuo", prefix="registro", file_format="bin", segment_seconds=600.0,
+                 segment_bytes=100 * 2**20, compress=True, max_bytes=5 * 2**30, max_age=7 * 86400,
+                 meta=None, max_pending=4096, catalog=None):
+        self.directory = directory
+        self.prefix = prefix
+        self.meta = meta or (lambda t_start: {})
+        self.max_pending = max_pending
+        self.catalog = catalog
+        self.active = False
+        self.current = None
+        self.segments_closed = 0
+        self.dropped_batches = 0
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._compress_queue = queue.Queue()
+        self.configure(file_format=file_format, segment_seconds=segment_seconds, segment_bytes=segment_bytes,
+                       compress=compress, max_bytes=max_bytes, max_age=max_age)
+        self._compressor = threading.Thread(target=self._compress_worker, name="segment-compressor", daemon=True)
+        self._compressor.start()
+
+    def configure(self, file_format=None, segment_seconds=None, segment_bytes=None, compress=None,
+                  max_bytes=None, max_age=None):
+        """Changes settings (None keeps the current one). Takes effect on the next segment.
+
+        Raises:
+            ValueError: If a setting is out of range (nothing is changed).
+        """
+        file_format = self.__dict__.get("file_format") if file_format is None else file_format
+        segment_seconds = float(self.__dict__.get("segment_seconds") if segment_seconds is None else segment_seconds)
+        segment_bytes = int(self.__dict__.get("segment_bytes") if segment_bytes is None else segment_bytes)
+        if file_format not in ("csv", "bin"):
+            raise ValueError(f"Unknown recording format: {file_format}")
+        if segment_seconds < 1.0:
+            raise ValueError("segment_seconds must be at least 1")
+        if segment_bytes < 4096:
+            raise ValueError("segment_bytes must be at least 4096")
+        self.file_format = file_format
+        self.segment_seconds = segment_seconds
+        self.segment_bytes = segment_bytes
+        if compress is not None:
+            self.compress = bool(compress)
+        if max_bytes is not None:
+            self.max_bytes = max(int(max_bytes), 0)
+        if max_age is not None:
+            self.max_age = max(float(max_age), 0.0)
+
+    def start(self):
+        """Starts logging. Segments left uncompressed by a previous run are compressed."""
+        with self._lock:
+            if self.active:
+                return
+            if self._thread is not None:
+                self._thread.join()  # El escritor anterior tiene que haber cerrado su segmento
+            os.makedirs(self.directory, exist_ok=True)
+            for path in self._segment_files():
+                if self.compress and not path.endswith(".gz"):
+                    self._compress_queue.put(path)
+            self._compress_queue.put(None)  # Aplica la retención aunque no haya nada que comprimir
+            self._queue = queue.Queue(maxsize=self.max_pending)
+            self._thread = threading.Thread(target=self._writer, args=(self._queue,), name="segment-writer",
+                                            daemon=True)
+            self._thread.start()
+            self.active = True
+
+    def stop(self):
+        """Stops logging; the writer closes the open segment in the background."""
+        with self._lock:
+            if not self.active:
+                return
+            self.active = False
+            self._queue.put(None)
+            self._queue = None
+
+    def wait(self, timeout=None):
+        """Waits for the writer and for pending compressions (tests, shutdown)."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._compress_queue.join()
+
+    def feed(self, batch):
+        """Consumer for acquisition batches. Never blocks."""
+        pending = self._queue
+        if not self.active or pending is None:
+            return
+        try:
+            pending.put_nowait(batch)
+        except queue.Full:
+            self.dropped_batches += 1
+            SEGMENT_DROPPED.inc()
+
+    def status(self):
+        files = self._segment_files()
+        return {
+            "active": self.active,
+            "current": self.current,
+            "format": self.file_format,
+            "segment_seconds": self.segment_seconds,
+            "segment_bytes": self.segment_bytes,
+            "compress": self.compress,
+            "max_bytes": self.max_bytes,
+            "max_age": self.max_age,
+            "segments": len(files),
+            "bytes": sum(self._size(path) for path in files),
+            "segments_closed": self.segments_closed,
+            "dropped_batches": self.dropped_batches,
+        }
+
+    def _segment_files(self):
+        """Segment files in the directory, oldest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        extensions = (".csv", ".bin", ".csv.gz", ".bin.gz")
+        paths = [
+            os.path.join(self.directory, name) for name in names
+            if name.startswith(self.prefix + "_") and name.endswith(extensions)
+        ]
+        return sorted(paths)  # El nombre lleva la fecha: orden alfabético = cronológico
+
+    @staticmethod
+    def _size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def _open(self, t_start):
+        name = datetime.fromtimestamp(t_start).strftime("%y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"{self.prefix}_{name}.{self.file_format}")
+        sequence = 0
+        while os.path.exists(path) or os.path.exists(path + ".gz"):
+            # Otro segmento en el mismo segundo (rotación por tamaño): "_1" ordena después
+            sequence += 1
+            path = os.path.join(self.directory, f"{self.prefix}_{name}_{sequence}.{self.file_format}")
+        meta = dict(self.meta(t_start))
+        if self.file_format == "bin":
+            output = BinaryWriter(path, meta)
+        else:
+            output = CsvWriter(path)
+        self.current = path
+        return output, FileIndexer(path, self.file_format, meta)
+
+    def _close(self, output, indexer):
+        output.close()
+        self.current = None
+        if indexer.samples == 0:
+            os.remove(output.path)
+            return
+        self.segments_closed += 1
+        SEGMENTS_CLOSED.inc()
+        if self.catalog is not None:
+            try:
+                self.catalog.add(indexer)
+            except Exception as e:
+                print(f"No se pudo catalogar {output.path}: {e}")
+        self._compress_queue.put(output.path if self.compress else None)
+
+    def _writer(self, pending):
+        output, indexer, file_format, segment_end = None, None, None, None
+        try:
+            while True:
+                batch = pending.get()
+                if batch is None:
+                    break
+                timestamp = batch["timestamp"]
+                xyz, raw = batch["xyz"], batch.get("raw")
+                temp = np.broadcast_to(batch["temp"], (len(timestamp),))
+                start = 0
+                while start < len(timestamp):
+                    if output is not None and (timestamp[start] >= segment_end
+                                               or timestamp[start] < segment_end - self.segment_seconds
+                                               or output.file.tell() >= self.segment_bytes):
+                        self._close(output, indexer)
+                        output = None
+                    if output is None:
+                        t0 = float(timestamp[start])
+                        # Segmentos alineados al reloj: 00:00, 00:10, 00:20...
+                        segment_end = (t0 // self.segment_seconds + 1) * self.segment_seconds
+                        file_format = self.file_format
+                        output, indexer = self._open(t0)
+                    stop = start + int(np.searchsorted(timestamp[start:], segment_end, side="left"))
+                    stop = max(stop, start + 1)
+                    values = raw[start:stop] if file_format == "bin" else xyz[start:stop]
+                    if file_format == "bin" and values is None:
+                        values = np.zeros((stop - start, 3), dtype=np.int32)
+                    indexer.update(output.position, timestamp[start:stop], xyz[start:stop])
+                    output.write(timestamp[start:stop], values, temp[start:stop])
+                    SEGMENT_SAMPLES.inc(stop - start)
+                    start = stop
+        finally:
+            if output is not None:
+                self._close(output, indexer)
+
+    def _compress_worker(self):
+        while True:
+            path = self._compress_queue.get()
+            try:
+                if path is not None:
+                    self._gzip(path)
+                self._apply_retention()
+            except Exception as e:
+                print(f"Error en el registro continuo ({path}): {e}")
+            finally:
+                self._compress_queue.task_done()
+
+    def _gzip(self, path):
+        if not os.path.exists(path):
+            return  # Ya lo borró la retención
+        began = time.perf_counter()
+        partial = path + ".gz.part"
+        with open(path, "rb") as source, gzip.open(partial, "wb", compresslevel=6) as target:
+            shutil.copyfileobj(source, target, 1 << 20)
+        os.replace(partial, path + ".gz")
+        if self.catalog is not None:
+            self.catalog.rename(path, path + ".gz")
+        os.remove(path)
+        SEGMENT_COMPRESS_SECONDS.inc(time.perf_counter() - began)
+
+    def _apply_retention(self):
+        """Deletes the oldest closed segments beyond ``max_age`` or ``max_bytes``."""
+        files = [path for path in self._segment_files() if path != self.current]
+        sizes = [self._size(path) for path in files]
+        total = sum(sizes) + (self._size(self.current) if self.current else 0)
+        now = time.time()
+        for path, size in zip(files, sizes):
+            too_old = self.max_age and now - os.path.getmtime(path) > self.max_age
+            too_big = self.max_bytes and total > self.max_bytes
+            if not (too_old or too_big):
+                break
+            os.remove(path)
+            if self.catalog is not None:
+                self.catalog.remove(path)
+            total -= size
+            SEGMENTS_PRUNED.inc()
+        SEGMENT_DISK_BYTES.set(total)
@@ -0,0 +1,301 @@
+"""Simulated SPI device and interrupt line for running without hardware.
+
+``FakeSpiDev`` emulates the parts of the ADXL355 register map the code uses
+(DEVID_AD, STATUS, FIFO_ENTRIES, TEMP, XDATA..ZDATA, FIFO_DATA, FILTER,
+FIFO_SAMPLES, INTERRUPT_MAP, RANGE, POWER_CTL) including SPI auto-increment
+and the 96-entry FIFO, which fills at the configured ODR from a signal
+source. ``FakeGPIOInterrupt`` fires when the FIFO reaches the watermark, with
+gpiod-like event timestamps. Together they let the real ``ADXL355`` and
+acquisition code run, be load-tested and profiled on any Linux box.
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from timestamps import odr_from_filter
+
+# Registros (ver adxl355.py)
+DEVID_AD = 0x00
+DEVID_MST = 0x01
+PARTID = 0x02
+REVID = 0x03
+STATUS = 0x04
+FIFO_ENTRIES = 0x05
+TEMP02 = 0x06
+TEMP01 = 0x07
+XDATA3 = 0x08
+FIFO_DATA = 0x11
+FILTER = 0x28
+FIFO_SAMPLES = 0x29
+INTERRUPT_MAP = 0x2A
+RANGE = 0x2C
+POWER_CTL = 0x2D
+
+FIFO_MAX_ENTRIES = 96
+STATUS_DATA_RDY = 0x01
+STATUS_FIFO_FULL = 0x02
+STATUS_FIFO_OVR = 0x04
+INT1_FIFO_FULL = 0x02
+LSB_PER_G = {1: 256000, 2: 128000, 3: 64000}
+
+
+class SineSource:
+    """
+    Synthetic signal: gravity on one axis plus sinusoids and white noise.
+
+    Args:
+        gravity (sequence): Static acceleration (x, y, z) in g.
+        tones (sequence): (axis, frequency Hz, amplitude g) triplets.
+        noise (float): Standard deviation of the noise, in g.
+    """
+
+    def __init__(self, gravity=(0.0, 0.0, 1.0), tones=((0, 50.0, 0.05), (1, 120.0, 0.02)), noise=0.002, seed=None):
+        self.gravity = np.asarray(gravity, dtype=np.float64)
+        self.tones = tones
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+
+    def __call__(self, t):
+        """Returns (N, 3) accelerations in g for the sample times ``t``."""
+        values = np.tile(self.gravity, (len(t), 1))
+        for axis, freq, amplitude in self.tones:
+            values[:, axis] += amplitude * np.sin(2 * np.pi * freq * t)
+        if self.noise:
+            values += self.rng.normal(0.0, self.noise, values.shape)
+        return values
+
+
+def encode_samples(raw):
+    """Packs (N, 3) raw counts into FIFO bytes (X axis marker set on X)."""
+    counts = (np.asarray(raw, dtype=np.int64) & 0xFFFFF) << 4
+    data = np.empty(raw.shape + (3,), dtype=np.uint8)
+    data[..., 0] = (counts >> 16) & 0xFF
+    data[..., 1] = (counts >> 8) & 0xFF
+    data[..., 2] = counts & 0xF0
+    data[:, 0, 2] |= 0x01  # Marcador de eje X
+    return data.reshape(-1)
+
+
+class FakeSpiDev:
+    """
+    Drop-in replacement for ``spidev.SpiDev`` talking to a simulated ADXL355.
+
+    Args:
+        source (callable): Maps sample times (s, float64 array) to (N, 3)
+            accelerations in g. Defaults to ``SineSource()``.
+        speed (float): Time scale; samples are produced ``speed`` times
+            faster than the configured ODR (for load tests).
+        temperature (float): Reported temperature in °C.
+    """
+
+    def __init__(self, source=None, speed=1.0, temperature=25.0):
+        self.source = source or SineSource()
+        self.speed = speed
+        self.temperature = temperature
+        self.max_speed_hz = 0
+        self.mode = 0
+        self.lock = threading.Lock()
+        self.regs = bytearray(0x30)
+        self.regs[DEVID_AD] = 0xAD
+        self.regs[DEVID_MST] = 0x1D
+        self.regs[PARTID] = 0xED
+        self.regs[REVID] = 0x01
+        self.regs[FIFO_SAMPLES] = 0x60
+        self.regs[RANGE] = 0x81
+        self.regs[POWER_CTL] = 0x01  # Standby
+        self.fifo = bytearray()      # Bytes pendientes en la FIFO (3 por entrada)
+        self.fifo_overruns = 0
+        self.edges = 0               # Flancos de FIFO_FULL generados
+        self.last_edge_time = 0.0    # Tiempo monótono del último flanco
+        self.samples_generated = 0
+        self.transfers = 0
+        self._t0 = time.monotonic()
+        self._produced = 0           # Muestras producidas desde _t0
+        self._set_temperature()
+
+    # --- API de spidev ---
+    def open(self, bus, device):
+        pass
+
+    def close(self):
+        pass
+
+    def xfer2(self, data):
+        with self.lock:
+            self.transfers += 1
+            self._update()
+            address = data[0] >> 1
+            if data[0] & 0x01:
+                return [0] + self._read(address, len(data) - 1)
+            for offset, value in enumerate(data[1:]):
+                self._write(address + offset, value)
+            return [0] * len(data)
+
+    xfer3 = xfer2
+
+    # --- Estado del dispositivo ---
+    @property
+    def odr_hz(self):
+        return odr_from_filter(self.regs[FILTER]) * self.speed
+
+    @property
+    def measuring(self):
+        return not self.regs[POWER_CTL] & 0x01
+
+    @property
+    def watermark(self):
+        # Como en el ADXL355, FIFO_SAMPLES cuenta entradas (3 por muestra x, y, z)
+        return max(self.regs[FIFO_SAMPLES], 1)
+
+    def fifo_entries(self):
+        with self.lock:
+            self._update()
+            return len(self.fifo) // 3
+
+    def poll_edges(self):
+        """Returns (edge count, monotonic time of the last edge)."""
+        with self.lock:
+            self._update()
+            return self.edges, self.last_edge_time
+
+    def time_until_entries(self, entries):
+        """Seconds until the FIFO holds ``entries`` entries (0 if already there)."""
+        with self.lock:
+            self._update()
+            missing_samples = -(-(entries - len(self.fifo) // 3) // 3)
+            if missing_samples <= 0:
+                return 0.0
+            next_sample = self._t0 + (self._produced + missing_samples) / self.odr_hz
+            return max(next_sample - time.monotonic(), 0.0)
+
+    def _reset_clock(self):
+        self._t0 = time.monotonic()
+        self._produced = 0
+
+    def _update(self):
+        """Pushes into the FIFO the samples due since the last update."""
+        if not self.measuring:
+            self._reset_clock()
+            return
+        due = int((time.monotonic() - self._t0) * self.odr_hz)
+        n = due - self._produced
+        if n <= 0:
+            return
+        entries = len(self.fifo) // 3
+        free = (FIFO_MAX_ENTRIES - entries) // 3
+        # Sólo se generan las muestras que entran (al menos una para los
+        # registros de datos); el resto se pierde igual
+        kept = min(n, max(free, 1))
+        t = (self.samples_generated + np.arange(kept)) / (self.odr_hz / self.speed)
+        self._produced = due
+        self.samples_generated += n
+        lsb = LSB_PER_G.get(self.regs[RANGE] & 0x03, 256000)
+        g = self.source(t)
+        raw = np.clip(np.rint(g * lsb), -(1 << 19), (1 << 19) - 1).astype(np.int64)
+        self._set_axes(raw[-1])
+        self.regs[STATUS] |= STATUS_DATA_RDY
+
+        if n > free:
+            # Igual que el sensor: las muestras que no entran se pierden
+            raw = raw[:free]
+            self.regs[STATUS] |= STATUS_FIFO_OVR
+            self.fifo_overruns += 1
+        if len(raw):
+            self.fifo += encode_samples(raw).tobytes()
+            threshold = self.watermark
+            if entries < threshold <= entries + 3 * len(raw):
+                # Momento exacto en que la FIFO cruzó la marca de agua
+                k = -(-(threshold - entries) // 3)
+                self.edges += 1
+                self.last_edge_time = self._t0 + (due - n + k) / self.odr_hz
+
+    def _set_axes(self, raw):
+        data = encode_samples(raw.reshape(1, 3))
+        data[2] &= 0xF0
+        self.regs[XDATA3:XDATA3 + 9] = data.tobytes()
+
+    def _set_temperature(self):
+        temp_raw = int(round(1885 - (self.temperature - 25) * 9.05)) & 0xFFF
+        self.regs[TEMP02] = temp_raw >> 8
+        self.regs[TEMP01] = temp_raw & 0xFF
+
+    def _read_register(self, address):
+        if address == FIFO_DATA:
+            if not self.fifo:
+                return 0x02  # Indicador de FIFO vacía
+            return self.fifo.pop(0)
+        if address == FIFO_ENTRIES:
+            return len(self.fifo) // 3
+        if address == STATUS:
+            value = self.regs[STATUS]
+            if len(self.fifo) // 3 >= self.watermark:
+                value |= STATUS_FIFO_FULL
+            # Leer STATUS limpia DATA_RDY y FIFO_OVR
+            self.regs[STATUS] = 0
+            return value
+        if address < len(self.regs):
+            return self.regs[address]
+        return 0
+
+    def _read(self, address, length):
+        out = []
+        while len(out) < length and address != FIFO_DATA:
+            out.append(self._read_register(address))
+            address += 1
+        if len(out) < length:
+            # FIFO_DATA no auto-incrementa: el resto de la ráfaga vacía la FIFO
+            remaining = length - len(out)
+            take = min(remaining, len(self.fifo))
+            out += self.fifo[:take]
+            del self.fifo[:take]
+            out += [0x02] * (remaining - take)  # Indicador de FIFO vacía
+        return out
+
+    def _write(self, address, value):
+        if address == POWER_CTL and self.measuring != (not value & 0x01):
+            self._reset_clock()
+        if address in (FILTER, POWER_CTL) or (address == RANGE and (value & 0x03) != (self.regs[RANGE] & 0x03)):
+            self.fifo.clear()
+        if address < len(self.regs):
+            self.regs[address] = value & 0xFF
+        if address == FILTER:
+            self._reset_clock()
+
+
+class FakeGPIOInterrupt:
+    """
+    Simulated INT1 line: an edge every time the FIFO reaches the watermark.
+
+    Mirrors ``GPIOInterrupt.wait_event``: returns a list of events with a
+    ``timestamp_ns`` (CLOCK_MONOTONIC) or an empty list on timeout. Like the
+    real level-triggered FIFO_FULL output, a new edge only happens after the
+    FIFO has been drained below the watermark.
+    """
+
+    def __init__(self, device, chip=None, pin=None):
+        self.device = device
+        self.chip = chip
+        self.pin = pin
+        self.seen_edges = device.edges
+
+    def wait_event(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            edges, edge_time = self.device.poll_edges()
+            if edges > self.seen_edges:
+                self.seen_edges = edges
+                if self.device.regs[INTERRUPT_MAP] & INT1_FIFO_FULL:
+                    return [SimpleNamespace(timestamp_ns=int(edge_time * 1e9), line_offset=self.pin)]
+            if self.device.measuring:
+                # Nivel activo sin vaciar la FIFO: no habrá flanco nuevo hasta leerla
+                wait = self.device.time_until_entries(self.device.watermark) or 0.001
+            else:
+                wait = 0.01
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                wait = min(wait, remaining)
+            time.sleep(wait)
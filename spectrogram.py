@@ -0,0 +1,201 @@
+"""Spectrogram of the last minutes as a ring of quantized STFT columns.
+
+``SpectrumAnalyzer`` already computes one periodogram per hop; each one is
+handed to ``SpectrogramRing.add``, which pools it to ``bins`` frequency
+bins, converts it to dB and quantizes it to uint8 once. A request then only
+copies bytes out of the ring.
+
+Columns are grouped in tiles of ``tile_columns`` consecutive columns,
+numbered from the start of the analysis. A complete tile never changes, so
+its encoded form (PNG or raw bytes) is cached and can be cached by the
+browser as well; only the newest tile is rebuilt while it fills.
+"""
+import collections
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+AXES = ("x", "y", "z")
+MAX_COLUMNS = 20000
+
+
+def encode_png(image):
+    """Encodes a 2-D uint8 array as an 8-bit grayscale PNG (no dependencies)."""
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    height, width = image.shape
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    # Cada fila lleva delante el byte de filtro (0 = sin filtro)
+    rows = np.empty((height, width + 1), dtype=np.uint8)
+    rows[:, 0] = 0
+    rows[:, 1:] = image
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows.tobytes(), 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+class SpectrogramRing:
+    """
+    Bounded ring of uint8 dB spectrogram columns for the three axes.
+
+    Args:
+        seconds (float): Time span kept (the column count follows from the
+            hop of the analysis, up to ``MAX_COLUMNS``).
+        bins (int): Frequency bins per column (periodogram bins are
+            averaged down to this).
+        tile_columns (int): Columns per tile.
+        db_range (tuple): PSD range in dB re g²/Hz mapped to 0..255.
+        cached_tiles (int): Encoded tiles kept in memory.
+    """
+
+    def __init__(self, seconds=600.0, bins=512, tile_columns=64, db_range=(-160.0, -20.0), cached_tiles=64):
+        self.seconds = float(seconds)
+        self.bins = int(bins)
+        self.tile_columns = int(tile_columns)
+        self.db_min, self.db_max = (float(v) for v in db_range)
+        self.cached_tiles = cached_tiles
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.columns = None
+            self.timestamps = None
+            self.capacity = 0
+            self.total = 0
+            self.layout = None  # (fs, nperseg, hop) de las columnas guardadas
+            self._cache = collections.OrderedDict()
+
+    def add(self, timestamp, psd, fs, nperseg, hop):
+        """Adds one periodogram (one-sided PSD in g²/Hz, (nbins, 3)).
+
+        A change of ``nperseg`` or ``hop`` (or of the sample rate) starts
+        a new spectrogram, since old columns would not line up.
+        """
+        with self.lock:
+            layout = (nperseg, hop)
+            if self.layout is None or self.layout[1:] != layout or abs(fs / self.layout[0] - 1.0) > 0.05:
+                self._allocate(fs, nperseg, hop)
+            pooled = self._pool(psd)
+            db = 10.0 * np.log10(np.maximum(pooled, 1e-30))
+            scaled = (db - self.db_min) * (255.0 / (self.db_max - self.db_min))
+            slot = self.total % self.capacity
+            np.clip(scaled, 0, 255, out=scaled)
+            self.columns[slot] = scaled.T.astype(np.uint8)
+            self.timestamps[slot] = timestamp
+            self.total += 1
+            # El último mosaico cambió: su versión codificada ya no sirve
+            tile_id = self._tile_of(self.total - 1)
+            for key in [key for key in self._cache if key[1] == tile_id]:
+                del self._cache[key]
+
+    def _allocate(self, fs, nperseg, hop):
+        # Nueva numeración de mosaicos: ``generation`` distingue los de antes
+        self.generation += 1
+        self.layout = (fs, nperseg, hop)
+        self.capacity = min(max(int(np.ceil(self.seconds * fs / hop)), self.tile_columns), MAX_COLUMNS)
+        nbins = nperseg // 2 + 1
+        self.out_bins = min(self.bins, nbins)
+        self._edges = np.linspace(0, nbins, self.out_bins + 1).astype(np.int64)
+        self.freq_max = fs / 2.0
+        self.columns = np.zeros((self.capacity, 3, self.out_bins), dtype=np.uint8)
+        self.timestamps = np.zeros(self.capacity)
+        self.total = 0
+        self._cache.clear()
+
+    def _pool(self, psd):
+        counts = np.diff(self._edges)[:, None]
+        return np.add.reduceat(psd, self._edges[:-1], axis=0) / counts
+
+    def _tile_of(self, seq):
+        return seq // self.tile_columns
+
+    @property
+    def first(self):
+        return max(self.total - self.capacity, 0)
+
+    def index(self):
+        """Describes the available tiles (for the dashboard to request them).
+
+        Returns:
+            dict: Layout (generation, bins, frequency span, hop, dB range) and
+            ``tiles``: [{"id", "t_start", "t_end", "columns", "complete"}].
+        """
+        with self.lock:
+            if not self.total:
+                return {"generation": self.generation, "tiles": []}
+            fs, nperseg, hop = self.layout
+            tiles = []
+            first_tile = -(-self.first // self.tile_columns)  # Mosaicos parcialmente pisados, no
+            for tile in range(first_tile, self._tile_of(self.total - 1) + 1):
+                start = tile * self.tile_columns
+                stop = min(start + self.tile_columns, self.total)
+                tiles.append({
+                    "id": tile,
+                    "t_start": float(self.timestamps[start % self.capacity]),
+                    "t_end": float(self.timestamps[(stop - 1) % self.capacity]),
+                    "columns": stop - start,
+                    "complete": stop - start == self.tile_columns,
+                })
+            return {
+                "generation": self.generation,
+                "bins": self.out_bins,
+                "freq_max": self.freq_max,
+                "fs": fs,
+                "nperseg": nperseg,
+                "hop_seconds": hop / fs,
+                "tile_columns": self.tile_columns,
+                "db_min": self.db_min,
+                "db_max": self.db_max,
+                "tiles": tiles,
+            }
+
+    def tile(self, axis, tile_id):
+        """Returns one tile as (bins, columns) uint8, low frequencies first.
+
+        Returns:
+            tuple: (array, timestamps of its columns, columns added so
+            far), or None if the tile is not (or no longer) in the ring.
+        """
+        axis = AXES.index(axis)
+        with self.lock:
+            start = tile_id * self.tile_columns
+            stop = min(start + self.tile_columns, self.total)
+            if start < self.first or start >= stop:
+                return None
+            slots = np.arange(start, stop) % self.capacity
+            return self.columns[slots, axis].T.copy(), self.timestamps[slots].copy(), self.total
+
+    def encoded_tile(self, axis, tile_id, file_format="png"):
+        """Tile encoded as PNG (high frequencies on top) or raw bytes, cached.
+
+        Returns:
+            tuple: (bytes, timestamps of its columns) or None.
+        """
+        key = (axis, tile_id, file_format)
+        with self.lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+        found = self.tile(axis, tile_id)
+        if found is None:
+            return None
+        image, timestamps, total = found
+        data = encode_png(image[::-1]) if file_format == "png" else image.tobytes()
+        result = (data, timestamps)
+        with self.lock:
+            if total == self.total:  # Sin columnas nuevas mientras se codificaba
+                self._cache[key] = result
+                while len(self._cache) > self.cached_tiles:
+                    self._cache.popitem(last=False)
+        return result
@@ -0,0 +1,253 @@
+"""Rolling Welch PSD and peak-frequency tracking, maintained on ingest.
+
+``SpectrumAnalyzer`` is a batch consumer. Samples are queued as they
+arrive; every ``hop`` samples (``nperseg`` times one minus the overlap) the
+newest segment is detrended, windowed and transformed with a single real
+FFT over the three axes. The PSD is the mean of the last ``averages``
+periodograms (Welch's method), so each update costs one FFT of
+``nperseg`` points instead of a pass over the whole history.
+
+Results are built once per update and cached, so ``/spectrum`` requests
+from many dashboards only serialize what is already computed. The same
+per-segment periodograms feed the spectrogram (see ``spectrogram.py``).
+"""
+import collections
+import json
+import threading
+import time
+
+import numpy as np
+
+import metrics
+
+AXES = ("x", "y", "z")
+
+SPECTRUM_SECONDS = metrics.REGISTRY.histogram(
+    "adxl355_spectrum_update_seconds", "Time to add one segment to the rolling PSD")
+SPECTRUM_SEGMENTS = metrics.REGISTRY.counter(
+    "adxl355_spectrum_segments_total", "Segments (FFTs) added to the rolling PSD")
+
+# Cambio relativo de la frecuencia de muestreo que reinicia el promedio
+FS_TOLERANCE = 0.05
+
+
+def _peak(freq, psd):
+    """Frequency and PSD of the highest bin (skipping DC), refined with a parabola."""
+    i = int(np.argmax(psd[1:])) + 1
+    if 1 < i < len(psd) - 1:
+        a, b, c = psd[i - 1], psd[i], psd[i + 1]
+        denom = a - 2 * b + c
+        shift = 0.5 * (a - c) / denom if denom < 0 else 0.0
+        return float(freq[i] + shift * (freq[1] - freq[0])), float(b)
+    return float(freq[i]), float(psd[i])
+
+
+class SpectrumAnalyzer:
+    """
+    Rolling per-axis Welch PSD of the acquisition batches.
+
+    Args:
+        nperseg (int): Samples per FFT segment.
+        overlap (float): Fraction of overlap between segments (0 to 0.95).
+        averages (int): Periodograms averaged into the PSD.
+        history (int): Peak frequencies remembered (one per segment).
+        spectrogram (SpectrogramRing): Optional ring that receives every
+            single-segment periodogram (the STFT columns).
+    """
+
+    def __init__(self, nperseg=4096, overlap=0.5, averages=8, history=600, spectrogram=None):
+        self.lock = threading.Lock()
+        self.spectrogram = spectrogram
+        self.peak_history = collections.deque(maxlen=history)
+        self.segments = 0
+        self.configure(nperseg, overlap, averages)
+
+    def configure(self, nperseg=4096, overlap=0.5, averages=8):
+        """Changes the analysis parameters and restarts the average."""
+        nperseg, overlap, averages = int(nperseg), float(overlap), int(averages)
+        if not 16 <= nperseg <= 65536:
+            raise ValueError("nperseg must be between 16 and 65536")
+        if not 0.0 <= overlap <= 0.95:
+            raise ValueError("overlap must be between 0 and 0.95")
+        if not 1 <= averages <= 256:
+            raise ValueError("averages must be between 1 and 256")
+        with self.lock:
+            self.nperseg = nperseg
+            self.overlap = overlap
+            self.averages = averages
+            self.hop = max(int(round(nperseg * (1.0 - overlap))), 1)
+            self.window = np.hanning(nperseg + 2)[1:-1].astype(np.float32)  # Hann sin ceros en los extremos
+            self._window_power = float(np.sum(self.window.astype(np.float64) ** 2))
+            self._reset()
+
+    def _reset(self):
+        self.pending = []
+        self.pending_samples = 0
+        nbins = self.nperseg // 2 + 1
+        self._periodograms = np.zeros((self.averages, nbins, 3))
+        self._filled = 0
+        self._next = 0
+        self.fs = None
+        self.updated = None
+        self._version = 0
+        self._spectrum = None
+        self._result = None
+        self._cache = {}
+
+    def clear(self):
+        with self.lock:
+            self._reset()
+            self.peak_history.clear()
+
+    def ingest(self, batch):
+        """Consumer for acquisition batches (dict with ``timestamp`` and ``xyz``)."""
+        n = len(batch["timestamp"])
+        if not n:
+            return
+        with self.lock:
+            self.pending.append((batch["timestamp"], batch["xyz"]))
+            self.pending_samples += n
+            if self.pending_samples >= self.nperseg:
+                self._update()
+
+    def backfill(self, buffer):
+        """Seeds the average from the newest samples of a ``RingBuffer``."""
+        with self.lock:
+            wanted = self.nperseg + (self.averages - 1) * self.hop
+        data = buffer.tail(wanted)
+        if len(data["timestamp"]):
+            self.ingest({
+                "timestamp": data["timestamp"],
+                "xyz": np.column_stack((data["x"], data["y"], data["z"])),
+            })
+
+    def _update(self):
+        timestamp = np.concatenate([ts for ts, _ in self.pending])
+        xyz = np.concatenate([values for _, values in self.pending])
+        start = 0
+        while len(timestamp) - start >= self.nperseg:
+            stop = start + self.nperseg
+            self._add_segment(timestamp[start:stop], xyz[start:stop])
+            start += self.hop
+        self.pending = [(timestamp[start:], xyz[start:])]
+        self.pending_samples = len(timestamp) - start
+
+    def _add_segment(self, timestamp, xyz):
+        began = time.perf_counter()
+        span = float(timestamp[-1] - timestamp[0])
+        if span <= 0:
+            return
+        fs = (len(timestamp) - 1) / span
+        if self.fs is not None and abs(fs / self.fs - 1.0) > FS_TOLERANCE:
+            # Cambió el ODR (o hubo un hueco): los periodogramas anteriores no sirven
+            self._filled = 0
+            self._next = 0
+            self.fs = None
+        segment = xyz - xyz.mean(axis=0, dtype=np.float64).astype(np.float32)
+        spectrum = np.fft.rfft(segment * self.window[:, None], axis=0)
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+
+        self._periodograms[self._next] = power
+        self._next = (self._next + 1) % self.averages
+        self._filled = min(self._filled + 1, self.averages)
+        self.fs = fs if self.fs is None else self.fs + (fs - self.fs) / self._filled
+        self.updated = float(timestamp[-1])
+        self._version += 1
+        self._spectrum = freq, psd = self._psd()
+        if self.spectrogram is not None:
+            column = power / (fs * self._window_power)
+            column[1:-1 if self.nperseg % 2 == 0 else None] *= 2.0
+            self.spectrogram.add(float(timestamp[len(timestamp) // 2]), column, fs, self.nperseg, self.hop)
+        self._result = None
+        self._cache = {}
+
+        self.peak_history.append((self.updated,) + tuple(_peak(freq, psd[:, i])[0] for i in range(3)))
+        self.segments += 1
+        SPECTRUM_SEGMENTS.inc()
+        SPECTRUM_SECONDS.observe(time.perf_counter() - began)
+
+    def _psd(self):
+        """Frequencies and one-sided PSD in g²/Hz, (bins, 3)."""
+        psd = self._periodograms[:self._filled].sum(axis=0)
+        psd /= self._filled * self.fs * self._window_power
+        psd[1:-1 if self.nperseg % 2 == 0 else None] *= 2.0
+        freq = np.fft.rfftfreq(self.nperseg, 1.0 / self.fs)
+        return freq, psd
+
+    def result(self):
+        """Current PSD and peaks (None until the first segment is complete).
+
+        Returns:
+            dict: ``freq``, per-axis PSD arrays, ``peaks`` (frequency, PSD
+            and RMS per axis) and the analysis parameters.
+        """
+        with self.lock:
+            if self._filled == 0:
+                return None
+            if self._result is None:
+                freq, psd = self._spectrum
+                peaks = {}
+                df = freq[1] - freq[0]
+                for i, axis in enumerate(AXES):
+                    peak_freq, peak_psd = _peak(freq, psd[:, i])
+                    # RMS a partir del área del PSD (sin DC)
+                    peaks[axis] = {"freq": peak_freq, "psd": peak_psd, "rms": float(np.sqrt(psd[1:, i].sum() * df))}
+                self._result = {
+                    "freq": freq,
+                    "psd": psd,
+                    "peaks": peaks,
+                    "fs": self.fs,
+                    "nperseg": self.nperseg,
+                    "overlap": self.overlap,
+                    "averages": self._filled,
+                    "resolution": float(df),
+                    "updated": self.updated,
+                    "version": self._version,
+                }
+            return self._result
+
+    def json(self, points=None, fmax=None, history=0):
+        """``result()`` serialized for ``/spectrum``, cached per update and options.
+
+        Args:
+            points (int): Maximum bins returned; neighbouring bins are
+                averaged (keeps the PSD area). None returns every bin.
+            fmax (float): Highest frequency returned.
+            history (int): Number of recent peak frequencies included.
+
+        Returns:
+            str | None: JSON text, or None until the first segment.
+        """
+        result = self.result()
+        if result is None:
+            return None
+        key = (result["version"], points, fmax, history)
+        with self.lock:
+            cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        freq, psd = result["freq"], result["psd"]
+        if fmax is not None:
+            keep = int(np.searchsorted(freq, fmax, side="right"))
+            freq, psd = freq[:keep], psd[:keep]
+        if points is not None and len(freq) > points:
+            factor = -(-len(freq) // points)
+            starts = np.arange(0, len(freq), factor)
+            counts = np.diff(np.r_[starts, len(freq)])
+            freq = np.add.reduceat(freq, starts) / counts
+            psd = np.add.reduceat(psd, starts, axis=0) / counts[:, None]
+
+        response = {key: value for key, value in result.items() if key not in ("freq", "psd", "version")}
+        response["freq"] = np.round(freq, 4).tolist()
+        for i, axis in enumerate(AXES):
+            response[axis] = [float(f"{value:.6g}") for value in psd[:, i]]
+        if history:
+            with self.lock:
+                recent = list(self.peak_history)[-history:]
+            response["peak_history"] = [[round(value, 4) for value in row] for row in recent]
+        text = json.dumps(response)
+        with self.lock:
+            if self._version == result["version"]:
+                self._cache[key] = text
+        return text
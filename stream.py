@@ -0,0 +1,131 @@
+"""Live push of acquisition batches to dashboard clients (Server-Sent Events).
+
+The acquisition thread calls ``LiveStream.publish`` with every FIFO batch; it
+only appends a reference to each client's bounded queue. Each client's HTTP
+generator wakes up at its own rate, merges what is pending, decimates it to
+its point budget and sends one block. A slow client only loses its oldest
+pending batches (counted in ``dropped``) and never slows down acquisition.
+"""
+import json
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+def bucket_means(values, max_points):
+    """Averages ``values`` (N, ...) into at most ``max_points`` buckets."""
+    n = len(values)
+    if n <= max_points:
+        return values
+    edges = np.linspace(0, n, max_points + 1).astype(np.intp)
+    sums = np.add.reduceat(values, edges[:-1], axis=0)
+    counts = np.diff(edges).reshape((-1,) + (1,) * (values.ndim - 1))
+    return sums / counts
+
+
+class StreamClient:
+    """
+    Per-client queue of pending batches with a bounded length.
+    """
+
+    def __init__(self, rate_hz, max_points, max_pending):
+        self.period = 1.0 / rate_hz
+        self.max_points = max_points
+        self.pending = deque(maxlen=max_pending)
+        self.dropped = 0
+        self.ready = threading.Event()
+        self.next_due = time.monotonic()
+
+    def push(self, batch):
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+        self.pending.append(batch)
+        self.ready.set()
+
+    def next_block(self, timeout=15.0):
+        """Waits for the next send slot and returns the merged, decimated block.
+
+        Returns:
+            dict: Block with ``timestamp`` and ``xyz`` arrays and the newest
+            ``temp``, or None if nothing arrived within ``timeout``.
+        """
+        delay = self.next_due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if not self.ready.wait(timeout):
+            return None
+        self.ready.clear()
+        batches = []
+        while self.pending:
+            batches.append(self.pending.popleft())
+        self.next_due = max(self.next_due + self.period, time.monotonic())
+        if not batches:
+            return None
+
+        timestamp = np.concatenate([b["timestamp"] for b in batches])
+        xyz = np.concatenate([b["xyz"] for b in batches])
+        return {
+            "timestamp": bucket_means(timestamp, self.max_points),
+            "xyz": bucket_means(xyz.astype(np.float64), self.max_points),
+            "temp": float(np.asarray(batches[-1]["temp"]).ravel()[-1]),
+            "samples": len(timestamp),
+            "dropped": self.dropped,
+        }
+
+
+class LiveStream:
+    """
+    Fan-out of acquisition batches to the connected stream clients.
+    """
+
+    def __init__(self, max_pending=256):
+        self.max_pending = max_pending
+        self.clients = set()
+        self.lock = threading.Lock()
+
+    def publish(self, batch):
+        """Hands a batch to every client. Cheap enough for the acquisition path."""
+        with self.lock:
+            clients = tuple(self.clients)
+        for client in clients:
+            client.push(batch)
+
+    def subscribe(self, rate_hz=10.0, max_points=100):
+        client = StreamClient(rate_hz, max_points, self.max_pending)
+        with self.lock:
+            self.clients.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self.lock:
+            self.clients.discard(client)
+
+    def events(self, rate_hz=10.0, max_points=100):
+        """Generator of SSE messages for one client, until it disconnects.
+
+        Args:
+            rate_hz (float): Blocks per second sent to the client.
+            max_points (int): Maximum points per block after decimation.
+        """
+        client = self.subscribe(rate_hz, max_points)
+        try:
+            while True:
+                block = client.next_block()
+                if block is None:
+                    yield ": ping\n\n"  # Mantiene viva la conexión
+                    continue
+                xyz = block["xyz"]
+                message = {
+                    "timestamp": block["timestamp"].tolist(),
+                    "x": np.round(xyz[:, 0], 6).tolist(),
+                    "y": np.round(xyz[:, 1], 6).tolist(),
+                    "z": np.round(xyz[:, 2], 6).tolist(),
+                    "temp": block["temp"],
+                    "samples": block["samples"],
+                    "dropped": block["dropped"],
+                }
+                yield f"data: {json.dumps(message)}\n\n"
+        finally:
+            self.unsubscribe(client)
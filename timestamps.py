@@ -0,0 +1,125 @@
+"""Per-sample timestamp reconstruction for FIFO batches.
+
+The ADXL355 does not timestamp samples: all we know is the configured ODR
+and when the FIFO watermark interrupt fired. ``TimestampEngine`` spaces the
+samples of every batch one ODR period apart and keeps that sample clock
+locked to the monotonic clock with an alpha-beta filter, so crystal drift and
+interrupt latency jitter do not accumulate.
+"""
+import time
+
+import numpy as np
+
+ODR_BASE_HZ = 4000.0
+
+
+def odr_from_filter(filter_value):
+    """Returns the output data rate in Hz for a FILTER register value.
+
+    Args:
+        filter_value (int): Value written to FILTER (ODR_LPF in bits 0-3).
+
+    Returns:
+        float: ODR in Hz (4000 Hz for 0, halved for every step up to 10).
+    """
+    odr_lpf = filter_value & 0x0F
+    if odr_lpf > 10:
+        raise ValueError(f"Invalid ODR_LPF value: {odr_lpf}")
+    return ODR_BASE_HZ / (1 << odr_lpf)
+
+
+class TimestampEngine:
+    """
+    Assigns a timestamp to every sample of a FIFO batch.
+
+    Each call to ``stamp`` gets a reference: the monotonic time at which one
+    sample of the batch (``ref_index``) is known to have been acquired, e.g.
+    the GPIO edge of the FIFO watermark interrupt or the drain time for the
+    newest sample. The engine predicts that time from its own sample clock,
+    corrects phase and period by a fraction of the error and resynchronizes
+    outright when the error is too large (FIFO overflow, dropped batches).
+    """
+
+    def __init__(self, odr_hz, alpha=0.05, beta=0.005, max_drift=0.02, resync_periods=64):
+        self.alpha = alpha
+        self.beta = beta
+        self.max_drift = max_drift
+        self.resync_periods = resync_periods
+        self.set_odr(odr_hz)
+
+    def set_odr(self, odr_hz):
+        """Changes the nominal ODR and forces a resync on the next batch."""
+        self.nominal_period = 1.0 / odr_hz
+        self.reset()
+        self.resyncs = 0
+
+    def reset(self):
+        """Forgets the sample clock; the next batch resyncs."""
+        self.period = self.nominal_period
+        self.next_time = None  # Tiempo monótono estimado de la próxima muestra
+        self.last_time = -np.inf
+
+    def stamp(self, n, ref_time=None, ref_index=None):
+        """Returns the timestamps (unix epoch) of a batch of ``n`` samples.
+
+        Args:
+            n (int): Number of samples in the batch.
+            ref_time (float): Monotonic time (s) at which sample ``ref_index``
+                was acquired. Defaults to ``time.monotonic()`` now.
+            ref_index (int): Index in the batch of the reference sample.
+                Defaults to the newest sample.
+
+        Returns:
+            numpy.ndarray: float64 array of ``n`` increasing timestamps.
+        """
+        if n == 0:
+            return np.empty(0, dtype=np.float64)
+        if ref_time is None:
+            ref_time = time.monotonic()
+        if ref_index is None:
+            ref_index = n - 1
+        ref_index = min(max(ref_index, 0), n - 1)
+
+        if self.next_time is None:
+            self._resync(ref_time, ref_index)
+        else:
+            error = ref_time - (self.next_time + ref_index * self.period)
+            if abs(error) > self.resync_periods * self.nominal_period:
+                self._resync(ref_time, ref_index)
+            else:
+                self.next_time += self.alpha * error
+                self.period += self.beta * error / max(n, 1)
+                low = self.nominal_period * (1 - self.max_drift)
+                high = self.nominal_period * (1 + self.max_drift)
+                self.period = min(max(self.period, low), high)
+        # Nunca solapar con el lote anterior
+        self.next_time = max(self.next_time, self.last_time + 0.5 * self.period)
+
+        times = self.next_time + np.arange(n) * self.period
+        self.last_time = times[-1]
+        self.next_time = self.last_time + self.period
+        # Pasaje a epoch: el offset se toma por lote para seguir los ajustes de NTP
+        return times + (time.time() - time.monotonic())
+
+    def extend(self, n):
+        """Timestamps for ``n`` samples that directly follow the previous batch.
+
+        Used when the FIFO is drained again without a new interrupt: there
+        is no fresh reference, so the sample clock just runs on.
+
+        Args:
+            n (int): Number of samples in the batch.
+
+        Returns:
+            numpy.ndarray: float64 array of ``n`` increasing timestamps.
+        """
+        if self.next_time is None:
+            return self.stamp(n)
+        times = self.next_time + np.arange(n) * self.period
+        self.last_time = times[-1]
+        self.next_time = self.last_time + self.period
+        return times + (time.time() - time.monotonic())
+
+    def _resync(self, ref_time, ref_index):
+        self.next_time = ref_time - ref_index * self.period
+        self.resyncs += 1
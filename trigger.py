@@ -0,0 +1,190 @@
+"""Threshold trigger with pre/post-trigger capture (auto-record).
+
+``TriggerEngine`` is a batch consumer: every batch is checked against the
+thresholds in a few vectorized numpy operations, so it keeps up with 4 kHz
+on every sample. When a sample trips, the engine starts a recording with
+the last ``pre_record_time`` seconds taken from the history buffer, keeps
+feeding live batches until ``time_window`` seconds after the trigger and
+then waits ``cooldown`` seconds before arming again.
+
+Threshold modes (``umbral_mode``):
+
+- ``Absoluto``: trips when an axis leaves ``[min_*, max_*]``.
+- ``Relativo``: trips when an axis deviates more than ``delta_*`` from
+  ``center_*`` or, with ``auto_center``, from a slowly tracked baseline.
+"""
+import math
+
+import numpy as np
+
+AXES = ("x", "y", "z")
+MODE_ABSOLUTE = "Absoluto"
+MODE_RELATIVE = "Relativo"
+
+
+def _float(settings, key, default):
+    # config.json guarda algunos números como texto ("2", "0.1")
+    try:
+        return float(settings.get(key, default))
+    except (TypeError, ValueError):
+        return float(default)
+
+
+class TriggerEngine:
+    """
+    Evaluates thresholds on each batch and records the events.
+
+    Args:
+        buffer (RingBuffer): History used for the pre-trigger data.
+        recorder (StreamRecorder): Recorder dedicated to events.
+        settings (dict): Trigger settings (``config.json`` keys).
+        offsets (callable): Returns the current offsets dict (x, y, z),
+            stored in the header of binary event files.
+        meta (callable): Returns extra header fields for binary files,
+            called with the capture start time.
+        baseline_tau (float): Time constant (s) of the auto-center baseline.
+    """
+
+    def __init__(self, buffer, recorder, settings=None, offsets=None, meta=None, baseline_tau=10.0):
+        self.buffer = buffer
+        self.recorder = recorder
+        self.offsets = offsets or (lambda: {'x': 0.0, 'y': 0.0, 'z': 0.0})
+        self.meta = meta or (lambda t_start: {})
+        self.baseline_tau = baseline_tau
+        self.baseline = None
+        self.capture_end = None
+        self.cooldown_until = -math.inf
+        self.events = []
+        self.triggers = 0
+        self.configure(settings or {})
+
+    def configure(self, settings):
+        """Applies trigger settings (missing keys keep their defaults)."""
+        self.enabled = bool(settings.get('auto_record', False))
+        self.mode = str(settings.get('umbral_mode', MODE_ABSOLUTE)).capitalize()
+        self.auto_center = bool(settings.get('auto_center', False))
+        self.pre_record_time = max(_float(settings, 'pre_record_time', 2.0), 0.0)
+        self.time_window = max(_float(settings, 'time_window', 10.0), 0.0)
+        self.cooldown = max(_float(settings, 'cooldown', 1.0), 0.0)
+        self.base_name = f"{settings.get('filename', 'datos_acelerometro')}_evento"
+        self.file_format = settings.get('formato_grabacion', 'csv')
+        self.low = np.array([_float(settings, f'min_{a}', -np.inf) for a in AXES], dtype=np.float32)
+        self.high = np.array([_float(settings, f'max_{a}', np.inf) for a in AXES], dtype=np.float32)
+        self.center = np.array([_float(settings, f'center_{a}', 0.0) for a in AXES], dtype=np.float64)
+        self.delta = np.array([_float(settings, f'delta_{a}', np.inf) for a in AXES], dtype=np.float32)
+        if not self.auto_center:
+            self.baseline = None
+
+    @property
+    def capturing(self):
+        return self.capture_end is not None
+
+    def tripped(self, xyz):
+        """Per-axis mask of the samples outside the thresholds.
+
+        Args:
+            xyz (numpy.ndarray): (N, 3) calibrated acceleration in g.
+
+        Returns:
+            numpy.ndarray: (N, 3) bool array.
+        """
+        if self.mode == MODE_RELATIVE:
+            center = self.baseline if self.auto_center and self.baseline is not None else self.center
+            return np.abs(xyz - center.astype(np.float32)) > self.delta
+        return (xyz < self.low) | (xyz > self.high)
+
+    def check(self, xyz):
+        """Index of the first sample that trips the thresholds, or None.
+
+        Args:
+            xyz (numpy.ndarray): (N, 3) calibrated acceleration in g.
+        """
+        tripped = self.tripped(xyz).any(axis=1)
+        index = int(tripped.argmax())
+        return index if tripped[index] else None
+
+    def ingest(self, batch):
+        """Consumer entry point: checks the batch and feeds an ongoing capture."""
+        if self.capturing:
+            self._feed_capture(batch)
+            return
+        if not self.enabled:
+            return
+        timestamp = batch["timestamp"]
+        if not len(timestamp):
+            return
+        xyz = batch["xyz"]  # Ya calibrado (ver calibration.py)
+        index = None
+        if timestamp[-1] >= self.cooldown_until:
+            index = self.check(xyz)
+            if index is not None and timestamp[index] < self.cooldown_until:
+                index = None
+        if self.auto_center:
+            self.update_baseline(xyz, timestamp)
+        if index is not None:
+            self._start_capture(batch, float(timestamp[index]), xyz[index])
+
+    def status(self):
+        return {
+            'enabled': self.enabled,
+            'mode': self.mode,
+            'capturing': self.capturing,
+            'capture_end': self.capture_end,
+            'cooldown_until': self.cooldown_until if self.cooldown_until > 0 else None,
+            'baseline': None if self.baseline is None else self.baseline.tolist(),
+            'triggers': self.triggers,
+            'events': self.events[-20:],
+        }
+
+    def update_baseline(self, xyz, timestamp):
+        """Moves the auto-center baseline towards the mean of a batch."""
+        mean = xyz.mean(axis=0, dtype=np.float64)
+        if self.baseline is None:
+            self.baseline = mean
+            return
+        span = max(float(timestamp[-1] - timestamp[0]), 0.0) + 1e-3
+        k = 1.0 - math.exp(-span / self.baseline_tau)
+        self.baseline += k * (mean - self.baseline)
+
+    def _start_capture(self, batch, t_trigger, values):
+        self.triggers += 1
+        t_start = t_trigger - self.pre_record_time
+        self.capture_end = t_trigger + self.time_window
+        path = self.recorder.start(self.base_name, t_start, self.offsets(), self.file_format, self.meta(t_start))
+        self.events.append({
+            'time': t_trigger,
+            'file': path,
+            'values': [round(float(v), 6) for v in values],
+        })
+        print(f"Disparo por umbral ({self.mode}): grabando evento en {path}")
+
+        # Lo anterior al disparo sale del histórico (el lote actual ya está en el buffer)
+        seq_start, seq_end = self.buffer.index_between(t_start, float(batch["timestamp"][-1]))
+        for chunk in self.buffer.iter_range(seq_start, seq_end):
+            # Copias: el escritor los procesa después y el buffer circular sigue avanzando
+            self._feed_capture({
+                "timestamp": chunk["timestamp"].copy(),
+                "xyz": np.column_stack((chunk["x"], chunk["y"], chunk["z"])),
+                "raw": chunk["raw"].copy(),
+                "temp": chunk["temp"].copy(),
+            })
+            if not self.capturing:
+                break
+
+    def _feed_capture(self, batch):
+        timestamp = batch["timestamp"]
+        if timestamp[-1] > self.capture_end:
+            keep = timestamp <= self.capture_end
+            batch = {
+                "timestamp": timestamp[keep],
+                "xyz": batch["xyz"][keep],
+                "raw": batch["raw"][keep] if batch.get("raw") is not None else None,
+                "temp": np.broadcast_to(batch["temp"], keep.shape)[keep],
+            }
+            if len(batch["timestamp"]):
+                self.recorder.feed(batch)
+            self.recorder.stop()
+            self.cooldown_until = self.capture_end + self.cooldown
+            self.capture_end = None
+            return
+        self.recorder.feed(batch)
@@ -0,0 +1,100 @@
+"""Adaptive FIFO watermark.
+
+A low watermark wakes the CPU often; a high one leaves little room for the
+samples that keep arriving while the interrupt is serviced. The controller
+tracks a decaying peak of the edge-to-drain latency and picks the highest
+watermark that still leaves ``safety`` times that latency of free FIFO
+entries, capped so that no sample waits more than ``max_delay`` in the FIFO
+(which matters at low ODRs, where a full FIFO would take seconds).
+"""
+import math
+import time
+
+FIFO_MAX_ENTRIES = 96  # 32 muestras x, y, z
+
+
+class AdaptiveWatermark:
+    """
+    Chooses the ``FIFO_SAMPLES`` watermark (in FIFO entries) from measured latency.
+
+    Args:
+        initial (int): Starting watermark in entries.
+        min_entries (int): Lowest watermark allowed (except to honour
+            ``max_delay``). Each wakeup has a cost, so going lower tends to
+            raise the latency it is meant to absorb.
+        max_entries (int): Highest watermark allowed.
+        max_delay (float): Maximum time (s) the oldest sample may wait in the FIFO.
+        safety (float): Free room kept, as a multiple of the latency peak.
+        decay (float): Per-drain decay of the latency peak (forgets old spikes).
+        min_interval (float): Minimum seconds between watermark increases.
+        warmup (int): Drains ignored at start (the first edge may be stale).
+    """
+
+    def __init__(self, initial=32, min_entries=24, max_entries=FIFO_MAX_ENTRIES, max_delay=0.25,
+                 safety=1.5, decay=0.999, min_interval=2.0, warmup=8):
+        self.watermark = int(initial)
+        self.min_entries = min_entries
+        self.max_entries = max_entries
+        self.max_delay = max_delay
+        self.safety = safety
+        self.decay = decay
+        self.min_interval = min_interval
+        self.warmup = warmup
+        self.drains = 0
+        self.latency_peak = 0.0
+        self.changes = 0
+        self._last_change = -math.inf
+
+    def target(self, odr_hz):
+        """Watermark (entries, multiple of 3) for the current latency peak and ODR."""
+        headroom = 3 * (math.ceil(self.safety * self.latency_peak * odr_hz) + 1)
+        by_delay = 3 * math.floor(self.max_delay * odr_hz)
+        entries = max(FIFO_MAX_ENTRIES - headroom, self.min_entries)
+        # A ODR bajo manda el retardo máximo, aunque quede por debajo del mínimo
+        entries = min(entries, by_delay, self.max_entries)
+        entries -= entries % 3
+        return max(entries, 3)
+
+    def update(self, latency, odr_hz, overrun=False, now=None):
+        """Feeds one drain and returns the new watermark if it should change.
+
+        Lowering takes effect at once (overflow risk); raising waits
+        ``min_interval`` since the last change, so a single quiet period does
+        not undo the protection right after a latency spike.
+
+        Args:
+            latency (float): Seconds from the watermark edge to the FIFO read.
+            odr_hz (float): Current output data rate.
+            overrun (bool): The drain found FIFO_OVR set.
+            now (float): Monotonic time, defaults to ``time.monotonic()``.
+
+        Returns:
+            int | None: New watermark in entries, or None to keep it.
+        """
+        if now is None:
+            now = time.monotonic()
+        self.drains += 1
+        if self.drains <= self.warmup:
+            return None
+        self.latency_peak = max(latency, self.latency_peak * self.decay)
+        if overrun:
+            # Se perdieron muestras: la latencia real fue mayor que la estimada
+            self.latency_peak = max(1.5 * self.latency_peak, 3.0 / odr_hz)
+        target = self.target(odr_hz)
+        if target == self.watermark:
+            return None
+        if target > self.watermark and now - self._last_change < self.min_interval:
+            return None
+        self.watermark = target
+        self.changes += 1
+        self._last_change = now
+        return target
+
+    def status(self):
+        return {
+            "watermark": self.watermark,
+            "latency_peak": self.latency_peak,
+            "changes": self.changes,
+            "drains": self.drains,
+            "max_delay": self.max_delay,
+        }